@@ -46,6 +46,7 @@ urlpatterns = [
     #Payment Endpoints
     path('stripe-checkout/<order_oid>/', store_views.StripeCheckoutView.as_view()),
     path('payment-success/<order_oid>/', store_views.PaymentSuccessView.as_view()),
+    path('stripe/webhook/', store_views.stripe_webhook, name='stripe_webhook'),
     
     # WhatsApp Checkout Endpoint
     path('whatsapp-checkout/', store_views.whatsapp_checkout, name='whatsapp_checkout'),
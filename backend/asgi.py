@@ -3,6 +3,18 @@ ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+This is the production entry point, served by gunicorn with uvicorn workers
+(see railway.json):
+
+    gunicorn backend.asgi:application -k uvicorn.workers.UvicornWorker
+
+Async views (health checks, the live orders feed) then run on the event
+loop, and sync views run in a thread pool instead of pinning a worker
+process while they wait on Stripe or SMTP.
+
+With SCHEDULER_AUTOSTART each worker also runs the periodic store jobs
+(store/scheduler.py) on a background thread.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -14,3 +26,11 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.SCHEDULER_AUTOSTART:
+    # One scheduler per worker process; the database lease runs each job once
+    from store.scheduler import start_in_background
+
+    start_in_background()
@@ -229,6 +229,10 @@ except ImportError:
         }
     }
 
+# The test database is created from the models: userauths' early migrations
+# add User.otp twice and can't be replayed on an empty database
+DATABASES['default'].setdefault('TEST', {})['MIGRATE'] = False
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -268,9 +272,46 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Media serving (store/media_serving.py): '' streams from Python,
+# 'x-accel-redirect' (nginx) or 'x-sendfile' hands the file to the proxy
+MEDIA_SENDFILE_MODE = config('MEDIA_SENDFILE_MODE', default='')
+MEDIA_ACCEL_REDIRECT_PREFIX = config('MEDIA_ACCEL_REDIRECT_PREFIX', default='/protected-media/')
+MEDIA_CACHE_SECONDS = int(config('MEDIA_CACHE_SECONDS', default='3600'))
+# Responsive image variants (store/images.py), plus a JPEG/PNG fallback
+IMAGE_VARIANT_WIDTHS = [int(w) for w in config('IMAGE_VARIANT_WIDTHS', default='160,480,960,1600').split(',')]
+IMAGE_VARIANT_FORMATS = [f.strip() for f in config('IMAGE_VARIANT_FORMATS', default='webp').split(',') if f.strip()]
+# Worker processes for Pillow work (store/image_jobs.py), 0 runs it inline
+IMAGE_JOB_WORKERS = int(config('IMAGE_JOB_WORKERS', default='2'))
+IMAGE_JOB_MAX_PENDING = int(config('IMAGE_JOB_MAX_PENDING', default='0'))
+
+# Sales windows of the trending / best-selling carousels (store/rankings.py)
+CAROUSEL_TRENDING_DAYS = int(config('CAROUSEL_TRENDING_DAYS', default='30'))
+CAROUSEL_BEST_SELLING_DAYS = int(config('CAROUSEL_BEST_SELLING_DAYS', default='365'))
+
+# Periodic jobs (store/scheduler.py): `manage.py run_scheduler`, or a scheduler
+# thread in every web process when SCHEDULER_AUTOSTART is on (a database
+# lease still runs each job once). SCHEDULER_INTERVALS: name=seconds,... (0 disables)
+SCHEDULER_AUTOSTART = config('SCHEDULER_AUTOSTART', default='False').lower() == 'true'
+SCHEDULER_INTERVALS = {
+    name.strip(): int(seconds)
+    for name, seconds in (
+        item.split('=') for item in config('SCHEDULER_INTERVALS', default='').split(',') if item.strip()
+    )
+}
+SCHEDULER_TICK_SECONDS = float(config('SCHEDULER_TICK_SECONDS', default='1'))
+SCHEDULER_JITTER = float(config('SCHEDULER_JITTER', default='0.1'))
 
 # File Storage Configuration
-DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage'
+# Uploads are stored once per content under blobs/<sha256> (store/storage.py);
+# files from before are moved with `manage.py migrate_media_storage`
+STORAGES = {
+    'default': {
+        'BACKEND': config('MEDIA_STORAGE_BACKEND', default='store.storage.ContentAddressedStorage'),
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
 
 AUTH_USER_MODEL = 'userauths.User'
 
@@ -280,6 +321,15 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 STRIPE_PUBLIC_KEY = config("STRIPE_PUBLIC_KEY")
 STRIPE_SECRET_KEY = config("STRIPE_SECRET_KEY")
 STRIPE_WEBHOOK_SECRET = config("STRIPE_WEBHOOK_SECRET", "whsec_test_secret")
+# Ask Stripe from the payment-success callback when no webhook is configured
+STRIPE_VERIFY_ON_CALLBACK = config("STRIPE_VERIFY_ON_CALLBACK", default="False").lower() == "true"
+# Outbound Stripe calls (store/payment_gateway.py)
+STRIPE_CONNECT_TIMEOUT = float(config("STRIPE_CONNECT_TIMEOUT", default="3"))
+STRIPE_READ_TIMEOUT = float(config("STRIPE_READ_TIMEOUT", default="10"))
+STRIPE_MAX_NETWORK_RETRIES = int(config("STRIPE_MAX_NETWORK_RETRIES", default="2"))
+STRIPE_POOL_SIZE = int(config("STRIPE_POOL_SIZE", default="10"))
+STRIPE_CIRCUIT_FAILURE_THRESHOLD = int(config("STRIPE_CIRCUIT_FAILURE_THRESHOLD", default="5"))
+STRIPE_CIRCUIT_RESET_SECONDS = float(config("STRIPE_CIRCUIT_RESET_SECONDS", default="30"))
 
 # Email Configuration
 EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
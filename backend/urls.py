@@ -14,7 +14,7 @@ except ImportError:
     pass
 
 # Simple health check that doesn't depend on any external packages
-def simple_health_check(request):
+async def simple_health_check(request):
     """
     Simple health check endpoint for Railway monitoring
     Returns 200 OK if the application is running
@@ -3,7 +3,6 @@ Custom Security Middleware for Django
 Provides additional security features for production
 """
 
-import re
 import logging
 from django.http import HttpResponseForbidden, HttpResponse
 from django.conf import settings
@@ -14,8 +13,34 @@ from django.contrib.auth.models import AnonymousUser
 import hashlib
 import time
 
+from store.rate_limit import RateLimiter, client_ip
+from store.request_inspection import PatternSet
+
 logger = logging.getLogger(__name__)
 
+# Compiled once at import, matched case-insensitively
+SQL_INJECTION_PATTERNS = PatternSet(sql=[
+    r"(\b(union|select|insert|update|delete|drop|create|alter|exec|execute)\b)",
+    r"(\b(or|and)\b\s+\d+\s*[=<>])",
+    r"(--|#|/\*|\*/)",
+    r"(\bxp_|sp_|sysobjects|syscolumns)",
+    r"(\bwaitfor\b\s+\bdelay\b)",
+    r"(\bchar\b\s*\(\s*\d+\s*\))",
+])
+
+XSS_PATTERNS = PatternSet(xss=[
+    r"<script[^>]*>.*?</script>",
+    r"javascript:",
+    r"on\w+\s*=",
+    r"<iframe[^>]*>",
+    r"<object[^>]*>",
+    r"<embed[^>]*>",
+    r"<form[^>]*>",
+    r"<input[^>]*>",
+    r"<textarea[^>]*>",
+    r"<select[^>]*>",
+])
+
 class SecurityHeadersMiddleware(MiddlewareMixin):
     """
     Add security headers to all responses
@@ -45,52 +70,26 @@ class SecurityHeadersMiddleware(MiddlewareMixin):
 
 class RateLimitMiddleware(MiddlewareMixin):
     """
-    Rate limiting middleware
+    Rate limiting middleware (route groups and limits in store.rate_limit)
     """
     
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.rate_limiter = RateLimiter()
+    
     def process_request(self, request):
-        # Skip rate limiting for certain paths
-        if request.path.startswith('/admin/') or request.path.startswith('/static/'):
+        result = self.rate_limiter.check(request)
+        if result is None or result.allowed:
             return None
-            
-        # Get client IP
-        client_ip = self.get_client_ip(request)
-        
-        # Create rate limit key
-        rate_limit_key = f"rate_limit:{client_ip}:{request.path}"
         
-        # Check rate limit
-        request_count = cache.get(rate_limit_key, 0)
-        
-        # Define rate limits
-        rate_limits = {
-            '/api/v1/login/': 5,  # 5 requests per minute
-            '/api/v1/register/': 3,  # 3 requests per hour
-            '/api/v1/password-reset/': 3,  # 3 requests per hour
-            '/api/v1/payment-success/': 10,  # 10 requests per minute
-            'default': 100,  # 100 requests per hour
-        }
-        
-        # Get rate limit for this path
-        limit = rate_limits.get(request.path, rate_limits['default'])
-        
-        if request_count >= limit:
-            logger.warning(f"Rate limit exceeded for IP {client_ip} on path {request.path}")
-            return HttpResponseForbidden("Rate limit exceeded. Please try again later.")
-        
-        # Increment counter
-        cache.set(rate_limit_key, request_count + 1, 3600)  # 1 hour expiry
-        
-        return None
+        logger.warning(f"Rate limit exceeded for IP {client_ip(request)} on {result.rule.name} ({request.path})")
+        response = HttpResponse("Rate limit exceeded. Please try again later.", status=429)
+        response['Retry-After'] = str(result.retry_after)
+        return response
     
     def get_client_ip(self, request):
         """Get client IP address"""
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
+        return client_ip(request)
 
 class SQLInjectionProtectionMiddleware(MiddlewareMixin):
     """
@@ -118,22 +117,7 @@ class SQLInjectionProtectionMiddleware(MiddlewareMixin):
         if not isinstance(value, str):
             return False
             
-        # SQL injection patterns
-        patterns = [
-            r"(\b(union|select|insert|update|delete|drop|create|alter|exec|execute)\b)",
-            r"(\b(or|and)\b\s+\d+\s*[=<>])",
-            r"(--|#|/\*|\*/)",
-            r"(\bxp_|sp_|sysobjects|syscolumns)",
-            r"(\bwaitfor\b\s+\bdelay\b)",
-            r"(\bchar\b\s*\(\s*\d+\s*\))",
-        ]
-        
-        value_lower = value.lower()
-        for pattern in patterns:
-            if re.search(pattern, value_lower, re.IGNORECASE):
-                return True
-        
-        return False
+        return SQL_INJECTION_PATTERNS.match(value) is not None
 
 class XSSProtectionMiddleware(MiddlewareMixin):
     """
@@ -155,26 +139,7 @@ class XSSProtectionMiddleware(MiddlewareMixin):
         if not isinstance(value, str):
             return False
             
-        # XSS patterns
-        patterns = [
-            r"<script[^>]*>.*?</script>",
-            r"javascript:",
-            r"on\w+\s*=",
-            r"<iframe[^>]*>",
-            r"<object[^>]*>",
-            r"<embed[^>]*>",
-            r"<form[^>]*>",
-            r"<input[^>]*>",
-            r"<textarea[^>]*>",
-            r"<select[^>]*>",
-        ]
-        
-        value_lower = value.lower()
-        for pattern in patterns:
-            if re.search(pattern, value_lower, re.IGNORECASE):
-                return True
-        
-        return False
+        return XSS_PATTERNS.match(value) is not None
 
 class RequestLoggingMiddleware(MiddlewareMixin):
     """
@@ -2,15 +2,21 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from django.db.models import Sum, Count
+from django.db.models import Sum, Count, OuterRef, Subquery, IntegerField
+from django.db.models.functions import Coalesce
+from django.db import transaction
 from django.utils import timezone
+from django.utils.functional import cached_property
+from django.core.paginator import Paginator
 from datetime import timedelta
 from store.models import (
     Product, Wishlist, Tax, Category, Gallery, Specification, Size, Color, Cart,
-    CartOrder, CartOrderItem, Coupon, Notification, CarouselImage, OffersCarousel, Banner,
+    CartOrder, CartOrderItem, Coupon, Notification, EmailOutbox, StripeEvent, ScheduledJob, CarouselImage, OffersCarousel, Banner,
     ProductFaq, Review
 )
-from store.permissions import VendorPermissionMixin
+from store.permissions import VendorPermissionMixin, is_vendor
+from store.notifications import notify_order_paid, notify_orders_paid
+from store.stock import reduce_stock_for_orders
 
 # Import other app models with error handling
 try:
@@ -21,6 +27,25 @@ except ImportError:
     MODELS_AVAILABLE = False
     print("Warning: Some models not available during startup")
 
+# ============================================================================
+# PAGINATION
+# ============================================================================
+
+class CappedCountPaginator(Paginator):
+    """
+    Paginator for large tables: counts at most ``COUNT_CAP`` rows instead of
+    a full COUNT(*), so the changelist stays fast as orders pile up. Pages
+    past the cap are reached by narrowing the filters.
+    """
+    COUNT_CAP = 10000
+
+    @cached_property
+    def count(self):
+        try:
+            return self.object_list[:self.COUNT_CAP].count()
+        except (AttributeError, TypeError):
+            return len(self.object_list[:self.COUNT_CAP])
+
 # ============================================================================
 # INLINE CLASSES
 # ============================================================================
@@ -131,11 +156,37 @@ class ProductAdmin(VendorPermissionMixin, admin.ModelAdmin):
     stock_status.short_description = "Stock Status"
     
     def total_stock(self, obj):
-        color_stock = sum(c.stock_qty for c in obj.colors.all())
-        size_stock = sum(s.stock_qty for s in obj.sizes.all())
+        # Annotated by get_queryset, fall back to queries elsewhere
+        color_stock = getattr(obj, 'color_stock_total', None)
+        if color_stock is None:
+            color_stock = sum(c.stock_qty for c in obj.colors.all())
+        size_stock = getattr(obj, 'size_stock_total', None)
+        if size_stock is None:
+            size_stock = sum(s.stock_qty for s in obj.sizes.all())
         return f"Main: {obj.stock_qty} | Colors: {color_stock} | Sizes: {size_stock}"
     total_stock.short_description = "Stock Breakdown"
     
+    @staticmethod
+    def _variant_stock_sum(model):
+        """Correlated SUM(stock_qty) of a product's colors or sizes"""
+        totals = (
+            model.objects.filter(product=OuterRef('pk'))
+            .order_by()
+            .values('product')
+            .annotate(total=Sum('stock_qty'))
+            .values('total')
+        )
+        return Coalesce(Subquery(totals, output_field=IntegerField()), 0)
+    
+    def get_queryset(self, request):
+        """Vendor filtering plus everything the changelist renders, in one query"""
+        qs = super().get_queryset(request)
+        # Subqueries instead of a JOIN on both tables, which would multiply the sums
+        return qs.select_related('category', 'vendor__user').annotate(
+            color_stock_total=self._variant_stock_sum(Color),
+            size_stock_total=self._variant_stock_sum(Size),
+        )
+    
     def stock_summary(self, obj):
         if not obj.pk:
             return "Save product first to see stock summary"
@@ -240,75 +291,50 @@ class CartOrderAdmin(admin.ModelAdmin):
     readonly_fields = ['oid', 'date', 'order_items_display', 'stock_status_display', 'stock_levels_display']
     filter_horizontal = ['vendor']
     
+    # The orders table only grows: no full COUNT(*) per changelist page
+    paginator = CappedCountPaginator
+    show_full_result_count = False
+    
     actions = ['mark_as_whatsapp_order', 'show_whatsapp_orders', 'mark_whatsapp_orders_paid', 'mark_whatsapp_orders_completed', 'whatsapp_orders_summary', 'highlight_whatsapp_orders', 'test_stock_reduction', 'debug_whatsapp_order']
     
     def mark_as_whatsapp_order(self, request, queryset):
         """Mark selected orders as WhatsApp orders"""
-        updated = queryset.update(payment_method='whatsapp')
+        # update() bypasses auto_now, bump updated_at so the live feed sees the change
+        updated = queryset.update(payment_method='whatsapp', updated_at=timezone.now())
         self.message_user(request, f'{updated} orders marked as WhatsApp orders.')
     mark_as_whatsapp_order.short_description = "📱 Mark as WhatsApp Order"
     
     def mark_whatsapp_orders_paid(self, request, queryset):
-        """Mark selected WhatsApp orders as paid and reduce stock"""
-        print("=" * 60)
-        print("DEBUG: mark_whatsapp_orders_paid action called")
-        print(f"DEBUG: Total orders selected: {queryset.count()}")
-        
-        # Filter only WhatsApp orders
-        whatsapp_orders = queryset.filter(payment_method='whatsapp')
-        print(f"DEBUG: WhatsApp orders found: {whatsapp_orders.count()}")
+        """Mark selected WhatsApp orders as paid and reduce stock in bulk"""
+        # Plain pks: the changelist queryset is annotated and joined, which
+        # can't be combined with SELECT ... FOR UPDATE
+        order_ids = list(queryset.filter(payment_method='whatsapp').values_list('pk', flat=True))
         
-        updated = 0
-        stock_reduced = 0
-        
-        for order in whatsapp_orders:
-            try:
-                print(f"DEBUG: Processing order {order.oid}")
-                print(f"DEBUG: Current payment_status: {order.payment_status}")
-                print(f"DEBUG: Current payment_method: {order.payment_method}")
-                
-                # Only process if not already paid
-                if order.payment_status != 'paid':
-                    print(f"DEBUG: Updating order {order.oid} to paid status")
-                    
-                    # Update payment status
-                    order.payment_status = 'paid'
-                    order.save()
-                    
-                    print(f"DEBUG: Order {order.oid} saved with paid status")
-                    print(f"DEBUG: Order items count: {order.orderitem.count()}")
-                    
-                    # Reduce stock for this WhatsApp order
-                    try:
-                        print(f"DEBUG: Calling reduce_stock_for_whatsapp_order for order {order.oid}")
-                        print(f"DEBUG: About to call stock reduction method...")
-                        
-                        result = order.reduce_stock_for_whatsapp_order()
-                        print(f"DEBUG: Stock reduction method returned: {result}")
-                        
-                        stock_reduced += 1
-                        print(f"DEBUG: Stock reduced successfully for order {order.oid}")
-                        self.message_user(request, f'✅ Stock reduced successfully for order {order.oid}', level='SUCCESS')
-                    except Exception as stock_error:
-                        print(f"DEBUG: Stock reduction failed for order {order.oid}: {stock_error}")
-                        print(f"DEBUG: Error type: {type(stock_error)}")
-                        print(f"DEBUG: Error details: {str(stock_error)}")
-                        self.message_user(request, f'⚠️ Stock reduction failed for order {order.oid}: {str(stock_error)}', level='WARNING')
-                    
-                    updated += 1
-                else:
-                    print(f"DEBUG: Order {order.oid} is already paid, skipping")
-                    self.message_user(request, f'ℹ️ Order {order.oid} is already marked as paid.', level='WARNING')
-                    
-            except Exception as e:
-                print(f"DEBUG: Error processing order {order.oid}: {e}")
-                self.message_user(request, f'❌ Error processing order {order.oid}: {str(e)}', level='ERROR')
+        with transaction.atomic():
+            newly_paid = list(
+                CartOrder.objects.select_for_update().filter(pk__in=order_ids).exclude(payment_status='paid')
+            )
+            now = timezone.now()
+            # update() bypasses auto_now, bump updated_at so the live feed sees the change
+            CartOrder.objects.filter(pk__in=[order.pk for order in newly_paid]).update(
+                payment_status='paid', updated_at=now
+            )
+            for order in newly_paid:
+                order.payment_status = 'paid'
+            
+            # Skips orders already reduced and retries paid ones that failed before
+            reduced, failed = reduce_stock_for_orders(order_ids)
+            
+            # Buyer and vendor notifications for every paid order in one insert
+            notify_orders_paid(newly_paid)
         
-        print(f"DEBUG: Final results - updated: {updated}, stock_reduced: {stock_reduced}")
-        print("=" * 60)
+        for oid, reason in list(failed.items())[:20]:
+            self.message_user(request, f'⚠️ Stock not reduced for order {oid}: {reason}', level='WARNING')
+        if len(failed) > 20:
+            self.message_user(request, f'⚠️ ...and {len(failed) - 20} more orders without stock reduction.', level='WARNING')
         
-        if updated > 0:
-            self.message_user(request, f'✅ {updated} WhatsApp orders marked as paid. 📦 Stock reduced for {stock_reduced} orders.')
+        if newly_paid or reduced:
+            self.message_user(request, f'✅ {len(newly_paid)} WhatsApp orders marked as paid. 📦 Stock reduced for {len(reduced)} orders.')
         else:
             self.message_user(request, 'ℹ️ No WhatsApp orders were processed.')
     mark_whatsapp_orders_paid.short_description = "💰 Mark WhatsApp Orders as Paid & Reduce Stock"
@@ -335,9 +361,9 @@ class CartOrderAdmin(admin.ModelAdmin):
                 order.order_status = 'completed'
                 order.save()
                 
-                # Reduce stock for this WhatsApp order
-                order.reduce_stock_for_whatsapp_order()
-                stock_reduced += 1
+                # Reduce stock for this WhatsApp order (False: already reduced)
+                if order.reduce_stock_for_whatsapp_order():
+                    stock_reduced += 1
                 updated += 1
                 
             except Exception as e:
@@ -390,8 +416,10 @@ class CartOrderAdmin(admin.ModelAdmin):
         
         try:
             # Test the stock reduction method
-            order.reduce_stock_for_whatsapp_order()
-            self.message_user(request, f'✅ Stock reduction test successful for order {order.oid}!', level='SUCCESS')
+            if order.reduce_stock_for_whatsapp_order():
+                self.message_user(request, f'✅ Stock reduction test successful for order {order.oid}!', level='SUCCESS')
+            else:
+                self.message_user(request, f'ℹ️ Stock was already reduced for order {order.oid}, nothing changed.', level='WARNING')
         except Exception as e:
             self.message_user(request, f'❌ Stock reduction test failed for order {order.oid}: {str(e)}', level='ERROR')
             print(f"DEBUG: Test failed with error: {e}")
@@ -498,27 +526,28 @@ class CartOrderAdmin(admin.ModelAdmin):
     total_amount.short_description = "Total"
     
     def items_count(self, obj):
-        count = obj.orderitem.count()
+        # Annotated by get_queryset, fall back to a query elsewhere
+        count = getattr(obj, 'items_total', None)
+        if count is None:
+            count = obj.orderitem.count()
         return f"{count} artículos"
     items_count.short_description = "Artículos"
+    items_count.admin_order_field = 'items_total'
     
     def stock_status_display(self, obj):
-        """Display stock status and provide manual stock reduction button for WhatsApp orders"""
+        """Display stock status from the stock_reduced_at marker (read only)"""
         if obj.payment_method == 'whatsapp':
-            if obj.payment_status == 'paid':
-                # Check if stock was actually reduced
-                try:
-                    # This will trigger the stock reduction method to check
-                    obj.reduce_stock_for_whatsapp_order()
-                    return format_html(
-                        '<span style="color: green; font-weight: bold;">✅ Stock Reduced</span>'
-                    )
-                except Exception as e:
-                    # Stock reduction failed or not needed
-                    return format_html(
-                        '<span style="color: orange; font-weight: bold;">⚠️ Stock Reduction Failed</span><br>'
-                        '<small style="color: red;">{}</small>'.format(str(e))
-                    )
+            if obj.stock_reduced_at:
+                return format_html(
+                    '<span style="color: green; font-weight: bold;">✅ Stock Reduced</span><br>'
+                    '<small>{}</small>',
+                    timezone.localtime(obj.stock_reduced_at).strftime('%d/%m/%Y %H:%M')
+                )
+            elif obj.payment_status == 'paid':
+                return format_html(
+                    '<span style="color: orange; font-weight: bold;">⚠️ Stock Not Reduced</span><br>'
+                    '<small>Use "Mark WhatsApp Orders as Paid & Reduce Stock" to reduce it</small>'
+                )
             else:
                 return format_html(
                     '<span style="color: orange; font-weight: bold;">⚠️ Stock Not Reduced</span><br>'
@@ -578,8 +607,10 @@ class CartOrderAdmin(admin.ModelAdmin):
         if obj.payment_method == 'whatsapp':
             if obj.payment_status == 'pending':
                 return f"📱 WHATSAPP ⚠️ (Stock not reduced)"
-            elif obj.payment_status == 'paid':
+            elif obj.payment_status == 'paid' and obj.stock_reduced_at:
                 return f"📱 WHATSAPP ✅ (Stock reduced)"
+            elif obj.payment_status == 'paid':
+                return f"📱 WHATSAPP ⚠️ (Paid, stock not reduced)"
             else:
                 return f"📱 WHATSAPP {obj.payment_status.upper()}"
         elif obj.payment_method:
@@ -600,6 +631,9 @@ class CartOrderAdmin(admin.ModelAdmin):
         if request.GET.get('whatsapp_only'):
             qs = qs.filter(payment_method='whatsapp')
         
+        # buyer_info and items_count without a query per row
+        qs = qs.select_related('buyer').annotate(items_total=Count('orderitem'))
+        
         return qs.order_by('-date')
     
     def changelist_view(self, request, extra_context=None):
@@ -647,6 +681,7 @@ class CartOrderAdmin(admin.ModelAdmin):
                     
                     # First save the order with the new status
                     super().save_model(request, obj, form, change)
+                    notify_order_paid(obj)
                     
                     # Now reduce the stock
                     try:
@@ -835,6 +870,56 @@ class NotificationAdmin(admin.ModelAdmin):
     search_fields = ['user__username']
     list_editable = ['seen']
 
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'to_email', 'order', 'status', 'attempts', 'created_at', 'sent_at']
+    list_filter = ['status', 'kind', 'created_at']
+    search_fields = ['to_email', 'order__oid']
+    list_select_related = ['order']
+    readonly_fields = ['dedup_key', 'last_error', 'created_at', 'sent_at']
+    actions = ['retry_emails']
+
+    def retry_emails(self, request, queryset):
+        """Queue failed emails again for the outbox worker"""
+        updated = queryset.filter(status='failed').update(
+            status='pending', attempts=0, available_at=timezone.now()
+        )
+        self.message_user(request, f'{updated} email(s) queued again.')
+    retry_emails.short_description = "Retry failed emails"
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    list_display = ['event_id', 'type', 'session_id', 'status', 'attempts', 'received_at', 'processed_at']
+    list_filter = ['status', 'type', 'received_at']
+    search_fields = ['event_id', 'session_id']
+    readonly_fields = ['event_id', 'type', 'session_id', 'payload', 'last_error', 'received_at', 'processed_at']
+    actions = ['retry_events']
+
+    def retry_events(self, request, queryset):
+        """Queue failed events again for the Stripe event worker"""
+        updated = queryset.filter(status='failed').update(
+            status='pending', attempts=0, available_at=timezone.now()
+        )
+        self.message_user(request, f'{updated} event(s) queued again.')
+    retry_events.short_description = "Retry failed events"
+
+
+@admin.register(ScheduledJob)
+class ScheduledJobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'next_run_at', 'last_status', 'last_finished_at', 'runs', 'locked_by']
+    list_filter = ['last_status']
+    readonly_fields = [
+        'name', 'locked_by', 'locked_until', 'last_started_at', 'last_finished_at',
+        'last_status', 'last_error', 'runs'
+    ]
+    actions = ['run_now']
+
+    def run_now(self, request, queryset):
+        """Make the jobs due for the next scheduler tick"""
+        updated = queryset.update(next_run_at=timezone.now())
+        self.message_user(request, f'{updated} job(s) will run on the next scheduler tick.')
+    run_now.short_description = "Run now"
+
 @admin.register(Wishlist)
 class WishlistAdmin(admin.ModelAdmin):
     list_display = ['user', 'product', 'date']
@@ -917,7 +1002,7 @@ class CustomAdminSite(AdminSite):
             return True
         
         # Vendors can access limited admin areas
-        if request.user.groups.filter(name='Vendors').exists():
+        if is_vendor(request.user):
             return True
         
         return False
@@ -931,7 +1016,7 @@ class CustomAdminSite(AdminSite):
             return app_list
         
         # If user is vendor, filter apps
-        if request.user.groups.filter(name='Vendors').exists():
+        if is_vendor(request.user):
             allowed_apps = ['store', 'vendor']
             return [app for app in app_list if app['app_label'] in allowed_apps]
         
@@ -1012,6 +1097,9 @@ custom_admin_site.register(CartOrder, CartOrderAdmin)
 custom_admin_site.register(CartOrderItem, CartOrderItemAdmin)
 custom_admin_site.register(Coupon, CouponAdmin)
 custom_admin_site.register(Notification, NotificationAdmin)
+custom_admin_site.register(EmailOutbox, EmailOutboxAdmin)
+custom_admin_site.register(StripeEvent, StripeEventAdmin)
+custom_admin_site.register(ScheduledJob, ScheduledJobAdmin)
 custom_admin_site.register(Wishlist, WishlistAdmin)
 custom_admin_site.register(Tax, TaxAdmin)
 custom_admin_site.register(Cart, CartAdmin)
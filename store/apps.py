@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class StoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'store'
+
+    def ready(self):
+        # Connects the group membership signal
+        import store.permissions  # noqa: F401
+        # Generates responsive variants when an image is saved
+        from store.images import connect_signals
+        connect_signals()
@@ -1,18 +1,21 @@
 import logging
-from django.db.models import Count, Sum, Q, Avg
+from django.db.models import Count, Sum, Q, Avg, Max
 from django.utils import timezone
 from datetime import timedelta
 from django.core.files.base import ContentFile
 from django.conf import settings
-import requests
-from PIL import Image, ImageDraw, ImageFont
-import io
+import hashlib
+import json
 import os
 
 from store.models import (
     Product, OffersCarousel, CarouselImage, Banner, 
-    CartOrderItem, Review, Category
+    CartOrder, CartOrderItem, Review, Category
 )
+from store import rankings
+from store.image_jobs import get_queue, job_key
+from store.images import banner_spec, render_banner
+from store.storage import copy_stored_file, same_content
 
 logger = logging.getLogger(__name__)
 
@@ -34,42 +37,12 @@ class CarouselAutomation:
         return timezone.now() - last_update > self.last_update_threshold
     
     def get_trending_products(self, limit=10):
-        """Get trending products based on recent orders and views"""
-        # Get products with most orders in last 30 days
-        thirty_days_ago = timezone.now() - timedelta(days=30)
-        
-        trending = Product.objects.filter(
-            status='published',
-            in_stock=True,
-            stock_qty__gt=0
-        ).annotate(
-            recent_orders=Count(
-                'cartorderitem',
-                filter=Q(cartorderitem__order__date__gte=thirty_days_ago)
-            ),
-            total_revenue=Sum(
-                'cartorderitem__total',
-                filter=Q(cartorderitem__order__date__gte=thirty_days_ago)
-            ),
-            avg_rating=Avg('review__rating')
-        ).filter(
-            recent_orders__gt=0
-        ).order_by('-recent_orders', '-total_revenue', '-views')[:limit]
-        
-        return trending
+        """Get trending products: most paid orders in the last 30 days"""
+        return rankings.trending_products(limit)
     
     def get_best_selling_products(self, limit=10):
-        """Get best selling products of all time"""
-        return Product.objects.filter(
-            status='published',
-            in_stock=True,
-            stock_qty__gt=0
-        ).annotate(
-            total_orders=Count('cartorderitem'),
-            total_revenue=Sum('cartorderitem__total')
-        ).filter(
-            total_orders__gt=0
-        ).order_by('-total_orders', '-total_revenue')[:limit]
+        """Get best selling products: most paid orders in the last year"""
+        return rankings.best_selling_products(limit)
     
     def get_new_arrivals(self, limit=10):
         """Get newest products"""
@@ -85,156 +58,181 @@ class CarouselAutomation:
             status='published',
             in_stock=True,
             stock_qty__gt=0,
-            old_price__gt=0
-        ).extra(
-            select={'discount_percent': '((old_price - price) / old_price) * 100'}
+            discount_percent__gt=0
         ).order_by('-discount_percent')[:limit]
     
+    def data_signature(self):
+        """
+        Cheap fingerprint of the catalog and sales data the offers carousels
+        are computed from. Views are left out on purpose: they change on
+        every product page and only break ties; the periodic recompute
+        (last_update_threshold) picks them up, along with the sliding
+        time windows.
+        """
+        listed = Q(status='published', in_stock=True, stock_qty__gt=0)
+        values = [
+            Product.objects.aggregate(
+                count=Count('id'),
+                last=Max('id'),
+                listed=Count('id', filter=listed),
+                listed_ids=Sum('id', filter=listed),
+                prices=Sum('price'),
+                old_prices=Sum('old_price'),
+            ),
+            CartOrderItem.objects.aggregate(count=Count('id'), last=Max('id')),
+            CartOrder.objects.filter(payment_status='paid').aggregate(paid=Count('id')),
+        ]
+        return hashlib.sha256(json.dumps(values, default=str, sort_keys=True).encode()).hexdigest()
+
     def update_offers_carousel(self, force=False):
-        """Update offers carousel with trending and discounted products"""
+        """
+        Update offers carousel with trending and discounted products. Skips
+        the ranking queries when the data hasn't changed since the last run
+        and only adds/removes the memberships that changed.
+        """
         try:
-            # Get or create different carousel types
+            # Get or create different carousel types; rankings run only if needed
             carousels_config = [
                 {
                     'title': 'Productos Más Vendidos',
-                    'products': self.get_best_selling_products(8),
+                    'products': lambda: self.get_best_selling_products(8),
                     'identifier': 'best_selling'
                 },
                 {
                     'title': 'Tendencias Actuales',
-                    'products': self.get_trending_products(8),
+                    'products': lambda: self.get_trending_products(8),
                     'identifier': 'trending'
                 },
                 {
                     'title': 'Nuevos Arrivals',
-                    'products': self.get_new_arrivals(8),
+                    'products': lambda: self.get_new_arrivals(8),
                     'identifier': 'new_arrivals'
                 },
                 {
                     'title': 'Ofertas Especiales',
-                    'products': self.get_discounted_products(8),
+                    'products': lambda: self.get_discounted_products(8),
                     'identifier': 'special_offers'
                 }
             ]
-            
+
+            signature = self.data_signature()
+            existing = {
+                carousel.title: carousel
+                for carousel in OffersCarousel.objects.filter(title__in=[c['title'] for c in carousels_config])
+            }
+            up_to_date = [
+                carousel for carousel in existing.values()
+                if carousel.data_signature == signature and not self.should_update(carousel.last_computed_at)
+            ]
+            if not force and len(up_to_date) == len(carousels_config):
+                logger.info("Offers carousels are up to date, nothing changed since the last run")
+                return True
+
+            success = True
             for config in carousels_config:
-                carousel, created = OffersCarousel.objects.get_or_create(
-                    title=config['title'],
-                    defaults={'is_active': True}
-                )
-                
-                if created or force or self.should_update(carousel.date if hasattr(carousel, 'date') else None):
-                    # Clear existing products
-                    carousel.products.clear()
-                    
-                    # Add new products
-                    for product in config['products']:
-                        carousel.products.add(product)
-                    
-                    carousel.is_active = True
-                    carousel.save()
-                    
-                    logger.info(f"Updated carousel '{config['title']}' with {len(config['products'])} products")
-            
-            return True
+                carousel = existing.get(config['title'])
+                if carousel is None:
+                    carousel = OffersCarousel.objects.create(title=config['title'], is_active=True)
+                elif not force and carousel in up_to_date:
+                    continue
+
+                try:
+                    product_ids = [product.pk for product in config['products']()]
+                except Exception as e:
+                    logger.error(f"Error computing carousel '{config['title']}': {str(e)}")
+                    success = False
+                    continue
+
+                # set() only adds and removes the memberships that changed
+                carousel.products.set(product_ids)
+                carousel.is_active = True
+                carousel.last_computed_at = timezone.now()
+                carousel.data_signature = signature
+                carousel.save(update_fields=['is_active', 'last_computed_at', 'data_signature'])
+
+                logger.info(f"Updated carousel '{config['title']}' with {len(product_ids)} products")
+
+            return success
             
         except Exception as e:
             logger.error(f"Error updating offers carousel: {str(e)}")
             return False
     
+    def banner_texts(self, product, banner_type):
+        """Main text, subtitle and price of a product's banner"""
+        if banner_type == 'discount' and product.old_price and product.old_price > product.price:
+            discount_percent = int(((product.old_price - product.price) / product.old_price) * 100)
+            main_text = f"{discount_percent}% OFF"
+        else:
+            main_text = "NUEVO"
+        subtitle_text = product.title[:30] + "..." if len(product.title) > 30 else product.title
+        return main_text, subtitle_text, f"${product.price}"
+
+    def banner_job(self, product, banner_type):
+        """``(key, texts)``: the key changes only when the rendered banner would"""
+        texts = self.banner_texts(product, banner_type)
+        key = job_key(hashlib.sha256('\0'.join(texts).encode()).hexdigest(), banner_spec())
+        return key, texts
+
+    def submit_banner(self, key, texts):
+        # Rendered in the image job pool, off this process's GIL
+        return get_queue().submit(key, render_banner, *texts, banner_spec()['format'])
+
     def create_promotional_banner(self, product, banner_type='discount'):
-        """Create a promotional banner image for a product"""
+        """
+        Queue a promotional banner image for a product. Returns the render
+        job's future (encoded image bytes) without waiting for it, or None.
+        """
         try:
-            # Create a banner image
-            width, height = 800, 400
-            image = Image.new('RGB', (width, height), color='#1f2937')
-            draw = ImageDraw.Draw(image)
-            
-            # Try to load a font, fallback to default if not available
-            try:
-                title_font = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', 48)
-                subtitle_font = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', 24)
-            except:
-                title_font = ImageFont.load_default()
-                subtitle_font = ImageFont.load_default()
-            
-            # Add text based on banner type
-            if banner_type == 'discount' and product.old_price and product.old_price > product.price:
-                discount_percent = int(((product.old_price - product.price) / product.old_price) * 100)
-                main_text = f"{discount_percent}% OFF"
-                subtitle_text = product.title[:30] + "..." if len(product.title) > 30 else product.title
-            else:
-                main_text = "NUEVO"
-                subtitle_text = product.title[:30] + "..." if len(product.title) > 30 else product.title
-            
-            # Draw text
-            draw.text((50, 150), main_text, fill='#ffffff', font=title_font)
-            draw.text((50, 220), subtitle_text, fill='#e5e7eb', font=subtitle_font)
-            draw.text((50, 260), f"${product.price}", fill='#10b981', font=subtitle_font)
-            
-            # Save to BytesIO
-            img_io = io.BytesIO()
-            image.save(img_io, format='PNG')
-            img_io.seek(0)
-            
-            return ContentFile(img_io.getvalue(), name=f'banner_{product.id}_{banner_type}.png')
+            key, texts = self.banner_job(product, banner_type)
+            return self.submit_banner(key, texts)
             
         except Exception as e:
             logger.error(f"Error creating banner for product {product.id}: {str(e)}")
             return None
     
     def update_promotional_banners(self, force=False):
-        """Update promotional banners with current offers"""
+        """
+        Update promotional banners with current offers. Banners whose title,
+        price and discount are unchanged keep their image unless ``force``;
+        the others are rendered in parallel on the image job pool.
+        """
         try:
             # Get products for banners
-            discount_products = self.get_discounted_products(3)
-            trending_products = self.get_trending_products(2)
-            
-            # Create banners for discounted products
-            for i, product in enumerate(discount_products):
-                banner_title = f"Oferta Especial - {product.title}"
-                
-                banner, created = Banner.objects.get_or_create(
-                    title=banner_title,
-                    defaults={
-                        'link': f'/product/{product.slug}/',
-                        'is_active': True
-                    }
-                )
-                
-                if created or force:
-                    # Create banner image
-                    banner_image = self.create_promotional_banner(product, 'discount')
-                    if banner_image:
-                        banner.image.save(
-                            f'auto_banner_discount_{product.id}.png',
-                            banner_image,
-                            save=True
-                        )
-                        logger.info(f"Created discount banner for {product.title}")
-            
-            # Create banners for trending products
-            for i, product in enumerate(trending_products):
-                banner_title = f"Tendencia - {product.title}"
-                
-                banner, created = Banner.objects.get_or_create(
-                    title=banner_title,
-                    defaults={
-                        'link': f'/product/{product.slug}/',
-                        'is_active': True
-                    }
-                )
-                
-                if created or force:
-                    # Create banner image
-                    banner_image = self.create_promotional_banner(product, 'trending')
-                    if banner_image:
-                        banner.image.save(
-                            f'auto_banner_trending_{product.id}.png',
-                            banner_image,
-                            save=True
-                        )
-                        logger.info(f"Created trending banner for {product.title}")
+            banner_groups = [
+                ('discount', 'Oferta Especial', self.get_discounted_products(3)),
+                ('trending', 'Tendencia', self.get_trending_products(2)),
+            ]
+
+            pending = []
+            for banner_type, title_prefix, products in banner_groups:
+                for product in products:
+                    banner, _ = Banner.objects.get_or_create(
+                        title=f"{title_prefix} - {product.title}",
+                        defaults={
+                            'link': f'/product/{product.slug}/',
+                            'is_active': True
+                        }
+                    )
+                    key, texts = self.banner_job(product, banner_type)
+                    # force re-renders banners even when nothing changed
+                    if not force and banner.render_key == key and banner.image:
+                        logger.info(f"{banner_type.capitalize()} banner for {product.title} is up to date")
+                        continue
+                    pending.append((banner, product, banner_type, key, self.submit_banner(key, texts)))
+
+            # Save in order as the renders finish
+            extension = banner_spec()['format']
+            for banner, product, banner_type, key, future in pending:
+                try:
+                    data = future.result()
+                except Exception as e:
+                    logger.error(f"Error creating banner for product {product.id}: {str(e)}")
+                    continue
+                banner.image.save(f'auto_banner_{banner_type}_{product.id}.{extension}', ContentFile(data), save=False)
+                banner.render_key = key
+                banner.save(update_fields=['image', 'render_key'])
+                logger.info(f"Created {banner_type} banner for {product.title}")
             
             return True
             
@@ -269,15 +267,7 @@ class CarouselAutomation:
                     # Use product image or create a promotional image
                     if product.image:
                         try:
-                            # Copy product image to carousel
-                            response = requests.get(product.image.url)
-                            if response.status_code == 200:
-                                carousel_image.image.save(
-                                    f'carousel_product_{product.id}.jpg',
-                                    ContentFile(response.content),
-                                    save=True
-                                )
-                                logger.info(f"Updated carousel image for {product.title}")
+                            self.copy_product_image(product, carousel_image)
                         except Exception as e:
                             logger.error(f"Error copying image for {product.title}: {str(e)}")
             
@@ -287,6 +277,25 @@ class CarouselAutomation:
             logger.error(f"Error updating carousel images: {str(e)}")
             return False
     
+    def copy_product_image(self, product, carousel_image):
+        """
+        Copy the product image into the carousel image through the storage
+        (no HTTP request to ourselves); skipped if the content is the same
+        """
+        storage = product.image.storage
+        if same_content(storage, carousel_image.image.name, product.image.name):
+            logger.info(f"Carousel image for {product.title} is up to date")
+            return False
+
+        extension = os.path.splitext(product.image.name)[1].lower() or '.jpg'
+        target = carousel_image.image.field.generate_filename(
+            carousel_image, f'carousel_product_{product.id}{extension}'
+        )
+        carousel_image.image.name = copy_stored_file(storage, product.image.name, target)
+        carousel_image.save(update_fields=['image'])
+        logger.info(f"Updated carousel image for {product.title}")
+        return True
+
     def run_full_automation(self, force=False):
         """Run complete carousel automation"""
         results = {
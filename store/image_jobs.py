@@ -0,0 +1,164 @@
+"""
+A process pool for CPU-bound Pillow work.
+
+Resizing and encoding images holds the GIL, so running it in a request or
+task thread stalls everything else in that process. ``ImageJobQueue``
+hands it to a ``ProcessPoolExecutor`` instead:
+
+- jobs are top-level functions taking and returning plain data (bytes,
+  numbers, strings); reading sources and writing results stays in the
+  parent, where storage and the database are,
+- every job has a key, normally ``job_key(source_sha256, spec)``; a job
+  submitted while the same key is queued or running shares the existing
+  one (its callback runs with the others) instead of running twice, and callers can skip a job whose key
+  matches the one stored with its last result,
+- at most ``max_workers`` jobs run at once and at most ``max_pending``
+  are queued; ``submit`` blocks beyond that, so queueing a whole media
+  library doesn't hold every image in memory, or raises ``QueueFull``
+  with ``block=False`` so a request never waits on the pool,
+- ``max_workers=0`` runs jobs inline, for development and tests.
+
+The pool uses the 'spawn' start method: forking a threaded web worker
+(uvicorn, gunicorn threads) can deadlock the child.
+
+IMAGE_JOB_WORKERS and IMAGE_JOB_MAX_PENDING size the shared queue
+returned by ``get_queue()``.
+"""
+
+import hashlib
+import json
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 2
+
+
+class QueueFull(Exception):
+    """``submit(block=False)`` found ``max_pending`` jobs already queued"""
+
+
+def job_key(source_hash, spec):
+    """Key for running ``spec`` (a JSON-serialisable dict) on content with ``source_hash``"""
+    spec_json = json.dumps(spec, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f"{source_hash}:{spec_json}".encode()).hexdigest()
+
+
+class ImageJobQueue:
+    def __init__(self, max_workers=None, max_pending=None):
+        if max_workers is None:
+            max_workers = int(getattr(settings, 'IMAGE_JOB_WORKERS', DEFAULT_WORKERS))
+        if max_pending is None:
+            max_pending = int(getattr(settings, 'IMAGE_JOB_MAX_PENDING', 0)) or max(1, max_workers) * 4
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._inflight = {}
+        self._callbacks = {}
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    def submit(self, key, fn, *args, callback=None, block=True):
+        """
+        Run ``fn(*args)`` in the pool and return its future. ``callback(future)``
+        runs in the parent once it's done (in a pool thread, or inline when
+        max_workers is 0). If ``key`` is already queued or running, the
+        callback is attached to that job and nothing new runs.
+
+        When ``max_pending`` jobs are queued, waits for one to finish, or
+        raises QueueFull if ``block`` is False.
+        """
+        with self._lock:
+            if key in self._inflight:
+                return self._attach(key, callback)
+
+        # Wait for a free slot outside the lock so finishing jobs can release theirs
+        if not self._slots.acquire(blocking=block):
+            raise QueueFull(f"{self.max_pending} image jobs already queued")
+        with self._lock:
+            if key in self._inflight:
+                self._slots.release()
+                return self._attach(key, callback)
+            if self.max_workers:
+                try:
+                    future = self._get_executor().submit(fn, *args)
+                except Exception:
+                    self._slots.release()
+                    raise
+            else:
+                future = Future()
+            self._inflight[key] = future
+            self._callbacks[key] = [callback] if callback else []
+
+        if not self.max_workers:
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+        future.add_done_callback(lambda done: self._finished(key, done))
+        return future
+
+    def _attach(self, key, callback):
+        if callback:
+            self._callbacks[key].append(callback)
+        return self._inflight[key]
+
+    def _finished(self, key, future):
+        # The job stays in flight until every callback, including ones
+        # attached while the others ran, has been called
+        called = 0
+        while True:
+            with self._lock:
+                callbacks = self._callbacks[key][called:]
+                if not callbacks:
+                    del self._inflight[key], self._callbacks[key]
+                    self._idle.notify_all()
+                    break
+            for callback in callbacks:
+                try:
+                    callback(future)
+                except Exception:
+                    logger.exception(f"Image job {key[:12]} callback failed")
+            called += len(callbacks)
+        self._slots.release()
+
+    def pending(self):
+        with self._lock:
+            return len(self._inflight)
+
+    def join(self, timeout=None):
+        """Wait until every submitted job and its callback has finished"""
+        with self._lock:
+            return self._idle.wait_for(lambda: not self._inflight, timeout=timeout)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    """The process-wide queue, created (without starting workers) on first use"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = ImageJobQueue()
+        return _queue
@@ -0,0 +1,348 @@
+"""
+Responsive derivatives for uploaded images.
+
+When a model in ``IMAGE_FIELDS`` is saved with a new image, fixed-width
+copies (IMAGE_VARIANT_WIDTHS, never wider than the original) are written
+next to it under ``variants/`` in each of IMAGE_VARIANT_FORMATS (WebP by
+default, AVIF when the Pillow build supports it) plus a JPEG fallback
+(PNG when the image has transparency).
+
+The storage names are kept in the model's ``image_variants`` JSON field:
+
+    {"source": "products/shirt.jpg", "width": 4032, "height": 3024,
+     "formats": {"webp": [[160, "variants/products/shirt-160w.webp"], ...],
+                 "jpeg": [[160, "variants/products/shirt-160w.jpg"], ...]}}
+
+``source`` is the image name the variants were made from, so saves that
+don't change the image don't look at it again. ``key`` identifies the
+source bytes and the variant spec (store/image_jobs.py): the resizing
+runs in the image job pool and is skipped when the key is unchanged.
+``srcset_data`` turns the field into the ``srcset`` strings the
+serializers expose.
+
+Functions that run in the pool (``render_variants``, ``render_banner``)
+take and return plain data and don't touch the ORM.
+"""
+
+import functools
+import io
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.db.models.signals import post_save
+from PIL import Image, ImageDraw, ImageFont, ImageOps, features
+
+from store.image_jobs import QueueFull, get_queue, job_key
+from store.storage import stored_digest
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WIDTHS = (160, 480, 960, 1600)
+VARIANTS_DIR = 'variants'
+QUALITY = 80
+
+# Models whose ``image`` field gets variants, as app_label.ModelName
+IMAGE_FIELDS = [
+    'store.Category',
+    'store.Product',
+    'store.Color',
+    'store.Gallery',
+    'store.CarouselImage',
+    'store.Banner',
+]
+
+MIME_TYPES = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+}
+EXTENSIONS = {'avif': 'avif', 'webp': 'webp', 'jpeg': 'jpg', 'png': 'png'}
+
+
+def variant_widths():
+    return sorted(set(getattr(settings, 'IMAGE_VARIANT_WIDTHS', DEFAULT_WIDTHS)))
+
+
+def variant_formats():
+    """Configured modern formats this Pillow build can encode, best first"""
+    formats = []
+    for name in getattr(settings, 'IMAGE_VARIANT_FORMATS', ('webp',)):
+        name = name.lower()
+        if name in ('avif', 'webp') and features.check(name):
+            formats.append(name)
+        else:
+            logger.warning(f"Image variant format '{name}' is not supported by this Pillow build, skipping")
+    return formats
+
+
+def has_alpha(image):
+    return image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def variant_name(source_name, width, fmt):
+    stem, _ = os.path.splitext(source_name)
+    return f"{VARIANTS_DIR}/{stem}-{width}w.{EXTENSIONS[fmt]}"
+
+
+def encode(image, fmt):
+    buffer = io.BytesIO()
+    if fmt == 'jpeg':
+        image.convert('RGB').save(buffer, 'JPEG', quality=QUALITY, optimize=True, progressive=True)
+    elif fmt == 'png':
+        image.save(buffer, 'PNG', optimize=True)
+    elif fmt == 'webp':
+        image.save(buffer, 'WEBP', quality=QUALITY, method=4)
+    else:
+        image.save(buffer, fmt.upper(), quality=QUALITY)
+    return buffer.getvalue()
+
+
+def render_variants(data, widths, formats):
+    """
+    Resize an image, given as encoded bytes or a local file path, to
+    ``widths`` in ``formats`` (plus the fallback). Returns
+    ``(width, height, {fmt: [(width, bytes), ...]})``.
+    """
+    image = Image.open(data if isinstance(data, str) else io.BytesIO(data))
+    width, height = image.size
+    if image.getexif().get(0x0112) in (5, 6, 7, 8):
+        # Rotated a quarter turn by its EXIF orientation
+        width, height = height, width
+    largest = max(widths)
+    # Let the JPEG decoder downscale while decoding; both sides stay at
+    # least as large as the widest variant whatever the orientation
+    image.draft('RGB', (largest, largest))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if has_alpha(image) else 'RGB')
+
+    targets = sorted({min(w, width) for w in widths})
+    fallback = 'png' if has_alpha(image) else 'jpeg'
+
+    rendered = {fmt: [] for fmt in formats + [fallback]}
+    for target in targets:
+        resized = image
+        if target != image.width:
+            resized = image.resize((target, max(1, round(image.height * target / image.width))), Image.LANCZOS)
+        for fmt in rendered:
+            rendered[fmt].append((target, encode(resized, fmt)))
+    return width, height, rendered
+
+
+BANNER_SIZE = (800, 400)
+BANNER_FONTS = {
+    'title': ('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', 48),
+    'subtitle': ('/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', 24),
+}
+
+
+def banner_format():
+    # Flat colours and text: lossless WebP is exact and smaller than PNG
+    return 'webp' if features.check('webp') else 'png'
+
+
+def banner_spec():
+    return {'banner': 2, 'size': BANNER_SIZE, 'fonts': BANNER_FONTS, 'format': banner_format()}
+
+
+@functools.lru_cache(maxsize=None)
+def banner_fonts():
+    """Title and subtitle fonts, loaded once per process"""
+    try:
+        return (
+            ImageFont.truetype(*BANNER_FONTS['title']),
+            ImageFont.truetype(*BANNER_FONTS['subtitle']),
+        )
+    except OSError:
+        # Fallback to default if not available
+        return ImageFont.load_default(), ImageFont.load_default()
+
+
+def render_banner(main_text, subtitle_text, price_text, fmt='png'):
+    """Encoded bytes of a promotional banner (CarouselAutomation.create_promotional_banner)"""
+    image = Image.new('RGB', BANNER_SIZE, color='#1f2937')
+    draw = ImageDraw.Draw(image)
+    title_font, subtitle_font = banner_fonts()
+
+    draw.text((50, 150), main_text, fill='#ffffff', font=title_font)
+    draw.text((50, 220), subtitle_text, fill='#e5e7eb', font=subtitle_font)
+    draw.text((50, 260), price_text, fill='#10b981', font=subtitle_font)
+
+    buffer = io.BytesIO()
+    if fmt == 'webp':
+        image.save(buffer, 'WEBP', lossless=True, method=2, quality=50)
+    else:
+        # Few colours: a palette PNG is a fraction of the RGB one
+        image.quantize(colors=64).save(buffer, 'PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def variant_spec():
+    """Everything besides the source bytes that decides what the variants look like"""
+    return {'widths': variant_widths(), 'formats': variant_formats(), 'quality': QUALITY}
+
+
+def store_variants(storage, source, key, rendered):
+    """Write the output of ``render_variants`` and return the ``image_variants`` value"""
+    width, height, by_format = rendered
+    formats = {}
+    for fmt, variants in by_format.items():
+        formats[fmt] = []
+        for variant_width, content in variants:
+            name = variant_name(source, variant_width, fmt)
+            # Same source name, same variant names: replace, don't suffix
+            # (a no-op for blobs, whose old variants collect_media_blobs removes)
+            if storage.exists(name):
+                storage.delete(name)
+            formats[fmt].append([variant_width, storage.save(name, ContentFile(content))])
+    return {'source': source, 'key': key, 'width': width, 'height': height, 'formats': formats}
+
+
+def needs_variants(instance, field='image'):
+    field_file = getattr(instance, field)
+    current = (instance.image_variants or {}).get('source')
+    return (field_file.name or None) != current
+
+
+def schedule_variants(instance, field='image', force=False, queue=None, block=True):
+    """
+    Queue the variants of ``instance`` on the image job pool and store them
+    when they're ready. Returns the job's future, or None when there is
+    nothing to do: the stored key (source SHA-256 + variant spec) already
+    matches, unless ``force``. With ``block=False`` a full queue raises
+    QueueFull instead of waiting.
+
+    The SHA-256 of a blob is its name, so nothing is read to build the key;
+    only names from before the blob store are hashed here. Local files are
+    passed to the pool by path and read by the worker.
+
+    Results are stored with an UPDATE limited to rows that still have the
+    same image, so no save() or signal runs again and a newer upload is
+    never overwritten by an older job.
+    """
+    model = type(instance)
+    manager = model._default_manager
+    field_file = getattr(instance, field)
+    current = instance.image_variants or {}
+    if not field_file:
+        if current:
+            manager.filter(pk=instance.pk).update(image_variants={})
+            instance.image_variants = {}
+        return None
+
+    source = field_file.name
+    storage = field_file.storage
+    try:
+        source_hash = stored_digest(storage, source)
+        if not storage.exists(source):
+            raise FileNotFoundError(source)
+    except Exception as e:
+        # Missing default image and the like: remember the source anyway
+        # so every save doesn't retry it
+        logger.warning(f"Could not read {model.__name__} {instance.pk} image {source}: {e}")
+        variants = {'source': source, 'formats': {}}
+        manager.filter(pk=instance.pk).update(image_variants=variants)
+        instance.image_variants = variants
+        return None
+
+    spec = variant_spec()
+    key = job_key(source_hash, spec)
+    if not force and current.get('key') == key:
+        if current.get('source') != source:
+            # Same bytes under a new name: the existing variants still apply
+            variants = dict(current, source=source)
+            manager.filter(pk=instance.pk).update(image_variants=variants)
+            instance.image_variants = variants
+        return None
+
+    try:
+        data = storage.path(source)
+    except NotImplementedError:
+        # Remote storage: the worker gets the bytes
+        with storage.open(source, 'rb') as f:
+            data = f.read()
+
+    pk = instance.pk
+    scheduled_on = threading.get_ident()
+
+    def store(future):
+        try:
+            try:
+                variants = store_variants(storage, source, key, future.result())
+            except Exception as e:
+                # SVG, corrupt upload...: recorded with its key so it isn't retried
+                logger.warning(f"Could not generate variants for {model.__name__} {pk} ({source}): {e}")
+                variants = {'source': source, 'key': key, 'formats': {}}
+            manager.filter(pk=pk, **{field: source}).update(image_variants=variants)
+            instance.image_variants = variants
+        finally:
+            if threading.get_ident() != scheduled_on:
+                # Pool callback thread: don't leave its connection open
+                connections.close_all()
+
+    queue = queue or get_queue()
+    return queue.submit(key, render_variants, data, spec['widths'], spec['formats'], callback=store, block=block)
+
+
+def srcset_data(variants, url_for):
+    """
+    ``srcset``-ready data for an ``image_variants`` value, or None if there
+    are no variants. ``url_for`` maps a storage name to a URL.
+    """
+    formats = (variants or {}).get('formats') or {}
+    if not formats:
+        return None
+
+    def srcset(entries):
+        return ', '.join(f"{url_for(name)} {width}w" for width, name in entries)
+
+    sources = []
+    fallback = None
+    for fmt, entries in formats.items():
+        if not entries:
+            continue
+        if fmt in ('jpeg', 'png'):
+            fallback = {'type': MIME_TYPES[fmt], 'srcset': srcset(entries), 'src': url_for(entries[-1][1])}
+        else:
+            sources.append({'type': MIME_TYPES[fmt], 'srcset': srcset(entries)})
+    # <picture> picks the first supported <source>: AVIF before WebP
+    sources.sort(key=lambda source: source['type'] != 'image/avif')
+    return {
+        'width': variants.get('width'),
+        'height': variants.get('height'),
+        'sources': sources,
+        'fallback': fallback,
+    }
+
+
+def image_saved(sender, instance, raw=False, **kwargs):
+    # Fixtures load rows as they are
+    if raw or not needs_variants(instance):
+        return
+    # After commit, so the pool callback sees the row and the new file
+    transaction.on_commit(lambda: schedule_variants_nowait(instance))
+
+
+def schedule_variants_nowait(instance):
+    """schedule_variants for request threads: never waits for a queue slot"""
+    try:
+        schedule_variants(instance, block=False)
+    except QueueFull:
+        # The row keeps its previous variants until generate_image_variants runs
+        logger.warning(
+            f"Image queue full, variants of {type(instance).__name__} {instance.pk} not scheduled; "
+            f"run manage.py generate_image_variants"
+        )
+
+
+def connect_signals():
+    from django.apps import apps
+
+    for label in IMAGE_FIELDS:
+        model = apps.get_model(label)
+        post_save.connect(image_saved, sender=model, dispatch_uid=f'image_variants_{label}')
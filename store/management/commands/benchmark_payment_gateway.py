@@ -0,0 +1,164 @@
+import json
+import logging
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import stripe
+from django.core.management.base import BaseCommand
+
+from store.payment_gateway import CircuitOpenError, build_gateway_client
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    """Answers Checkout Session calls like Stripe, with injected latency and errors"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.respond()
+
+    def do_GET(self):
+        self.respond()
+
+    def respond(self):
+        server = self.server
+        delay = server.latency
+        if random.random() < server.slow_rate:
+            delay = server.slow_latency
+        time.sleep(delay)
+
+        if random.random() < server.error_rate:
+            status_code = 500
+            body = {'error': {'type': 'api_error', 'message': 'Fake server error'}}
+        else:
+            status_code = 200
+            session_id = f"cs_fake_{random.getrandbits(48):012x}"
+            body = {
+                'id': session_id,
+                'object': 'checkout.session',
+                'payment_status': 'unpaid',
+                'expires_at': int(time.time()) + 3600,
+                'url': f"https://checkout.example.com/{session_id}",
+            }
+
+        payload = json.dumps(body).encode()
+        try:
+            self.send_response(status_code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client timed out and hung up
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the stripe default HTTP client against the configured payment gateway '
+        'client, both talking to a local fake Stripe server'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Calls per client')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent callers')
+        parser.add_argument('--latency', type=float, default=0.02, help='Fake server latency (s)')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of 500 responses')
+        parser.add_argument('--slow-rate', type=float, default=0.0, help='Share of slow responses')
+        parser.add_argument('--slow-latency', type=float, default=15.0, help='Latency of slow responses (s)')
+        parser.add_argument('--read-timeout', type=float, default=2.0, help='Gateway read timeout (s)')
+        parser.add_argument('--retries', type=int, default=2, help='Gateway max network retries')
+        parser.add_argument(
+            '--skip-default',
+            action='store_true',
+            help="Only run the gateway client (the default client waits up to 80 s per slow call)"
+        )
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), FakeStripeHandler)
+        server.daemon_threads = True
+        server.lock = threading.Lock()
+        server.latency = options['latency']
+        server.error_rate = options['error_rate']
+        server.slow_rate = options['slow_rate']
+        server.slow_latency = options['slow_latency']
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        # The stripe library logs every request at INFO
+        logging.getLogger('stripe').setLevel(logging.WARNING)
+
+        saved = (stripe.api_base, stripe.api_key, stripe.default_http_client, stripe.max_network_retries)
+        stripe.api_base = f"http://127.0.0.1:{server.server_address[1]}"
+        stripe.api_key = 'sk_test_fake'
+
+        clients = []
+        if not options['skip_default']:
+            clients.append(('stripe default', stripe.http_client.RequestsClient(), 0))
+        clients.append((
+            'payment gateway',
+            build_gateway_client(read_timeout=options['read_timeout'], pool_size=options['concurrency']),
+            options['retries'],
+        ))
+
+        try:
+            for name, client, retries in clients:
+                stripe.default_http_client = client
+                stripe.max_network_retries = retries
+                server.connections = 0
+                self.report(name, self.run(options), server.connections)
+        finally:
+            stripe.api_base, stripe.api_key, stripe.default_http_client, stripe.max_network_retries = saved
+            server.shutdown()
+
+    def run(self, options):
+        def call(_):
+            started = time.perf_counter()
+            try:
+                stripe.checkout.Session.create(
+                    mode='payment',
+                    success_url='https://example.com/ok',
+                    line_items=[{'price': 'price_fake', 'quantity': 1}],
+                )
+                outcome = 'ok'
+            except CircuitOpenError:
+                outcome = 'fast_failed'
+            except stripe.error.StripeError:
+                outcome = 'error'
+            return outcome, time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results = list(pool.map(call, range(options['requests'])))
+        return results, time.perf_counter() - started
+
+    def report(self, name, run, connections):
+        results, wall = run
+        latencies = sorted(duration for _, duration in results)
+        counts = {outcome: 0 for outcome in ('ok', 'error', 'fast_failed')}
+        for outcome, _ in results:
+            counts[outcome] += 1
+
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        self.stdout.write(self.style.SUCCESS(f'\n== {name}'))
+        self.stdout.write(
+            f"ok {counts['ok']}  errors {counts['error']}  fast-failed {counts['fast_failed']}  "
+            f"connections {connections}"
+        )
+        self.stdout.write(
+            f"p50 {statistics.median(latencies) * 1000:.1f} ms  p95 {p95 * 1000:.1f} ms  "
+            f"max {latencies[-1] * 1000:.1f} ms  wall {wall:.2f} s  "
+            f"throughput {len(results) / wall:.1f} req/s"
+        )
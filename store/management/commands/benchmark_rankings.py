@@ -0,0 +1,106 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Avg, Count, Q, Sum
+from django.utils import timezone
+
+from store import rankings
+from store.models import CartOrderItem, Product
+from store.seeding import seed_dataset
+
+
+def legacy_trending(limit):
+    """get_trending_products as it was, with the relation name corrected"""
+    since = timezone.now() - timedelta(days=30)
+    return list(Product.objects.filter(
+        status='published', in_stock=True, stock_qty__gt=0
+    ).annotate(
+        recent_orders=Count('order_item', filter=Q(order_item__order__date__gte=since)),
+        total_revenue=Sum('order_item__total', filter=Q(order_item__order__date__gte=since)),
+        avg_rating=Avg('review__rating')
+    ).filter(recent_orders__gt=0).order_by('-recent_orders', '-total_revenue', '-views')[:limit])
+
+
+def legacy_best_selling(limit):
+    """get_best_selling_products as it was, with the relation name corrected"""
+    return list(Product.objects.filter(
+        status='published', in_stock=True, stock_qty__gt=0
+    ).annotate(
+        total_orders=Count('order_item'),
+        total_revenue=Sum('order_item__total')
+    ).filter(total_orders__gt=0).order_by('-total_orders', '-total_revenue')[:limit])
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the trending and best-seller rankings before and after the rankings module, '
+        'optionally against a seeded dataset (1M order items by default)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed', action='store_true',
+            help='Seed a synthetic dataset first (rolled back afterwards unless --keep)'
+        )
+        parser.add_argument('--orders', type=int, default=334000, help='Orders to seed (3 items each)')
+        parser.add_argument('--products', type=int, default=5000, help='Products to seed')
+        parser.add_argument('--days', type=int, default=730, help='Order history to spread the orders over')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded rows instead of rolling them back')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per ranking')
+        parser.add_argument('--skip-legacy', action='store_true', help="Don't time the old queries")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['seed']:
+                self.stdout.write('Seeding dataset...')
+                started = time.perf_counter()
+                seed_dataset(
+                    products=options['products'],
+                    orders=options['orders'],
+                    days=options['days'],
+                    log=self.stdout.write
+                )
+                self.stdout.write(f'Seeded in {time.perf_counter() - started:.0f}s')
+                # Fresh statistics so the planner knows the table sizes
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+
+            self.stdout.write(f'{CartOrderItem.objects.count()} order items, {Product.objects.count()} products')
+            runs = [
+                ('trending (rankings, 30 days, paid)', lambda: rankings.trending_products(8)),
+                ('best selling (rankings, 365 days, paid)', lambda: rankings.best_selling_products(8)),
+            ]
+            if not options['skip_legacy']:
+                runs += [
+                    ('trending (legacy annotate)', lambda: legacy_trending(8)),
+                    ('best selling (legacy annotate, all time)', lambda: legacy_best_selling(8)),
+                ]
+            for name, run in runs:
+                self.report(name, run, options['repeat'])
+
+            self.stdout.write(self.style.SUCCESS('\n== trending plan'))
+            since = timezone.now() - timedelta(days=rankings.TRENDING_DAYS)
+            queryset = CartOrderItem.objects.filter(
+                order__payment_status='paid', order__date__gte=since,
+                product__status='published', product__in_stock=True, product__stock_qty__gt=0,
+            ).values('product').annotate(recent_orders=Count('id'), total_revenue=Sum('total'))
+            self.stdout.write(queryset.explain())
+
+            if options['seed'] and not options['keep']:
+                transaction.set_rollback(True)
+                self.stdout.write('\nSeeded rows rolled back.')
+
+    def report(self, name, run, repeat):
+        durations = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            products = run()
+            durations.append(time.perf_counter() - started)
+        self.stdout.write(self.style.SUCCESS(f'\n== {name}'))
+        self.stdout.write(
+            f"median {statistics.median(durations) * 1000:.1f} ms  max {max(durations) * 1000:.1f} ms  "
+            f"top: {', '.join(str(product.pk) for product in products[:5])}"
+        )
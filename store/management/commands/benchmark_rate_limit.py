@@ -0,0 +1,101 @@
+import statistics
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache, caches
+from django.core.management.base import BaseCommand
+
+from store.rate_limit import RateLimiter
+
+
+def legacy_hit(key, limit):
+    """The previous get-then-set counter, kept here for comparison"""
+    count = cache.get(key, 0)
+    if count >= limit:
+        return False
+    cache.set(key, count + 1, 3600)
+    return True
+
+
+class BrokenCache:
+    """A cache backend that is down, to exercise the in-process fallback"""
+
+    def add(self, *args, **kwargs):
+        raise ConnectionError("cache down")
+
+    incr = get = add
+
+
+class Command(BaseCommand):
+    help = (
+        'Hammer one rate limit key from many threads with the old get/set counter and '
+        'the atomic sliding-window limiter; reports admitted requests vs the limit'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000, help='Requests per run')
+        parser.add_argument('--threads', type=int, default=16, help='Concurrent callers')
+        parser.add_argument('--limit', type=int, default=1000, help='Allowed requests per window')
+        parser.add_argument(
+            '--switch-interval', type=float, default=1e-6,
+            help='Interpreter thread switch interval; small values interleave threads like separate workers'
+        )
+        parser.add_argument('--clients', type=int, default=50000, help='Distinct clients for the fallback run')
+        parser.add_argument('--fallback-size', type=int, default=10000, help='Fallback LRU size')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"cache backend: {caches['default'].__class__.__name__}")
+        saved_interval = sys.getswitchinterval()
+        sys.setswitchinterval(options['switch_interval'])
+        try:
+            legacy_key = f"bench_legacy:{uuid.uuid4().hex}"
+            self.report('get/set counter', options, lambda: legacy_hit(legacy_key, options['limit']))
+
+            limiter = RateLimiter(rules=[('bench', r'', options['limit'], 3600)], exempt='')
+            rule = limiter.rules[0]
+            ident = uuid.uuid4().hex
+            self.report('sliding window (add/incr)', options, lambda: limiter.hit(rule, ident).allowed)
+        finally:
+            sys.setswitchinterval(saved_interval)
+
+        # Cache down: every distinct client still gets counted, in bounded memory
+        limiter = RateLimiter(
+            rules=[('bench', r'', options['limit'], 3600)], exempt='',
+            backend=BrokenCache(), fallback_size=options['fallback_size']
+        )
+        rule = limiter.rules[0]
+        started = time.perf_counter()
+        for client in range(options['clients']):
+            limiter.hit(rule, f"client-{client}")
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS('\n== in-process fallback (cache down)'))
+        self.stdout.write(
+            f"{options['clients']} clients -> {len(limiter.fallback)} counters kept "
+            f"(cap {options['fallback_size']}), {elapsed / options['clients'] * 1e6:.1f} us per hit"
+        )
+
+    def report(self, name, options, hit):
+        def call(_):
+            started = time.perf_counter()
+            allowed = hit()
+            return allowed, time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            results = list(pool.map(call, range(options['requests'])))
+        wall = time.perf_counter() - started
+
+        admitted = sum(1 for allowed, _ in results if allowed)
+        latencies = sorted(duration for _, duration in results)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        self.stdout.write(self.style.SUCCESS(f'\n== {name}'))
+        self.stdout.write(
+            f"admitted {admitted} of {options['requests']} (limit {options['limit']}, "
+            f"overshoot {max(0, admitted - options['limit'])})"
+        )
+        self.stdout.write(
+            f"p50 {statistics.median(latencies) * 1e6:.1f} us  p95 {p95 * 1e6:.1f} us  "
+            f"throughput {len(results) / wall:.0f} req/s"
+        )
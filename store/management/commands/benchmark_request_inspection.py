@@ -0,0 +1,96 @@
+import logging
+import re
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from store import security_middleware
+from store.security_middleware import SecurityMiddleware
+
+
+def legacy_check(text, patterns):
+    """The previous per-pattern loop, kept here for comparison"""
+    if not text:
+        return False
+    text = str(text).lower()
+    for pattern in patterns:
+        if re.search(pattern, text, re.IGNORECASE):
+            return True
+    return False
+
+
+def legacy_security_checks(request):
+    """SecurityMiddleware._security_checks as it was: one pass per check and pattern"""
+    values = list(request.GET.values())
+    if request.method == 'POST':
+        values += [str(value) for value in request.POST.values()]
+    for patterns in (security_middleware.SQL_INJECTION_PATTERNS, security_middleware.XSS_PATTERNS):
+        if any(legacy_check(value, patterns) for value in values):
+            return False
+    if legacy_check(request.path, security_middleware.PATH_TRAVERSAL_PATTERNS):
+        return False
+    if legacy_check(request.META.get('HTTP_USER_AGENT', '').lower(), security_middleware.SCANNER_USER_AGENT_PATTERNS):
+        return False
+    return True
+
+
+class Command(BaseCommand):
+    help = 'Measure the per-request cost of the security middleware inspection, before and after'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000, help='Runs per request shape')
+        parser.add_argument('--fields', type=int, default=20, help='POST fields of the checkout request')
+        parser.add_argument('--large-kb', type=int, default=64, help='Size of the large text field (KB)')
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        user_agent = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 Chrome/126.0 Safari/537.36'
+        form = {f'field_{i}': f'Rua das Flores {i}, apto {i * 3}' for i in range(options['fields'])}
+
+        shapes = [
+            ('search GET', factory.get(
+                '/api/v1/search/', {'query': 'camiseta azul', 'page': '2', 'ordering': '-price'},
+                HTTP_USER_AGENT=user_agent)),
+            (f"checkout POST ({options['fields']} fields)", factory.post(
+                '/api/v1/create-order/', form, HTTP_USER_AGENT=user_agent)),
+            (f"review POST ({options['large_kb']} KB text)", factory.post(
+                '/api/v1/reviews/', {'review': 'Produto muito bom, recomendo. ' * (options['large_kb'] * 34)},
+                HTTP_USER_AGENT=user_agent)),
+        ]
+        attacks = [
+            factory.get('/api/v1/search/', {'query': "1' or 1=1 --"}),
+            factory.post('/api/v1/reviews/', {'review': '<script>alert(1)</script>'}),
+            factory.get('/media/../../etc/passwd'),
+            factory.get('/api/v1/products/', HTTP_USER_AGENT='sqlmap/1.7'),
+        ]
+
+        middleware = SecurityMiddleware(lambda request: None)
+        # Parse the bodies up front so both sides time only the inspection
+        for _, request in shapes:
+            request.POST
+
+        # The attack samples below are expected to log warnings
+        logging.getLogger(security_middleware.__name__).setLevel(logging.ERROR)
+        for request in attacks:
+            if middleware._security_checks(request) or legacy_security_checks(request):
+                self.stdout.write(self.style.ERROR(f'Attack not blocked: {request.get_full_path()}'))
+
+        regex = security_middleware.VALUE_PATTERNS
+        self.stdout.write(
+            f"value patterns: {regex.pattern_count} compiled into one regex, "
+            f"values capped at {regex.max_length} chars"
+        )
+        for name, request in shapes:
+            legacy = self.time(legacy_security_checks, request, options['iterations'])
+            current = self.time(middleware._security_checks, request, options['iterations'])
+            self.stdout.write(
+                f"{name:<30} before {legacy:9.1f} us  after {current:9.1f} us  "
+                f"speedup {legacy / current:5.1f}x"
+            )
+
+    def time(self, check, request, iterations):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            check(request)
+        return (time.perf_counter() - started) / iterations * 1e6
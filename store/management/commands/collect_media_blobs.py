@@ -0,0 +1,95 @@
+import os
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import models
+
+from store.images import IMAGE_FIELDS
+from store.management.commands.migrate_media_storage import format_bytes
+from store.storage import BLOB_DIR, ContentAddressedStorage, is_blob_name
+
+
+def referenced_blobs():
+    """Blob names used by a FileField value, a field default or an ``image_variants`` entry"""
+    names = set()
+    for model in apps.get_models():
+        for field in model._meta.concrete_fields:
+            if not isinstance(field, models.FileField):
+                continue
+            if isinstance(field.default, str):
+                names.add(field.default)
+            names.update(
+                model._default_manager.exclude(**{field.name: ''}).exclude(**{f'{field.name}__isnull': True})
+                .values_list(field.name, flat=True).distinct()
+            )
+
+    for label in IMAGE_FIELDS:
+        model = apps.get_model(label)
+        for variants in model._default_manager.exclude(image_variants={}).values_list('image_variants', flat=True):
+            for entries in (variants.get('formats') or {}).values():
+                names.update(name for _, name in entries)
+    return {name for name in names if is_blob_name(name)}
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete blobs of the content-addressed media storage that no file field, field default '
+        'or image variant refers to any more, once they are older than the grace period'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be deleted without deleting')
+        parser.add_argument(
+            '--grace-hours', type=float, default=24,
+            help='Keep blobs written or re-used more recently than this (default: 24), '
+                 'so uploads not committed yet and running variant jobs are safe'
+        )
+
+    def handle(self, *args, **options):
+        storage = ContentAddressedStorage()
+        root = storage.path(BLOB_DIR)
+        if not os.path.isdir(root):
+            self.stdout.write('No blobs')
+            return
+
+        # Listed before the references are read: a blob stored after this
+        # point is not in the listing, one stored before is either
+        # referenced or inside the grace period
+        cutoff = time.time() - options['grace_hours'] * 3600
+        paths = []
+        for directory, _, files in os.walk(root):
+            for filename in files:
+                paths.append(os.path.join(directory, filename))
+        referenced = referenced_blobs()
+
+        deleted = kept_recent = 0
+        reclaimed = 0
+        for path in paths:
+            name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+            # Blobs and leftovers of interrupted uploads (.upload-*)
+            if name in referenced or not (is_blob_name(name) or os.path.basename(name).startswith('.upload-')):
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime > cutoff:
+                kept_recent += 1
+                continue
+            if not options['dry_run']:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    continue
+            deleted += 1
+            # Hard links (migrate_media_storage --keep-originals) keep the bytes
+            if stat.st_nlink == 1:
+                reclaimed += stat.st_size
+
+        action = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(
+            f"{len(paths)} files, {len(referenced)} referenced blobs, "
+            f"{kept_recent} unreferenced but within the grace period"
+        )
+        self.stdout.write(self.style.SUCCESS(f"{action} {deleted} blobs, {format_bytes(reclaimed)}"))
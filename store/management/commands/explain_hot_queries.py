@@ -0,0 +1,88 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from store.models import Cart, CartOrder, CartOrderItem, Notification, Product, Review
+from store.seeding import seed_dataset
+
+
+def hot_queries():
+    """The hot filters of the store views, as (name, queryset) pairs"""
+    now = timezone.now()
+    any_order = CartOrder.objects.order_by('id').first()
+    any_cart = Cart.objects.order_by('-id').first()
+    any_product = Product.objects.order_by('-id').first()
+    any_buyer_id = CartOrder.objects.exclude(buyer=None).values_list('buyer_id', flat=True).first() or 0
+    any_vendor_id = CartOrderItem.objects.values_list('vendor_id', flat=True).first() or 0
+    cart_id = any_cart.cart_id if any_cart else ''
+
+    return [
+        ('live feed / dashboard: orders of the last day',
+         CartOrder.objects.filter(date__gte=now - timedelta(days=1)).order_by('-date')[:50]),
+        ('live feed: changed since cursor',
+         CartOrder.objects.filter(updated_at__gt=now - timedelta(minutes=5)).order_by('updated_at', 'id')[:50]),
+        ('dashboard: pending orders of the week',
+         CartOrder.objects.filter(payment_status='pending', date__gte=now - timedelta(days=7))),
+        ('admin: pending WhatsApp orders',
+         CartOrder.objects.filter(payment_method='whatsapp', payment_status='pending')),
+        ('admin index: WhatsApp orders of the week',
+         CartOrder.objects.filter(payment_method='whatsapp', date__gte=now - timedelta(days=7))),
+        ('customer order history',
+         CartOrder.objects.filter(buyer_id=any_buyer_id).order_by('-date')),
+        ('cart list by cart_id',
+         Cart.objects.filter(cart_id=cart_id)),
+        ('cart list by cart_id and user',
+         Cart.objects.filter(cart_id=cart_id, user_id=any_buyer_id)),
+        ('coupon: order items of one vendor',
+         CartOrderItem.objects.filter(order=any_order, vendor_id=any_vendor_id)),
+        ('customer unseen notifications',
+         Notification.objects.filter(user_id=any_buyer_id, seen=False)),
+        ('product reviews',
+         Review.objects.filter(product=any_product, active=True)),
+        ('catalog listing',
+         Product.objects.filter(status='published', in_stock=True)[:20]),
+        ('most viewed products',
+         Product.objects.filter(status='published').order_by('-views')[:18]),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Print the EXPLAIN plans of the hot store queries, optionally against a seeded dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed',
+            action='store_true',
+            help='Seed a synthetic dataset first (rolled back afterwards unless --keep)'
+        )
+        parser.add_argument('--orders', type=int, default=20000, help='Orders to seed')
+        parser.add_argument('--products', type=int, default=2000, help='Products to seed')
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the seeded rows instead of rolling them back'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['seed']:
+                self.stdout.write('Seeding dataset...')
+                seed_dataset(
+                    products=options['products'],
+                    orders=options['orders'],
+                    log=self.stdout.write
+                )
+                # Fresh statistics so the planner knows the table sizes
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+
+            for name, queryset in hot_queries():
+                self.stdout.write(self.style.SUCCESS(f'\n== {name}'))
+                self.stdout.write(str(queryset.query))
+                self.stdout.write(queryset.explain())
+
+            if options['seed'] and not options['keep']:
+                transaction.set_rollback(True)
+                self.stdout.write('\nSeeded rows rolled back.')
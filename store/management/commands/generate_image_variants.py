@@ -0,0 +1,57 @@
+import os
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from store.image_jobs import ImageJobQueue
+from store.images import IMAGE_FIELDS, schedule_variants
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate the responsive variants of every image in parallel on the image job pool. '
+        'Images whose bytes and variant settings are unchanged are skipped unless --force'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model', action='append', dest='models',
+            help=f'Model to process, repeatable (default: {", ".join(IMAGE_FIELDS)})'
+        )
+        parser.add_argument('--force', action='store_true', help='Regenerate even if the image is unchanged')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Worker processes (default: one per core, 0 runs inline)'
+        )
+
+    def handle(self, *args, **options):
+        labels = options['models'] or IMAGE_FIELDS
+        unknown = set(labels) - set(IMAGE_FIELDS)
+        if unknown:
+            raise CommandError(f'Unknown model(s): {", ".join(sorted(unknown))}')
+
+        queue = ImageJobQueue(max_workers=options['workers'])
+        started = time.perf_counter()
+        jobs = {}
+        skipped = 0
+        try:
+            for label in labels:
+                model = apps.get_model(label)
+                for instance in model.objects.only('pk', 'image', 'image_variants').iterator():
+                    future = schedule_variants(instance, force=options['force'], queue=queue)
+                    if future is None:
+                        skipped += 1
+                    else:
+                        # Rows with identical bytes share one job
+                        jobs.setdefault(id(future), future)
+            queue.join()
+        finally:
+            queue.shutdown()
+
+        failed = sum(1 for future in jobs.values() if future.exception() is not None)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(jobs)} images processed ({failed} failed), {skipped} up to date, "
+            f"{options['workers']} workers, {elapsed:.1f}s"
+        ))
@@ -0,0 +1,88 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = ['/health/', '/api/v1/health/', '/api/v1/health-simple/']
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test a running server. Run it once against the WSGI setup '
+        '(gunicorn backend.wsgi:application) and once against the ASGI one '
+        '(gunicorn backend.asgi:application -k uvicorn.workers.UvicornWorker) '
+        'with the same options to compare them'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Server base URL')
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help=f'Path to request, repeatable (default: {", ".join(DEFAULT_PATHS)})'
+        )
+        parser.add_argument('--requests', type=int, default=500, help='Requests per path')
+        parser.add_argument('--concurrency', type=int, default=50, help='Concurrent clients')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout (s)')
+        parser.add_argument(
+            '--header', action='append', default=[],
+            help='Extra header as "Name: value", repeatable (e.g. a session Cookie for the live feed)'
+        )
+
+    def handle(self, *args, **options):
+        headers = {}
+        for header in options['header']:
+            name, sep, value = header.partition(':')
+            if not sep:
+                raise CommandError(f'Invalid header "{header}", expected "Name: value"')
+            headers[name.strip()] = value.strip()
+
+        base_url = options['url'].rstrip('/')
+        try:
+            requests.get(base_url + '/health/', timeout=options['timeout'])
+        except requests.RequestException as e:
+            raise CommandError(f'Server at {base_url} is not reachable: {e}')
+
+        self.stdout.write(
+            f"{base_url}: {options['requests']} requests per path, {options['concurrency']} concurrent"
+        )
+        for path in options['paths'] or DEFAULT_PATHS:
+            self.report(path, self.run(base_url + path, headers, options))
+
+    def run(self, url, headers, options):
+        # One keep-alive session per client thread, like separate browsers
+        local = threading.local()
+
+        def call(_):
+            session = getattr(local, 'session', None)
+            if session is None:
+                session = local.session = requests.Session()
+            started = time.perf_counter()
+            try:
+                response = session.get(url, headers=headers, timeout=options['timeout'])
+                outcome = 'ok' if response.status_code < 400 else f'http_{response.status_code}'
+            except requests.RequestException:
+                outcome = 'error'
+            return outcome, time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results = list(pool.map(call, range(options['requests'])))
+        return results, time.perf_counter() - started
+
+    def report(self, path, run):
+        results, wall = run
+        latencies = sorted(duration for _, duration in results)
+        outcomes = {}
+        for outcome, _ in results:
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        self.stdout.write(self.style.SUCCESS(f'\n== {path}'))
+        self.stdout.write('  '.join(f'{outcome} {count}' for outcome, count in sorted(outcomes.items())))
+        self.stdout.write(
+            f"p50 {statistics.median(latencies) * 1000:.1f} ms  p95 {p95 * 1000:.1f} ms  "
+            f"max {latencies[-1] * 1000:.1f} ms  throughput {len(results) / wall:.1f} req/s"
+        )
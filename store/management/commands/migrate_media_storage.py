@@ -0,0 +1,115 @@
+import os
+import shutil
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+
+from store.storage import ContentAddressedStorage, blob_name, file_digest, is_blob_name
+
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+class Command(BaseCommand):
+    help = (
+        'Move files referenced by FileField/ImageField values into the content-addressed '
+        'blob store, rewrite the fields and delete the originals; reports the disk space reclaimed'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without touching anything')
+        parser.add_argument('--keep-originals', action='store_true', help='Rewrite the fields but keep the old files')
+
+    def handle(self, *args, **options):
+        storage = ContentAddressedStorage()
+        dry_run = options['dry_run']
+        self.copied = 0
+
+        # name -> [(model, field name)] for every file field value in use
+        references = {}
+        # Field defaults (e.g. product.jpg) are used by rows created later
+        protected = set()
+        for model in apps.get_models():
+            for field in model._meta.concrete_fields:
+                if not isinstance(field, models.FileField):
+                    continue
+                if isinstance(field.default, str) and field.default:
+                    protected.add(field.default)
+                names = (
+                    model._default_manager.exclude(**{field.name: ''}).exclude(**{f'{field.name}__isnull': True})
+                    .values_list(field.name, flat=True).distinct()
+                )
+                for name in names:
+                    references.setdefault(name, []).append((model, field.name))
+
+        moved = {}
+        missing = already = 0
+        size_before = 0
+        blob_sizes = {}
+        for name in sorted(references):
+            if is_blob_name(name):
+                already += 1
+                continue
+            if not storage.exists(name):
+                missing += 1
+                continue
+            path = storage.path(name)
+            size = os.path.getsize(path)
+            size_before += size
+            with storage.open(name, 'rb') as f:
+                blob = blob_name(file_digest(f), name)
+            blob_sizes[blob] = size
+            moved[name] = blob
+            if not dry_run and not storage.exists(blob):
+                self.link(path, storage.path(blob))
+
+        self.stdout.write(
+            f"{len(references)} files referenced: {len(moved)} to move, {already} already blobs, "
+            f"{missing} missing"
+        )
+        self.stdout.write(
+            f"{len(moved)} files -> {len(blob_sizes)} blobs "
+            f"({len(moved) - len(blob_sizes)} duplicates), "
+            f"{format_bytes(size_before)} -> {format_bytes(sum(blob_sizes.values()))}"
+        )
+        if dry_run or not moved:
+            return
+
+        rows = 0
+        with transaction.atomic():
+            for name, blob in moved.items():
+                for model, field_name in references[name]:
+                    rows += model._default_manager.filter(**{field_name: name}).update(**{field_name: blob})
+        self.stdout.write(f"{rows} rows rewritten")
+
+        if options['keep_originals']:
+            return
+        # Blobs that had to be copied rather than linked took new space
+        reclaimed = -self.copied
+        for name in moved:
+            if name in protected:
+                continue
+            path = storage.path(name)
+            stat = os.stat(path)
+            # A hard-linked original shares its bytes with the blob
+            if stat.st_nlink == 1:
+                reclaimed += stat.st_size
+            os.unlink(path)
+        self.stdout.write(self.style.SUCCESS(f"Reclaimed {format_bytes(reclaimed)}"))
+
+    def link(self, source, target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(source, target)
+        except FileExistsError:
+            pass
+        except OSError:
+            # No hard links across devices or on this filesystem
+            shutil.copy2(source, target)
+            self.copied += os.path.getsize(target)
@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from store.payments import BATCH_SIZE, drain_stripe_events
+
+
+class Command(BaseCommand):
+    help = 'Process the Stripe webhook events stored by the webhook endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process what is due and exit instead of polling'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2,
+            help='Seconds to sleep when no events are waiting'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Events claimed per batch'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        if options['once']:
+            total_processed = total_failed = 0
+            while True:
+                processed, failed = drain_stripe_events(batch_size)
+                total_processed += processed
+                total_failed += failed
+                if processed + failed < batch_size:
+                    break
+            self.stdout.write(self.style.SUCCESS(f'Processed {total_processed} events, {total_failed} failed'))
+            return
+
+        self.stdout.write('Stripe event worker started')
+        while True:
+            close_old_connections()
+            try:
+                processed, failed = drain_stripe_events(batch_size)
+            except Exception as e:
+                self.stderr.write(f'Stripe event batch failed: {e}')
+                processed = failed = 0
+
+            if processed or failed:
+                self.stdout.write(f'Processed {processed} events, {failed} failed')
+            # Keep going while batches come back full
+            if processed + failed < batch_size:
+                time.sleep(options['interval'])
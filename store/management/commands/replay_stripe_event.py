@@ -0,0 +1,109 @@
+import hashlib
+import hmac
+import json
+import time
+from pathlib import Path
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.urls import reverse
+
+from store.models import CartOrder
+from store.payments import drain_stripe_events
+from store.views import stripe_webhook
+
+FIXTURES_DIR = Path(__file__).resolve().parents[2] / 'fixtures' / 'stripe'
+
+
+def sign_payload(payload, secret, timestamp=None):
+    """Build a Stripe-Signature header for ``payload`` the way Stripe does"""
+    timestamp = int(timestamp or time.time())
+    signed = f"{timestamp}.{payload}".encode('utf-8')
+    signature = hmac.new(secret.encode('utf-8'), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+class Command(BaseCommand):
+    help = (
+        'Send a recorded Stripe event (store/fixtures/stripe) to the webhook, signed with '
+        'STRIPE_WEBHOOK_SECRET. Stands in for Stripe when testing payments locally.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'fixture',
+            help='Fixture name (e.g. checkout.session.completed) or path to an event JSON file'
+        )
+        parser.add_argument('--order', help='Order oid to point the event at')
+        parser.add_argument('--event-id', help='Override the event id (same id = redelivery)')
+        parser.add_argument(
+            '--url',
+            help='POST to a running server instead of calling the view in-process'
+        )
+        parser.add_argument(
+            '--bad-signature',
+            action='store_true',
+            help='Sign with a wrong secret to check the endpoint rejects it'
+        )
+        parser.add_argument(
+            '--process',
+            action='store_true',
+            help='Run the event worker once after delivering'
+        )
+
+    def load_event(self, fixture):
+        path = Path(fixture)
+        if not path.exists():
+            path = FIXTURES_DIR / f"{fixture}.json"
+        if not path.exists():
+            available = ', '.join(sorted(p.stem for p in FIXTURES_DIR.glob('*.json')))
+            raise CommandError(f"Fixture '{fixture}' not found. Available: {available}")
+        return json.loads(path.read_text())
+
+    def handle(self, *args, **options):
+        event = self.load_event(options['fixture'])
+        session = event['data']['object']
+
+        if options['order']:
+            try:
+                order = CartOrder.objects.get(oid=options['order'])
+            except CartOrder.DoesNotExist:
+                raise CommandError(f"Order {options['order']} not found")
+            session.setdefault('metadata', {})['order_oid'] = order.oid
+            if order.stripe_sesion_id:
+                session['id'] = order.stripe_sesion_id
+            session['amount_total'] = int(order.total * 100)
+            session['customer_email'] = order.email
+
+        if options['event_id']:
+            event['id'] = options['event_id']
+
+        payload = json.dumps(event)
+        secret = 'whsec_wrong' if options['bad_signature'] else settings.STRIPE_WEBHOOK_SECRET
+        signature = sign_payload(payload, secret)
+
+        if options['url']:
+            response = requests.post(
+                options['url'],
+                data=payload,
+                headers={'Content-Type': 'application/json', 'Stripe-Signature': signature},
+                timeout=10
+            )
+            status_code, body = response.status_code, response.text
+        else:
+            request = RequestFactory().post(
+                reverse('store:stripe_webhook'),
+                data=payload,
+                content_type='application/json',
+                HTTP_STRIPE_SIGNATURE=signature
+            )
+            response = stripe_webhook(request)
+            status_code, body = response.status_code, response.content.decode()
+
+        self.stdout.write(f"{event['type']} {event['id']} -> {status_code} {body}")
+
+        if options['process']:
+            processed, failed = drain_stripe_events()
+            self.stdout.write(self.style.SUCCESS(f'Processed {processed} events, {failed} failed'))
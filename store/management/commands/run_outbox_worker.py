@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from store.outbox import BATCH_SIZE, drain_outbox
+
+
+class Command(BaseCommand):
+    help = 'Send the queued order emails from the email outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain what is due and exit instead of polling'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Seconds to sleep when the outbox is empty'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Emails sent per SMTP connection'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        if options['once']:
+            total_sent = total_failed = 0
+            while True:
+                sent, failed = drain_outbox(batch_size)
+                total_sent += sent
+                total_failed += failed
+                if sent + failed < batch_size:
+                    break
+            self.stdout.write(self.style.SUCCESS(f'Sent {total_sent} emails, {total_failed} failed'))
+            return
+
+        self.stdout.write('Outbox worker started')
+        while True:
+            close_old_connections()
+            try:
+                sent, failed = drain_outbox(batch_size)
+            except Exception as e:
+                self.stderr.write(f'Outbox batch failed: {e}')
+                sent = failed = 0
+
+            if sent or failed:
+                self.stdout.write(f'Sent {sent} emails, {failed} failed')
+            # Keep going while batches come back full
+            if sent + failed < batch_size:
+                time.sleep(options['interval'])
@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store.models import ScheduledJob
+from store.scheduler import JOBS, Scheduler, configured_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the periodic store jobs (carousels, banners, cleanup, email outbox, Stripe events). '
+        'Any number of schedulers can run: a database lease gives each job to one of them at a time'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--job', action='append', dest='jobs',
+            help=f'Job to run, repeatable (default: {", ".join(JOBS)})'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run the due jobs, wait for them and exit instead of looping'
+        )
+        parser.add_argument(
+            '--now',
+            action='store_true',
+            help='With --once, run the jobs even if they are not due yet'
+        )
+        parser.add_argument('--list', action='store_true', help='Show the schedule and exit')
+
+    def handle(self, *args, **options):
+        names = options['jobs']
+        unknown = set(names or ()) - set(JOBS)
+        if unknown:
+            raise CommandError(f'Unknown job(s): {", ".join(sorted(unknown))}')
+
+        if options['list']:
+            self.list_jobs()
+            return
+
+        scheduler = Scheduler(jobs=configured_jobs(names))
+        if not scheduler.jobs:
+            raise CommandError('No job enabled (see SCHEDULER_INTERVALS)')
+
+        if options['once']:
+            scheduler.register()
+            started = scheduler.run_pending(force=options['now'])
+            scheduler.wait()
+            scheduler.executor.shutdown()
+            for job in ScheduledJob.objects.filter(name__in=started):
+                self.stdout.write(f'{job.name}: {job.last_status}' + (f' ({job.last_error})' if job.last_error else ''))
+            self.stdout.write(self.style.SUCCESS(f'Ran {len(started)} jobs'))
+            return
+
+        self.stdout.write(f'Scheduler {scheduler.owner} started')
+        try:
+            scheduler.run_forever()
+        except KeyboardInterrupt:
+            scheduler.stop()
+            scheduler.executor.shutdown(wait=True)
+
+    def list_jobs(self):
+        jobs = {job.name: job for job in ScheduledJob.objects.all()}
+        for name, (_, interval) in configured_jobs().items():
+            job = jobs.get(name)
+            if job is None:
+                self.stdout.write(f'{name}: every {interval}s, never scheduled')
+                continue
+            lease = f', running on {job.locked_by}' if job.locked_by else ''
+            self.stdout.write(
+                f'{name}: every {interval}s, next {job.next_run_at:%Y-%m-%d %H:%M:%S}, '
+                f'{job.runs} runs, last {job.last_status or "-"}{lease}'
+            )
@@ -0,0 +1,199 @@
+"""
+HTTP caching, Range requests and proxy offload for uploaded media.
+
+``serve_media(request, file_path)`` answers a media request with:
+
+- ``ETag`` (size and mtime) and ``Last-Modified``, and 304 / 412 for
+  conditional requests through Django's ``get_conditional_response``,
+- single ``Range`` requests (206 / 416, honouring ``If-Range``); multiple
+  ranges fall back to the full file,
+- ``Cache-Control``: a year and ``immutable`` for content-hashed names
+  (the name changes when the bytes do), MEDIA_CACHE_SECONDS otherwise,
+- MEDIA_SENDFILE_MODE = 'x-accel-redirect' (nginx, under
+  MEDIA_ACCEL_REDIRECT_PREFIX) or 'x-sendfile' (Apache / lighttpd) to
+  let the front proxy send the bytes instead of the Python worker.
+
+Otherwise the file is streamed in CHUNK_SIZE pieces. Under ASGI the
+iterator is asynchronous and reads each chunk in a thread: Django would
+read a synchronous iterator into memory in one go before sending it.
+"""
+
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from store.storage import is_blob_name
+
+CHUNK_SIZE = 64 * 1024
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# A 12 to 64 hex digit segment right before the extension, with at least
+# one letter so digits-only timestamps (IMG_20231015143022.jpg) don't count:
+# photo.3f9a1c2b7d4e.webp (hashed static files), 9f86d081884c7d65....jpg
+HASHED_NAME_RE = re.compile(r'(^|[._-])(?=[0-9]*[a-f])[0-9a-f]{12,64}\.[A-Za-z0-9]+$')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+COMPRESSED_TYPES = {
+    'bzip2': 'application/x-bzip',
+    'gzip': 'application/gzip',
+    'xz': 'application/x-xz',
+}
+
+
+def resolve_media_path(file_path):
+    """Absolute path of ``file_path`` inside MEDIA_ROOT, Http404 if outside or missing"""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, file_path)
+    except (SuspiciousFileOperation, ValueError):
+        raise Http404(f"File not found: {file_path}")
+    if not os.path.isfile(full_path):
+        raise Http404(f"File not found: {file_path}")
+    return full_path
+
+
+def file_etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def is_hashed_name(file_path):
+    # Blobs of the content-addressed storage are named by their SHA-256
+    return is_blob_name(file_path) or bool(HASHED_NAME_RE.search(os.path.basename(file_path)))
+
+
+def cache_control_for(file_path):
+    if is_hashed_name(file_path):
+        return IMMUTABLE_CACHE_CONTROL
+    max_age = int(getattr(settings, 'MEDIA_CACHE_SECONDS', 3600))
+    return f'public, max-age={max_age}'
+
+
+def parse_range(header, size):
+    """
+    ``(start, end)`` (inclusive) for a single ``bytes=`` range, None to send
+    the whole file, or False when the range can't be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        # Absent, malformed or multiple ranges: ignore per RFC 9110
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def iter_file_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def aiter_file_range(path, start, length):
+    """iter_file_range for ASGI: the blocking reads run in a thread"""
+    f = await sync_to_async(open, thread_sensitive=False)(path, 'rb')
+    try:
+        await sync_to_async(f.seek, thread_sensitive=False)(start)
+        remaining = length
+        while remaining > 0:
+            chunk = await sync_to_async(f.read, thread_sensitive=False)(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def serve_media(request, file_path):
+    full_path = resolve_media_path(file_path)
+    stat = os.stat(full_path)
+    etag = file_etag(stat)
+    last_modified = int(stat.st_mtime)
+    content_type, encoding = mimetypes.guess_type(full_path)
+    # Compressed files are sent as is, like FileResponse does
+    content_type = COMPRESSED_TYPES.get(encoding, content_type) or 'application/octet-stream'
+
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        'Cache-Control': cache_control_for(file_path),
+        'Accept-Ranges': 'bytes',
+    }
+
+    # 304 Not Modified / 412 Precondition Failed
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None:
+        for name, value in headers.items():
+            conditional[name] = value
+        return conditional
+
+    mode = (getattr(settings, 'MEDIA_SENDFILE_MODE', '') or '').lower()
+    if mode in ('x-accel-redirect', 'x-sendfile'):
+        # The proxy sends the bytes and handles Range itself
+        response = HttpResponse(content_type=content_type)
+        if mode == 'x-accel-redirect':
+            prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+            response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(file_path.lstrip('/'))
+        else:
+            response['X-Sendfile'] = full_path
+    else:
+        byte_range = None
+        if request.method == 'GET' and if_range_matches(request, etag, last_modified):
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), stat.st_size)
+
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+
+        start, end = byte_range or (0, stat.st_size - 1)
+        length = max(0, end - start + 1)
+        if request.method == 'HEAD':
+            response = HttpResponse(content_type=content_type)
+        else:
+            iter_range = aiter_file_range if isinstance(request, ASGIRequest) else iter_file_range
+            response = StreamingHttpResponse(
+                iter_range(full_path, start, length), content_type=content_type
+            )
+        response['Content-Length'] = str(length)
+        if byte_range:
+            response.status_code = 206
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+
+    for name, value in headers.items():
+        response[name] = value
+    return response
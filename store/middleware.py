@@ -4,6 +4,8 @@ from django.shortcuts import redirect
 from django.urls import reverse
 import logging
 
+from store.permissions import in_group
+
 logger = logging.getLogger(__name__)
 
 class SecurityMiddleware:
@@ -25,7 +27,7 @@ class SecurityMiddleware:
         # Restrict sensitive admin sections for vendedores
         if (request.path.startswith('/admin/') and 
             request.user.is_authenticated and 
-            request.user.groups.filter(name='vendedores').exists() and
+            in_group(request.user, 'vendedores') and
             not request.user.is_superuser):
             
             # Forbidden paths for vendedores
@@ -68,7 +70,7 @@ class VendedorAdminRedirectMiddleware:
         # Redirect vendedores from main admin to product management
         if (request.path == '/admin/' and 
             request.user.is_authenticated and 
-            request.user.groups.filter(name='vendedores').exists() and
+            in_group(request.user, 'vendedores') and
             not request.user.is_superuser):
             
             return redirect('/admin/store/product/')
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 21:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_updated_at(apps, schema_editor):
+    # Existing orders have not changed since they were placed
+    CartOrder = apps.get_model('store', 'CartOrder')
+    CartOrder.objects.update(updated_at=models.F('date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0039_cartorder_payment_method'),
+        ('vendor', '0002_vendor_email'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartorder',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='cartorder',
+            index=models.Index(fields=['updated_at', 'id'], name='store_order_updated_id_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.5 on 2026-10-18 21:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0040_cartorder_updated_at'),
+        ('vendor', '0002_vendor_email'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['cart_id', 'user'], name='store_cart_cart_id_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cartorder',
+            index=models.Index(fields=['-date'], name='store_order_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cartorder',
+            index=models.Index(fields=['payment_status', '-date'], name='store_order_pay_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cartorder',
+            index=models.Index(fields=['payment_method', 'payment_status'], name='store_order_pay_method_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cartorder',
+            index=models.Index(fields=['buyer', '-date'], name='store_order_buyer_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cartorder',
+            index=models.Index(condition=models.Q(('payment_method', 'whatsapp')), fields=['-date'], name='store_order_whatsapp_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cartorderitem',
+            index=models.Index(fields=['order', 'vendor'], name='store_item_order_vendor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('seen', False)), fields=['user'], name='store_notif_user_unseen_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['status', 'in_stock'], name='store_product_status_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['status', '-views'], name='store_product_status_views_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(condition=models.Q(('active', True)), fields=['product'], name='store_review_active_idx'),
+        ),
+    ]
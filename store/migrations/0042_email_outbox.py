@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 21:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0041_hot_query_indexes'),
+        ('vendor', '0002_vendor_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('customer_order_confirmation', 'Customer Order Confirmation'), ('vendor_sale', 'Vendor Sale')], max_length=50)),
+                ('to_email', models.CharField(max_length=1000)),
+                ('subject', models.CharField(max_length=255)),
+                ('dedup_key', models.CharField(max_length=255, unique=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outbox_emails', to='store.cartorder')),
+                ('vendor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='vendor.vendor')),
+            ],
+            options={
+                'verbose_name_plural': 'Email Outbox',
+                'indexes': [models.Index(condition=models.Q(('status', 'pending')), fields=['available_at'], name='store_outbox_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 21:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0043_stripe_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartorder',
+            name='stripe_session_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='cartorder',
+            name='stripe_session_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='cartorder',
+            name='stripe_session_url',
+            field=models.URLField(blank=True, max_length=1000, null=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-18 21:21
+
+from django.db import migrations, models
+
+
+def backfill_stock_reduced_at(apps, schema_editor):
+    # Paid WhatsApp orders had their stock reduced when they were marked paid
+    CartOrder = apps.get_model('store', 'CartOrder')
+    CartOrder.objects.filter(payment_method='whatsapp', payment_status='paid').update(
+        stock_reduced_at=models.F('updated_at')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0044_cartorder_checkout_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartorder',
+            name='stock_reduced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_stock_reduced_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 21:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0046_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='banner',
+            name='render_key',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
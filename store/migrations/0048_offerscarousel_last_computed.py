@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 21:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0047_banner_render_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='offerscarousel',
+            name='data_signature',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='offerscarousel',
+            name='last_computed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0048_offerscarousel_last_computed'),
+        ('vendor', '0002_vendor_email'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cartorderitem',
+            index=models.Index(fields=['order', 'product', 'total'], name='store_item_order_product_idx'),
+        ),
+    ]
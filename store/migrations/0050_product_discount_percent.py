@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-18 22:11
+
+from django.db import migrations, models
+
+
+def backfill_discount_percent(apps, schema_editor):
+    # Same rule as Product.compute_discount_percent, in one UPDATE. 100.0
+    # keeps SQLite, which stores whole-number prices as INTEGER, from
+    # dividing integers
+    Product = apps.get_model('store', 'Product')
+    Product.objects.filter(old_price__gt=0).filter(old_price__gt=models.F('price')).update(
+        discount_percent=models.ExpressionWrapper(
+            (models.F('old_price') - models.F('price')) * 100.0 / models.F('old_price'),
+            output_field=models.DecimalField(max_digits=5, decimal_places=2),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0049_order_item_ranking_index'),
+        ('vendor', '0002_vendor_email'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='discount_percent',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=5),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['status', '-discount_percent'], name='store_product_discount_idx'),
+        ),
+        migrations.RunPython(backfill_discount_percent, migrations.RunPython.noop),
+    ]
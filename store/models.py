@@ -1,12 +1,15 @@
 from django.db import models
+from django.db.models import Q
 from vendor.models import Vendor
 from userauths.models import User, Profile
 from shortuuid.django_fields import ShortUUIDField
 from django.utils.text import slugify
+from django.utils import timezone
 from django.dispatch import receiver
 from django.db.models.signals import post_save
 from django.core.exceptions import ValidationError
 from datetime import datetime
+from decimal import Decimal
 import logging
 
 # Set up logging
@@ -16,6 +19,7 @@ logger = logging.getLogger(__name__)
 class Category(models.Model):
     title = models.CharField(max_length=100)
     image = models.FileField(upload_to="category", default="category.jpg", null=True, blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     active = models.BooleanField(default=True)
     slug = models.SlugField(unique=True)
 
@@ -37,10 +41,13 @@ class Product(models.Model):
 
     title = models.CharField(max_length=100)
     image = models.FileField(upload_to="products", default="product.jpg", null=True, blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     description = models.TextField(null=True, blank=True)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, blank=True, null=True)
     price = models.DecimalField(decimal_places=2, max_digits=12, default=0.00)
     old_price = models.DecimalField(decimal_places=2, max_digits=12, default=0.00)
+    # (old_price - price) / old_price in %, kept in sync by save()
+    discount_percent = models.DecimalField(decimal_places=2, max_digits=5, default=0, editable=False)
     shipping_ammount = models.DecimalField(decimal_places=2, max_digits=12, default=0.00)
     max_cart_limit = models.PositiveIntegerField(default=10)
     stock_qty = models.PositiveIntegerField(default=1)
@@ -55,16 +62,34 @@ class Product(models.Model):
     slug = models.SlugField(unique=True)
     date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Catalog listing: status='published' AND in_stock
+            models.Index(fields=['status', 'in_stock'], name='store_product_status_stock_idx'),
+            # Most viewed: status='published' ORDER BY views DESC
+            models.Index(fields=['status', '-views'], name='store_product_status_views_idx'),
+            # Special offers and ?ordering=-discount: status='published' ORDER BY discount_percent DESC
+            models.Index(fields=['status', '-discount_percent'], name='store_product_discount_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.title)
         self.in_stock = self.stock_qty > 0
         self.rating = self.product_rating()
+        self.discount_percent = self.compute_discount_percent()
         super().save(*args, **kwargs)
 
     def __str__(self):
         return self.title
 
+    def compute_discount_percent(self):
+        old_price = Decimal(str(self.old_price or 0))
+        price = Decimal(str(self.price or 0))
+        if old_price <= 0 or price >= old_price:
+            return Decimal('0')
+        return ((old_price - price) * 100 / old_price).quantize(Decimal('0.01'))
+
     def product_rating(self):
         product_rating = Review.objects.filter(product=self).aggregate(avg_rating=models.Avg("rating"))
         return product_rating['avg_rating'] or 0
@@ -139,6 +164,7 @@ class Color(models.Model):
     name = models.CharField(max_length=1000)
     color_code = models.CharField(max_length=1000)
     image = models.FileField(upload_to="colors", default="color.jpg", null=True, blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     stock_qty = models.PositiveIntegerField(default=0)
     in_stock = models.BooleanField(default=True)
 
@@ -177,6 +203,7 @@ class Gallery(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="gallery")
     color = models.ForeignKey(Color, on_delete=models.CASCADE, related_name='galleries', null=True, blank=True)
     image = models.FileField(upload_to="products", default="product.jpg")
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     active = models.BooleanField(default=True)
     gid = ShortUUIDField(unique=True, length=10, alphabet="abcdefghijklmnp12345")
 
@@ -213,7 +240,11 @@ class Cart(models.Model):
     date = models.DateTimeField(auto_now_add=True)
 
     class Meta:
+        # The unique index also serves plain cart_id lookups (leading column)
         unique_together = ('cart_id', 'product', 'color', 'size')
+        indexes = [
+            models.Index(fields=['cart_id', 'user'], name='store_cart_cart_id_user_idx'),
+        ]
 
     def __str__(self):
         return f"{self.cart_id} - {self.product.title} - {self.color} - {self.size}"
@@ -265,9 +296,34 @@ class CartOrder(models.Model):
     state = models.CharField(max_length=1000, null=True, blank=True)
     country = models.CharField(max_length=1000, null=True, blank=True)
     stripe_sesion_id = models.CharField(max_length=1000, blank=True, null=True)
+    # Open Checkout session, reused while it's valid for the same line items
+    stripe_session_url = models.URLField(max_length=1000, blank=True, null=True)
+    stripe_session_expires_at = models.DateTimeField(blank=True, null=True)
+    stripe_session_hash = models.CharField(max_length=64, blank=True, null=True)
     payment_method = models.CharField(max_length=100, default="stripe", blank=True, null=True)
     oid = ShortUUIDField(unique=True, length=10, alphabet="abcdefghijklmnp12345")
     date = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Set once by reduce_stock_for_whatsapp_order, never reduce twice
+    stock_reduced_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Cursor for the admin live feed: (updated_at, id) > (since, since_id)
+            models.Index(fields=['updated_at', 'id'], name='store_order_updated_id_idx'),
+            # Dashboards and feeds: date ranges, optionally narrowed by status
+            models.Index(fields=['-date'], name='store_order_date_idx'),
+            models.Index(fields=['payment_status', '-date'], name='store_order_pay_status_idx'),
+            models.Index(fields=['payment_method', 'payment_status'], name='store_order_pay_method_idx'),
+            # Customer order history: buyer=... ORDER BY date DESC
+            models.Index(fields=['buyer', '-date'], name='store_order_buyer_date_idx'),
+            # WhatsApp counters only ever look at a small slice of the table
+            models.Index(
+                fields=['-date'],
+                condition=Q(payment_method='whatsapp'),
+                name='store_order_whatsapp_date_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.oid
@@ -285,85 +341,30 @@ class CartOrder(models.Model):
                 raise ValidationError(f"Error updating stock for {item.product.title}: {str(e)}")
     
     def reduce_stock_for_whatsapp_order(self):
-        """Reduce stock for WhatsApp orders when payment is confirmed by admin"""
-        print("=" * 50)
-        print(f"DEBUG: reduce_stock_for_whatsapp_order called for order {self.oid}")
-        print(f"DEBUG: payment_method: {self.payment_method}")
-        print(f"DEBUG: payment_status: {self.payment_status}")
-        print(f"DEBUG: Method called at: {datetime.now()}")
-        print("=" * 50)
-        
-        # Also log to file
+        """
+        Reduce stock for WhatsApp orders when payment is confirmed by admin.
+
+        Idempotent: the first run stamps stock_reduced_at, later calls return
+        False without touching stock. See store.stock.reduce_stock_for_orders.
+        """
+        from store.stock import reduce_stock_for_orders
+
         logger.info(f"reduce_stock_for_whatsapp_order called for order {self.oid}")
-        logger.info(f"payment_method: {self.payment_method}, payment_status: {self.payment_status}")
-        
-        if self.payment_method == 'whatsapp' and self.payment_status == 'paid':
-            print(f"DEBUG: Conditions met, proceeding with stock reduction")
-            print(f"DEBUG: Order items count: {self.orderitem.count()}")
-            
-            for item in self.orderitem.all():
-                try:
-                    print(f"DEBUG: Processing item: {item.product.title}, qty: {item.qty}")
-                    print(f"DEBUG: Current product stock: {item.product.stock_qty}")
-                    print(f"DEBUG: Item color: '{item.color}' (type: {type(item.color)})")
-                    print(f"DEBUG: Item size: '{item.size}' (type: {type(item.size)})")
-                    print(f"DEBUG: Item ID: {item.id}")
-                    
-                    # Reduce product stock
-                    product = item.product
-                    old_stock = product.stock_qty
-                    product.stock_qty -= item.qty
-                    product.save()
-                    
-                    print(f"DEBUG: Product stock reduced from {old_stock} to {product.stock_qty}")
-                    print(f"DEBUG: Product saved successfully: {product.title}")
-                    
-                    # Verify the stock was actually reduced
-                    product.refresh_from_db()
-                    print(f"DEBUG: Product stock after refresh: {product.stock_qty}")
-                    
-                    # Reduce color stock if specified
-                    print(f"DEBUG: Checking color: '{item.color}' (type: {type(item.color)})")
-                    if item.color and item.color != "No Color" and item.color.strip():
-                        print(f"DEBUG: Looking for color with name: '{item.color}'")
-                        color = product.colors.filter(name=item.color).first()
-                        if color:
-                            old_color_stock = color.stock_qty
-                            color.stock_qty -= item.qty
-                            color.save()
-                            print(f"DEBUG: Color '{item.color}' stock reduced from {old_color_stock} to {color.stock_qty}")
-                        else:
-                            print(f"DEBUG: Color '{item.color}' not found for product {product.title}")
-                            print(f"DEBUG: Available colors for this product: {[c.name for c in product.colors.all()]}")
-                    else:
-                        print(f"DEBUG: No color specified or color is 'No Color'")
-                    
-                    # Reduce size stock if specified
-                    print(f"DEBUG: Checking size: '{item.size}' (type: {type(item.size)})")
-                    if item.size and item.size != "No Size" and item.size.strip():
-                        print(f"DEBUG: Looking for size with name: '{item.size}'")
-                        size = product.sizes.filter(name=item.size).first()
-                        if size:
-                            old_size_stock = size.stock_qty
-                            size.stock_qty -= item.qty
-                            size.save()
-                            print(f"DEBUG: Size '{item.size}' stock reduced from {old_size_stock} to {size.stock_qty}")
-                        else:
-                            print(f"DEBUG: Size '{item.size}' not found for product {product.title}")
-                            print(f"DEBUG: Available sizes for this product: {[s.name for s in product.sizes.all()]}")
-                    else:
-                        print(f"DEBUG: No size specified or size is 'No Size'")
-                            
-                except Exception as e:
-                    print(f"DEBUG: Error reducing stock for item {item.product.title}: {e}")
-                    raise ValidationError(f"Error reducing stock for {item.product.title}: {str(e)}")
-            
-            print(f"DEBUG: Stock reduction completed successfully for order {self.oid}")
-            return True
-        else:
-            error_msg = f"This method can only be used for paid WhatsApp orders. Current: method={self.payment_method}, status={self.payment_status}"
-            print(f"DEBUG: {error_msg}")
-            raise ValidationError(error_msg)
+
+        if self.payment_method != 'whatsapp' or self.payment_status != 'paid':
+            raise ValidationError(
+                f"This method can only be used for paid WhatsApp orders. "
+                f"Current: method={self.payment_method}, status={self.payment_status}"
+            )
+
+        reduced, failed = reduce_stock_for_orders([self])
+        if self.oid in failed:
+            raise ValidationError(f"Error reducing stock: {failed[self.oid]}")
+
+        self.stock_reduced_at = CartOrder.objects.filter(pk=self.pk).values_list(
+            'stock_reduced_at', flat=True
+        ).first()
+        return bool(reduced)
 
 
 class CartOrderItem(models.Model):
@@ -389,6 +390,13 @@ class CartOrderItem(models.Model):
     class Meta:
         verbose_name_plural = "Cart Order Items"
         ordering = ["-date"]
+        indexes = [
+            # Coupons and vendor notifications: order=... AND vendor=...
+            models.Index(fields=['order', 'vendor'], name='store_item_order_vendor_idx'),
+            # Sales rankings (store/rankings.py): items of the window's paid
+            # orders, grouped by product, read from the index alone
+            models.Index(fields=['order', 'product', 'total'], name='store_item_order_product_idx'),
+        ]
 
     def __str__(self):
         return self.oid
@@ -432,6 +440,14 @@ class Review(models.Model):
 
     class Meta:
         verbose_name_plural = "Reviews & Ratings"
+        indexes = [
+            # Public review list only reads approved reviews
+            models.Index(
+                fields=['product'],
+                condition=Q(active=True),
+                name='store_review_active_idx',
+            ),
+        ]
 
     def profile(self):
         return Profile.objects.get(user=self.user)
@@ -460,6 +476,16 @@ class Notification(models.Model):
     seen = models.BooleanField(default=False)
     date = models.DateField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Customer notifications: user=... AND seen=False
+            models.Index(
+                fields=['user'],
+                condition=Q(seen=False),
+                name='store_notif_user_unseen_idx',
+            ),
+        ]
+
     def __str__(self):
         if self.order:
             return self.order.oid
@@ -467,6 +493,118 @@ class Notification(models.Model):
             return f"Notification - {self.pk}"
 
 
+class EmailOutbox(models.Model):
+    """
+    Emails queued by the payment flow, sent later by the outbox worker
+    (``python manage.py run_outbox_worker``).
+    """
+    KIND = (
+        ("customer_order_confirmation", "Customer Order Confirmation"),
+        ("vendor_sale", "Vendor Sale"),
+    )
+
+    STATUS = (
+        ("pending", "Pending"),
+        ("sending", "Sending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    )
+
+    kind = models.CharField(max_length=50, choices=KIND)
+    order = models.ForeignKey(CartOrder, on_delete=models.CASCADE, related_name='outbox_emails')
+    vendor = models.ForeignKey(Vendor, on_delete=models.SET_NULL, null=True, blank=True)
+    to_email = models.CharField(max_length=1000)
+    subject = models.CharField(max_length=255)
+    # kind:order:vendor - a second payment confirmation can't queue the same email twice
+    dedup_key = models.CharField(max_length=255, unique=True)
+    status = models.CharField(max_length=20, choices=STATUS, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "Email Outbox"
+        indexes = [
+            # Worker poll: status='pending' AND available_at <= now
+            models.Index(
+                fields=['available_at'],
+                condition=Q(status='pending'),
+                name='store_outbox_pending_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} - {self.to_email} ({self.status})"
+
+
+class StripeEvent(models.Model):
+    """
+    Stripe webhook events, stored once per event id by the webhook view and
+    processed by ``python manage.py process_stripe_events``.
+    """
+    STATUS = (
+        ("pending", "Pending"),
+        ("processing", "Processing"),
+        ("processed", "Processed"),
+        ("failed", "Failed"),
+    )
+
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    # Checkout session id of checkout.session.* events
+    session_id = models.CharField(max_length=255, null=True, blank=True, db_index=True)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Worker poll: status='pending' AND available_at <= now
+            models.Index(
+                fields=['available_at'],
+                condition=Q(status='pending'),
+                name='store_stripe_event_pending_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.type} - {self.event_id} ({self.status})"
+
+
+class ScheduledJob(models.Model):
+    """
+    Run state and lease of a periodic job of ``store/scheduler.py``; the
+    lease makes sure one scheduler at a time runs each job.
+    """
+    STATUS = (
+        ("ok", "OK"),
+        ("failed", "Failed"),
+    )
+
+    name = models.CharField(max_length=100, unique=True)
+    next_run_at = models.DateTimeField(default=timezone.now)
+    # Scheduler holding the lease (host:pid:id) and when it lapses
+    locked_by = models.CharField(max_length=255, blank=True, default="")
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_started_at = models.DateTimeField(null=True, blank=True)
+    last_finished_at = models.DateTimeField(null=True, blank=True)
+    last_status = models.CharField(max_length=20, choices=STATUS, blank=True, default="")
+    last_error = models.TextField(null=True, blank=True)
+    runs = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
 class Coupon(models.Model):
     vendor = models.ForeignKey(Vendor, on_delete=models.CASCADE)
     user_by = models.ManyToManyField(User, blank=True)
@@ -498,6 +636,7 @@ class Tax(models.Model):
 
 class CarouselImage(models.Model):
     image = models.ImageField(upload_to='carousel/')
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     caption = models.CharField(max_length=255, blank=True)
     is_active = models.BooleanField(default=True)
 
@@ -509,6 +648,9 @@ class OffersCarousel(models.Model):
     title = models.CharField(max_length=255, blank=True, null=True)
     products = models.ManyToManyField(Product, related_name='carousels')
     is_active = models.BooleanField(default=True)
+    # Set by CarouselAutomation.update_offers_carousel
+    last_computed_at = models.DateTimeField(null=True, blank=True, editable=False)
+    data_signature = models.CharField(max_length=64, blank=True, editable=False)
 
     def __str__(self):
         return self.title or f"Carousel {self.id}"
@@ -517,9 +659,12 @@ class OffersCarousel(models.Model):
 class Banner(models.Model):
     title = models.CharField(max_length=255, blank=True, null=True)
     image = models.ImageField(upload_to='banners/')
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     link = models.URLField(max_length=1000, blank=True, null=True)
     is_active = models.BooleanField(default=True)
     date = models.DateTimeField(auto_now_add=True)
+    # Hash of the inputs of an automated banner image (CarouselAutomation)
+    render_key = models.CharField(max_length=64, blank=True, editable=False)
 
     def __str__(self):
         return self.title or f"Banner {self.id}"
\ No newline at end of file
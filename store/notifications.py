@@ -0,0 +1,67 @@
+"""
+Notifications created when orders are paid.
+
+Both payment confirmation paths (Stripe's PaymentSuccessView and the admin
+marking a WhatsApp order as paid) go through ``notify_orders_paid``, which
+writes every row with a single ``bulk_create``: one for the buyer and one
+per vendor of each order, however many items the vendor sold.
+"""
+
+import logging
+
+from store.models import CartOrderItem, Notification
+
+logger = logging.getLogger(__name__)
+
+
+def build_order_notifications(orders):
+    """
+    Return the unsaved Notification rows for ``orders``.
+
+    Vendors are notified once per order, pointing at their first item.
+    Recipients that already have a notification for the order are skipped,
+    so confirming a payment twice doesn't notify twice.
+    """
+    orders = [order for order in orders if order.pk]
+    if not orders:
+        return []
+    order_ids = [order.pk for order in orders]
+
+    existing = set(
+        Notification.objects.filter(order_id__in=order_ids)
+        .values_list('order_id', 'user_id', 'vendor_id')
+    )
+
+    rows = []
+    for order in orders:
+        if order.buyer_id and (order.pk, order.buyer_id, None) not in existing:
+            rows.append(Notification(user_id=order.buyer_id, order_id=order.pk))
+
+    seen = set()
+    items = (
+        CartOrderItem.objects.filter(order_id__in=order_ids, vendor__isnull=False)
+        .order_by('order_id', 'id')
+        .values_list('order_id', 'id', 'vendor_id')
+    )
+    for order_id, item_id, vendor_id in items:
+        key = (order_id, None, vendor_id)
+        if key in seen or key in existing:
+            continue
+        seen.add(key)
+        rows.append(Notification(vendor_id=vendor_id, order_id=order_id, order_item_id=item_id))
+
+    return rows
+
+
+def notify_orders_paid(orders):
+    """Create the buyer and vendor notifications of paid ``orders`` in one query"""
+    rows = build_order_notifications(orders)
+    if rows:
+        Notification.objects.bulk_create(rows)
+    logger.info(f"Created {len(rows)} payment notifications")
+    return len(rows)
+
+
+def notify_order_paid(order):
+    """Create the buyer and vendor notifications of a single paid order"""
+    return notify_orders_paid([order])
@@ -0,0 +1,207 @@
+"""
+Email outbox for the payment flow.
+
+The request that confirms a payment only writes ``EmailOutbox`` rows, in the
+same transaction that marks the order paid. ``drain_outbox`` renders and
+sends them later from the worker (``python manage.py run_outbox_worker``),
+so payment confirmation never waits on the mail server.
+
+Vendors get one email per order listing all of their items, and every batch
+is sent over a single SMTP connection.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from store.models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF_SECONDS = 60
+# A row left in 'sending' this long belongs to a worker that died mid-batch
+SENDING_TIMEOUT = timedelta(minutes=10)
+
+TEMPLATES = {
+    'customer_order_confirmation': (
+        "email/customer_order_confirmation.txt",
+        "email/customer_order_confirmation.html",
+    ),
+    'vendor_sale': (
+        "email/vendor_sale.txt",
+        "email/vendor_sale.html",
+    ),
+}
+
+SUBJECTS = {
+    'customer_order_confirmation': "Order Placed Successfully",
+    'vendor_sale': "New Sale!",
+}
+
+
+def _dedup_key(kind, order, vendor=None):
+    return f"{kind}:{order.oid}:{vendor.id if vendor else ''}"
+
+
+def enqueue_order_emails(order):
+    """
+    Queue the buyer confirmation and one sale email per vendor of ``order``.
+
+    Call it inside the transaction that marks the order paid. Emails already
+    queued for the order are skipped, so calling it twice is harmless.
+    """
+    rows = []
+
+    if order.buyer and order.buyer.email:
+        kind = 'customer_order_confirmation'
+        rows.append(EmailOutbox(
+            kind=kind,
+            order=order,
+            to_email=order.buyer.email,
+            subject=SUBJECTS[kind],
+            dedup_key=_dedup_key(kind, order),
+        ))
+
+    vendors = {}
+    for item in order.orderitem.all():
+        if item.vendor:
+            vendors.setdefault(item.vendor_id, item.vendor)
+
+    kind = 'vendor_sale'
+    for vendor in vendors.values():
+        if not vendor.user or not vendor.user.email:
+            continue
+        rows.append(EmailOutbox(
+            kind=kind,
+            order=order,
+            vendor=vendor,
+            to_email=vendor.user.email,
+            subject=SUBJECTS[kind],
+            dedup_key=_dedup_key(kind, order, vendor),
+        ))
+
+    EmailOutbox.objects.bulk_create(rows, ignore_conflicts=True)
+    return len(rows)
+
+
+def build_message(entry, connection=None):
+    """Render an outbox row into an EmailMultiAlternatives"""
+    order = entry.order
+    items = order.orderitem.select_related('product')
+    if entry.vendor_id:
+        items = items.filter(vendor_id=entry.vendor_id)
+    items = list(items)
+
+    context = {
+        'order': order,
+        'order_items': items,
+        'order_item': items[0] if items else None,
+        'vendor': entry.vendor,
+        'user': entry.vendor.user if entry.vendor else order.buyer,
+    }
+    text_template, html_template = TEMPLATES[entry.kind]
+
+    msg = EmailMultiAlternatives(
+        subject=entry.subject,
+        from_email=getattr(settings, 'FROM_EMAIL', settings.DEFAULT_FROM_EMAIL),
+        to=[entry.to_email],
+        body=render_to_string(text_template, context),
+        connection=connection,
+    )
+    msg.attach_alternative(render_to_string(html_template, context), "text/html")
+    return msg
+
+
+def claim_batch(limit=BATCH_SIZE):
+    """
+    Move up to ``limit`` due rows to 'sending' and return them.
+
+    On PostgreSQL concurrent workers skip each other's locked rows; rows
+    stuck in 'sending' past ``SENDING_TIMEOUT`` are picked up again.
+    """
+    now = timezone.now()
+    due = (
+        Q(status='pending', available_at__lte=now) |
+        Q(status='sending', available_at__lte=now - SENDING_TIMEOUT)
+    )
+    with transaction.atomic():
+        ids = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(due)
+            .order_by('available_at', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        EmailOutbox.objects.filter(id__in=ids).update(status='sending', available_at=now)
+
+    return list(
+        EmailOutbox.objects.filter(id__in=ids)
+        .select_related('order', 'order__buyer', 'vendor', 'vendor__user')
+        .order_by('id')
+    )
+
+
+def _mark_failed(entry, error):
+    entry.attempts += 1
+    entry.last_error = str(error)
+    if entry.attempts >= MAX_ATTEMPTS:
+        entry.status = 'failed'
+    else:
+        entry.status = 'pending'
+        entry.available_at = timezone.now() + timedelta(
+            seconds=RETRY_BACKOFF_SECONDS * 2 ** (entry.attempts - 1)
+        )
+    entry.save(update_fields=['attempts', 'last_error', 'status', 'available_at'])
+    logger.warning(f"Outbox email {entry.id} failed (attempt {entry.attempts}): {error}")
+
+
+def drain_outbox(limit=BATCH_SIZE):
+    """
+    Send one batch of queued emails over a single SMTP connection.
+
+    Returns a (sent, failed) tuple. A failed email goes back to 'pending'
+    with an exponential backoff, and to 'failed' after ``MAX_ATTEMPTS``.
+    """
+    entries = claim_batch(limit)
+    if not entries:
+        return 0, 0
+
+    sent = failed = 0
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        for entry in entries:
+            _mark_failed(entry, e)
+        return 0, len(entries)
+
+    try:
+        for entry in entries:
+            try:
+                # The connection is already open, so send_messages reuses it
+                connection.send_messages([build_message(entry, connection)])
+            except Exception as e:
+                _mark_failed(entry, e)
+                failed += 1
+                continue
+
+            entry.attempts += 1
+            entry.status = 'sent'
+            entry.sent_at = timezone.now()
+            entry.last_error = None
+            entry.save(update_fields=['attempts', 'status', 'sent_at', 'last_error'])
+            sent += 1
+    finally:
+        connection.close()
+
+    logger.info(f"Outbox batch done: {sent} sent, {failed} failed")
+    return sent, failed
@@ -0,0 +1,151 @@
+"""
+Configured HTTP client for outbound Stripe calls.
+
+The stripe library's defaults are an 80 second timeout, no retries and a
+fresh session per thread. ``configure_stripe`` installs a ``GatewayClient``
+instead:
+
+- one keep-alive connection pool per process (``requests.Session`` with a
+  sized ``HTTPAdapter``), so gunicorn workers reuse TLS connections,
+- separate connect/read timeouts well below the gunicorn timeout,
+- ``stripe.max_network_retries`` bounded retries; the library applies
+  jittered exponential backoff and idempotency keys to POSTs,
+- a circuit breaker that fails fast while Stripe is degraded instead of
+  holding a worker for every doomed request.
+
+All limits come from settings (STRIPE_CONNECT_TIMEOUT, STRIPE_READ_TIMEOUT,
+STRIPE_MAX_NETWORK_RETRIES, STRIPE_CIRCUIT_FAILURE_THRESHOLD,
+STRIPE_CIRCUIT_RESET_SECONDS, STRIPE_POOL_SIZE).
+"""
+
+import logging
+import threading
+import time
+
+import requests
+import stripe
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(stripe.error.APIConnectionError):
+    """Raised without calling Stripe while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after ``failure_threshold`` consecutive failures.
+    Open -> half-open after ``reset_timeout`` seconds, letting one trial
+    call through; its result closes or re-opens the circuit.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow_request(self):
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info("Payment gateway circuit closed")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_in_flight or (self.opened_at is None and self.failures >= self.failure_threshold):
+                logger.warning(f"Payment gateway circuit opened after {self.failures} failures")
+                self.opened_at = self.clock()
+            self.trial_in_flight = False
+
+
+class GatewayClient(stripe.http_client.RequestsClient):
+    """stripe RequestsClient with a shared connection pool and a circuit breaker"""
+
+    def __init__(self, connect_timeout=3.0, read_timeout=10.0, pool_size=10, breaker=None, **kwargs):
+        session = requests.Session()
+        # Retries are left to the stripe library, which adds idempotency keys
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+
+        super().__init__(timeout=(connect_timeout, read_timeout), session=session, **kwargs)
+        self.breaker = breaker or CircuitBreaker()
+
+    def request_with_retries(self, method, url, headers, post_data=None, **kwargs):
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(
+                "Payment gateway temporarily unavailable, please try again shortly.",
+                should_retry=False
+            )
+
+        try:
+            response = super().request_with_retries(method, url, headers, post_data, **kwargs)
+        except stripe.error.APIConnectionError:
+            self.breaker.record_failure()
+            raise
+
+        # 5xx and 429 after the retry budget mean Stripe is struggling;
+        # 4xx are our own request errors and don't count
+        status_code = response[1]
+        if status_code >= 500 or status_code == 429:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def close(self):
+        self._session.close()
+
+
+def build_gateway_client(**overrides):
+    """Build a GatewayClient from settings, ``overrides`` win"""
+    options = {
+        'connect_timeout': float(getattr(settings, 'STRIPE_CONNECT_TIMEOUT', 3.0)),
+        'read_timeout': float(getattr(settings, 'STRIPE_READ_TIMEOUT', 10.0)),
+        'pool_size': int(getattr(settings, 'STRIPE_POOL_SIZE', 10)),
+        'breaker': CircuitBreaker(
+            failure_threshold=int(getattr(settings, 'STRIPE_CIRCUIT_FAILURE_THRESHOLD', 5)),
+            reset_timeout=float(getattr(settings, 'STRIPE_CIRCUIT_RESET_SECONDS', 30)),
+        ),
+    }
+    options.update(overrides)
+    return GatewayClient(**options)
+
+
+def configure_stripe():
+    """Point the global stripe module at the configured gateway client"""
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    stripe.max_network_retries = int(getattr(settings, 'STRIPE_MAX_NETWORK_RETRIES', 2))
+    stripe.default_http_client = build_gateway_client()
+    return stripe.default_http_client
@@ -0,0 +1,277 @@
+"""
+Payment confirmation and Stripe webhook processing.
+
+The webhook view only verifies the signature and stores the event
+(``record_event``). ``drain_stripe_events`` processes stored events from
+the worker (``python manage.py process_stripe_events``), so Stripe gets its
+2xx immediately and the same event delivered twice is handled once.
+
+``confirm_order_paid`` is the single place an order becomes paid: it locks
+the order, sets the status and creates the notifications and queued emails
+in one transaction.
+
+``get_or_create_checkout_session`` hands out one Checkout session per order
+and line items, so repeated clicks on "Pay" don't create new sessions.
+"""
+
+import hashlib
+import json
+import logging
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from store.models import CartOrder, StripeEvent
+from store.notifications import notify_order_paid
+from store.outbox import enqueue_order_emails
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF_SECONDS = 30
+# A row left in 'processing' this long belongs to a worker that died
+PROCESSING_TIMEOUT = timedelta(minutes=10)
+
+# Checkout sessions: reuse only if the buyer still has time to pay
+CHECKOUT_REUSE_MARGIN = timedelta(minutes=5)
+# Sessions created in the same window share their idempotency key and
+# expire one to two windows later (Stripe allows 30 minutes to 24 hours)
+CHECKOUT_WINDOW_SECONDS = 60 * 60
+CHECKOUT_SESSION_FIELDS = [
+    'stripe_sesion_id', 'stripe_session_url', 'stripe_session_expires_at', 'stripe_session_hash'
+]
+
+PAID_EVENTS = (
+    'checkout.session.completed',
+    'checkout.session.async_payment_succeeded',
+)
+CLOSED_SESSION_EVENTS = (
+    'checkout.session.expired',
+    'checkout.session.async_payment_failed',
+)
+
+
+def confirm_order_paid(order):
+    """
+    Mark ``order`` as paid and notify the buyer and vendors.
+
+    Returns False when the order was already paid, so concurrent or
+    repeated confirmations notify only once.
+    """
+    with transaction.atomic():
+        current_status = CartOrder.objects.select_for_update().filter(
+            pk=order.pk
+        ).values_list('payment_status', flat=True).first()
+
+        if current_status == "paid":
+            return False
+
+        order.payment_status = "paid"
+        order.save()
+
+        # Notifications and queued emails commit together with the status
+        notify_order_paid(order)
+        enqueue_order_emails(order)
+
+    logger.info(f"Order {order.oid} confirmed as paid")
+    return True
+
+
+def record_event(event):
+    """
+    Store a verified webhook event. Returns False if it was already stored.
+    """
+    session_id = None
+    if event['type'].startswith('checkout.session.'):
+        session_id = event['data']['object'].get('id')
+
+    _, created = StripeEvent.objects.get_or_create(
+        event_id=event['id'],
+        defaults={
+            'type': event['type'],
+            'session_id': session_id,
+            'payload': event,
+        }
+    )
+    return created
+
+
+def handle_event(event):
+    """Apply one Stripe event payload to the local orders"""
+    event_type = event['type']
+    session = event['data']['object']
+
+    if event_type not in PAID_EVENTS + CLOSED_SESSION_EVENTS:
+        logger.info(f"Ignoring Stripe event {event['id']} of type {event_type}")
+        return
+
+    order_oid = (session.get('metadata') or {}).get('order_oid')
+    if not order_oid:
+        logger.warning(f"Stripe event {event['id']} has no order_oid in its metadata")
+        return
+
+    order = CartOrder.objects.select_related('buyer').get(oid=order_oid)
+
+    if event_type in PAID_EVENTS:
+        # checkout.session.completed also fires for delayed payment methods
+        # that haven't settled yet; async_payment_succeeded follows for those
+        if session.get('payment_status') == 'paid':
+            confirm_order_paid(order)
+        return
+
+    # The session can no longer be paid, so it must not be offered again
+    CartOrder.objects.filter(pk=order.pk, stripe_sesion_id=session.get('id')).exclude(
+        payment_status='paid'
+    ).update(
+        stripe_sesion_id=None,
+        stripe_session_url=None,
+        stripe_session_expires_at=None,
+        stripe_session_hash=None,
+        updated_at=timezone.now()
+    )
+
+
+def _process(entry):
+    try:
+        handle_event(entry.payload)
+    except Exception as e:
+        entry.attempts += 1
+        entry.last_error = str(e)
+        if entry.attempts >= MAX_ATTEMPTS:
+            entry.status = 'failed'
+        else:
+            entry.status = 'pending'
+            entry.available_at = timezone.now() + timedelta(
+                seconds=RETRY_BACKOFF_SECONDS * 2 ** (entry.attempts - 1)
+            )
+        entry.save(update_fields=['attempts', 'last_error', 'status', 'available_at'])
+        logger.warning(f"Stripe event {entry.event_id} failed (attempt {entry.attempts}): {e}")
+        return False
+
+    entry.attempts += 1
+    entry.status = 'processed'
+    entry.processed_at = timezone.now()
+    entry.last_error = None
+    entry.save(update_fields=['attempts', 'status', 'processed_at', 'last_error'])
+    return True
+
+
+def process_session_events(session_id):
+    """
+    Process the pending events of one checkout session right away.
+
+    Used by the browser callback when it arrives before the worker got to
+    the webhook; each event is claimed so the worker won't run it again.
+    """
+    processed = 0
+    pending = StripeEvent.objects.filter(
+        session_id=session_id, status='pending'
+    ).order_by('id')
+    for entry in pending:
+        claimed = StripeEvent.objects.filter(pk=entry.pk, status='pending').update(
+            status='processing', available_at=timezone.now()
+        )
+        if claimed and _process(entry):
+            processed += 1
+    return processed
+
+
+def drain_stripe_events(limit=BATCH_SIZE):
+    """
+    Process one batch of stored webhook events.
+
+    Returns a (processed, failed) tuple. Failed events are retried with an
+    exponential backoff and given up after ``MAX_ATTEMPTS``.
+    """
+    now = timezone.now()
+    due = (
+        Q(status='pending', available_at__lte=now) |
+        Q(status='processing', available_at__lte=now - PROCESSING_TIMEOUT)
+    )
+    with transaction.atomic():
+        ids = list(
+            StripeEvent.objects.select_for_update(skip_locked=True)
+            .filter(due)
+            .order_by('available_at', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+        if not ids:
+            return 0, 0
+        StripeEvent.objects.filter(id__in=ids).update(status='processing', available_at=now)
+
+    processed = failed = 0
+    for entry in StripeEvent.objects.filter(id__in=ids).order_by('id'):
+        if _process(entry):
+            processed += 1
+        else:
+            failed += 1
+
+    logger.info(f"Stripe events batch done: {processed} processed, {failed} failed")
+    return processed, failed
+
+
+def checkout_line_items_hash(line_items, customer_email):
+    """Fingerprint of what a Checkout session charges for"""
+    data = json.dumps({'line_items': line_items, 'email': customer_email}, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def reusable_checkout_session(order, line_hash):
+    """Return (session_id, url) of the order's open session if it can be reused"""
+    if not (order.stripe_sesion_id and order.stripe_session_url and order.stripe_session_expires_at):
+        return None
+    if order.stripe_session_hash != line_hash:
+        return None
+    if order.stripe_session_expires_at <= timezone.now() + CHECKOUT_REUSE_MARGIN:
+        return None
+    return order.stripe_sesion_id, order.stripe_session_url
+
+
+def get_or_create_checkout_session(order, line_items, create_session):
+    """
+    Return (session_id, url, created) for ``order``.
+
+    An unexpired session for the same line items is reused. Otherwise the
+    order row is locked (SELECT ... FOR UPDATE) and, if no other request
+    stored a session while this one waited for the lock,
+    ``create_session(idempotency_key=..., expires_at=...)`` is called.
+
+    The idempotency key is the order, the line items and the current
+    ``CHECKOUT_WINDOW_SECONDS`` window, and ``expires_at`` is derived from
+    the window: a request whose response was lost, or one that wasn't
+    serialized by the lock (SQLite has no row locks), gets the same
+    session back from Stripe rather than a second one.
+    """
+    line_hash = checkout_line_items_hash(line_items, order.email)
+    reusable = reusable_checkout_session(order, line_hash)
+    if reusable:
+        return reusable + (False,)
+
+    with transaction.atomic():
+        locked = CartOrder.objects.select_for_update().only('pk', *CHECKOUT_SESSION_FIELDS).get(pk=order.pk)
+        for field in CHECKOUT_SESSION_FIELDS:
+            setattr(order, field, getattr(locked, field))
+
+        # The previous lock holder may have stored a session meanwhile
+        reusable = reusable_checkout_session(order, line_hash)
+        if reusable:
+            return reusable + (False,)
+
+        window = int(time.time()) // CHECKOUT_WINDOW_SECONDS
+        session = create_session(
+            idempotency_key=f"{order.oid}:{line_hash}:{window}",
+            expires_at=(window + 2) * CHECKOUT_WINDOW_SECONDS,
+        )
+
+        order.stripe_sesion_id = session.id
+        order.stripe_session_url = session.url
+        order.stripe_session_expires_at = datetime.fromtimestamp(session.expires_at, tz=dt_timezone.utc)
+        order.stripe_session_hash = line_hash
+        CartOrder.objects.filter(pk=order.pk).update(
+            **{field: getattr(order, field) for field in CHECKOUT_SESSION_FIELDS}
+        )
+    return session.id, session.url, True
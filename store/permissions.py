@@ -1,15 +1,49 @@
+from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group, Permission
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth.models import Permission
 from django.contrib.auth.decorators import user_passes_test
 from django.core.exceptions import PermissionDenied
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
 from django.shortcuts import redirect
 from django.contrib import messages
 from functools import wraps
 
+def get_group_names(user):
+    """
+    Names of the groups ``user`` belongs to, as a frozenset.
+
+    Resolved at most once per request: the names are stored on the user
+    object, which lives for one request. They are deliberately not put in
+    the cache, which is per process (LocMemCache), so a membership change
+    made in one worker would not reach the others.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+
+    names = getattr(user, '_group_names', None)
+    if names is None:
+        names = frozenset(user.groups.values_list('name', flat=True))
+        user._group_names = names
+    return names
+
+
+def in_group(user, name):
+    """Check group membership without a query per call"""
+    return name in get_group_names(user)
+
+
+@receiver(m2m_changed, sender=get_user_model().groups.through)
+def group_membership_changed(sender, instance, action, reverse, **kwargs):
+    # user.groups.add/remove/clear on a user whose names were already read
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        instance.__dict__.pop('_group_names', None)
+
+
 def is_vendor(user):
     """Check if user is a vendor"""
-    return user.is_authenticated and user.groups.filter(name='Vendors').exists()
+    return in_group(user, 'Vendors')
 
 def is_owner(user):
     """Check if user is the owner (superuser or staff)"""
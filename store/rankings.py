@@ -0,0 +1,73 @@
+"""
+Product rankings for the automated carousels and banners.
+
+Sales are counted from ``CartOrderItem`` rows (``Product.order_item``) of
+paid orders placed inside a bounded window, so the cost of a ranking grows
+with the orders of the window rather than the whole order history:
+
+1. paid orders of the window come from the (payment_status, -date) order
+   index,
+2. their items (product and total) are read by order from the covering
+   (order, product, total) item index,
+3. items are grouped per product and only the top ``limit`` products are
+   fetched.
+
+The windows default to TRENDING_DAYS and BEST_SELLING_DAYS and can be set
+with CAROUSEL_TRENDING_DAYS / CAROUSEL_BEST_SELLING_DAYS.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from store.models import CartOrderItem, Product
+
+TRENDING_DAYS = 30
+BEST_SELLING_DAYS = 365
+
+
+def listed_products():
+    """Products a carousel may show"""
+    return Product.objects.filter(status='published', in_stock=True, stock_qty__gt=0)
+
+
+def top_sellers(days, limit=10, now=None):
+    """
+    Products with the most paid order items in the last ``days`` days, best
+    first (ties broken by revenue, then views). Each product carries
+    ``recent_orders`` and ``total_revenue``.
+    """
+    since = (now or timezone.now()) - timedelta(days=days)
+    ranked = list(
+        CartOrderItem.objects.filter(
+            order__payment_status='paid',
+            order__date__gte=since,
+            product__status='published',
+            product__in_stock=True,
+            product__stock_qty__gt=0,
+        )
+        .values('product')
+        .annotate(recent_orders=Count('id'), total_revenue=Sum('total'))
+        .order_by('-recent_orders', '-total_revenue', '-product__views', 'product')[:limit]
+    )
+
+    products = Product.objects.in_bulk([row['product'] for row in ranked])
+    result = []
+    for row in ranked:
+        product = products.get(row['product'])
+        if product is None:
+            continue
+        product.recent_orders = row['recent_orders']
+        product.total_revenue = row['total_revenue']
+        result.append(product)
+    return result
+
+
+def trending_products(limit=10, now=None):
+    return top_sellers(getattr(settings, 'CAROUSEL_TRENDING_DAYS', TRENDING_DAYS), limit, now)
+
+
+def best_selling_products(limit=10, now=None):
+    return top_sellers(getattr(settings, 'CAROUSEL_BEST_SELLING_DAYS', BEST_SELLING_DAYS), limit, now)
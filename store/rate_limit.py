@@ -0,0 +1,160 @@
+"""
+Sliding-window rate limiting on top of the Django cache.
+
+Each (rule, client) pair counts hits in fixed windows with ``cache.add``
+(creates the counter with its TTL once) and ``cache.incr`` (atomic on
+Redis and in the local memory cache), so concurrent requests can't lose
+updates and hits don't extend the expiry. The previous window's count is
+weighted by how much of it still overlaps the sliding window, which
+avoids the burst a plain fixed window allows at its edges.
+
+Rules match route groups by path regex rather than exact paths, so the
+number of counters is bounded by rules x clients, not by URLs. Rules come
+from ``RATE_LIMIT_RULES`` in settings, falling back to ``DEFAULT_RULES``.
+
+If the cache backend fails (e.g. Redis is down), counting continues in a
+``LocalCounters`` LRU capped at ``RATE_LIMIT_FALLBACK_SIZE`` keys per
+process instead of failing open or growing without bound.
+"""
+
+import logging
+import math
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+RateRule = namedtuple('RateRule', ['name', 'pattern', 'limit', 'window'])
+RateResult = namedtuple('RateResult', ['allowed', 'rule', 'count', 'retry_after'])
+
+# (name, path regex, requests, window seconds); the first match wins
+DEFAULT_RULES = [
+    ('login', r'^/api/v1/(user/)?(token|login)/$', 5, 60),
+    ('register', r'^/api/v1/(user/)?register/', 3, 3600),
+    ('password_reset', r'^/api/v1/(user/)?password-reset/', 3, 3600),
+    ('payment', r'^/api/v1/(payment-success|stripe-checkout)/', 10, 60),
+    ('checkout', r'^/api/v1/(create-order|checkout|whatsapp-checkout|coupon)/', 30, 60),
+    ('api', r'^/api/', 1000, 3600),
+]
+
+# Never limited: admin and static files, health checks and Stripe's webhook retries
+DEFAULT_EXEMPT = r'^/(admin|static|health)/|^/api/v1/(stripe/webhook|health|health-simple)/'
+
+FALLBACK_SIZE = 10000
+
+
+def compile_rules(rules):
+    return [RateRule(name, re.compile(pattern), int(limit), int(window)) for name, pattern, limit, window in rules]
+
+
+def client_ip(request):
+    """First address of X-Forwarded-For (set by the proxy), else REMOTE_ADDR"""
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if x_forwarded_for:
+        return x_forwarded_for.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+class LocalCounters:
+    """Thread-safe in-process counters, evicting the least recently used key"""
+
+    def __init__(self, max_entries=FALLBACK_SIZE, clock=time.time):
+        self.max_entries = max_entries
+        self.clock = clock
+        self._counters = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._counters)
+
+    def incr(self, key, ttl):
+        now = self.clock()
+        with self._lock:
+            count, expires_at = self._counters.pop(key, (0, now + ttl))
+            if expires_at <= now:
+                count, expires_at = 0, now + ttl
+            count += 1
+            self._counters[key] = (count, expires_at)
+            while len(self._counters) > self.max_entries:
+                self._counters.popitem(last=False)
+            return count
+
+    def get(self, key):
+        with self._lock:
+            count, expires_at = self._counters.get(key, (0, 0))
+            return count if expires_at > self.clock() else 0
+
+
+class RateLimiter:
+    def __init__(self, rules=None, exempt=None, backend=None, fallback_size=None, clock=time.time):
+        if rules is None:
+            rules = getattr(settings, 'RATE_LIMIT_RULES', DEFAULT_RULES)
+        if exempt is None:
+            exempt = getattr(settings, 'RATE_LIMIT_EXEMPT', DEFAULT_EXEMPT)
+        if fallback_size is None:
+            fallback_size = int(getattr(settings, 'RATE_LIMIT_FALLBACK_SIZE', FALLBACK_SIZE))
+
+        self.rules = compile_rules(rules)
+        self.exempt = re.compile(exempt) if exempt else None
+        self.backend = backend or cache
+        self.fallback = LocalCounters(fallback_size, clock=clock)
+        self.clock = clock
+        self._warned_at = float('-inf')
+
+    def rule_for(self, path):
+        if self.exempt and self.exempt.search(path):
+            return None
+        for rule in self.rules:
+            if rule.pattern.search(path):
+                return rule
+        return None
+
+    def _incr(self, key, ttl):
+        try:
+            # add() sets the TTL once; incr() never touches it
+            self.backend.add(key, 0, ttl)
+            try:
+                return self.backend.incr(key)
+            except ValueError:
+                # Expired or evicted between add() and incr()
+                self.backend.add(key, 1, ttl)
+                return 1
+        except Exception as e:
+            # Once a minute, not on every request while the cache is down
+            if self.clock() - self._warned_at >= 60:
+                self._warned_at = self.clock()
+                logger.warning(f"Rate limit cache unavailable, counting in process: {e}")
+            return self.fallback.incr(key, ttl)
+
+    def _get(self, key):
+        try:
+            return self.backend.get(key) or 0
+        except Exception:
+            return self.fallback.get(key)
+
+    def hit(self, rule, ident):
+        """Count one request of ``ident`` against ``rule``"""
+        now = self.clock()
+        window_index, elapsed = divmod(now, rule.window)
+        prefix = f"rl:{rule.name}:{ident}"
+
+        # Counters live two windows so the next one can still read them
+        current = self._incr(f"{prefix}:{int(window_index)}", rule.window * 2)
+        previous = self._get(f"{prefix}:{int(window_index) - 1}")
+
+        count = previous * (1 - elapsed / rule.window) + current
+        allowed = count <= rule.limit
+        retry_after = 0 if allowed else math.ceil(rule.window - elapsed)
+        return RateResult(allowed, rule, count, retry_after)
+
+    def check(self, request, ident=None):
+        """Count ``request`` against its route group, None if no rule applies"""
+        rule = self.rule_for(request.path)
+        if rule is None:
+            return None
+        return self.hit(rule, ident or client_ip(request))
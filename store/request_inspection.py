@@ -0,0 +1,86 @@
+"""
+Precompiled request inspection shared by the security middlewares.
+
+The middlewares used to keep raw pattern lists and call ``re.search`` once
+per pattern for every GET and POST value, recompiling through the ``re``
+cache each time. A ``PatternSet`` instead dedups the patterns of each
+category and compiles all of them into one case-insensitive alternation
+with a named group per category, so every value is scanned once and the
+match still says which check it tripped.
+
+Values longer than ``MAX_VALUE_LENGTH`` characters
+(SECURITY_INSPECTION_MAX_LENGTH) are not scanned, which bounds the cost of
+huge form fields, and are reported as ``OVERSIZED`` instead: scanning only
+their head would let a payload through behind enough padding.
+"""
+
+import re
+
+from django.conf import settings
+
+MAX_VALUE_LENGTH = int(getattr(settings, 'SECURITY_INSPECTION_MAX_LENGTH', 4096))
+# Category of values too long to be inspected
+OVERSIZED = 'oversized'
+
+
+def dedup(patterns):
+    """Drop repeated patterns, keeping the first occurrence's order"""
+    return list(dict.fromkeys(patterns))
+
+
+class PatternSet:
+    """
+    Named categories of regex patterns compiled into a single regex.
+
+    ``PatternSet(sql=[...], xss=[...]).match(text)`` returns the name of
+    the first category found in ``text``, ``OVERSIZED`` if ``text`` is
+    longer than ``max_length``, or None.
+    """
+
+    def __init__(self, max_length=None, **categories):
+        self.max_length = MAX_VALUE_LENGTH if max_length is None else max_length
+        self.categories = {name: dedup(patterns) for name, patterns in categories.items()}
+        alternatives = [
+            f"(?P<{name}>{'|'.join(f'(?:{pattern})' for pattern in patterns)})"
+            for name, patterns in self.categories.items()
+            if patterns
+        ]
+        self.regex = re.compile('|'.join(alternatives), re.IGNORECASE)
+
+    @property
+    def pattern_count(self):
+        return sum(len(patterns) for patterns in self.categories.values())
+
+    def match(self, text):
+        if not text:
+            return None
+        text = str(text)
+        if len(text) > self.max_length:
+            return OVERSIZED
+        found = self.regex.search(text)
+        # The category group encloses any groups of the pattern itself,
+        # so it is the last one closed
+        return found.lastgroup if found else None
+
+
+def request_values(request, get=True, post=True):
+    """Yield (source, key, value) for the GET and POST values to inspect"""
+    if get:
+        for key, value in request.GET.items():
+            yield 'GET', key, value
+    if post:
+        for key, value in request.POST.items():
+            yield 'POST', key, value
+
+
+def inspect_values(request, pattern_set, get=True, post=True):
+    """
+    Scan the request's GET/POST values once against ``pattern_set``.
+
+    Returns (category, source, key) of the first hit or None.
+    """
+    for source, key, value in request_values(request, get=get, post=post):
+        category = pattern_set.match(value)
+        if category:
+            return category, source, key
+    return None
@@ -0,0 +1,233 @@
+"""
+Periodic jobs without Celery, cron or a broker.
+
+``Scheduler`` runs the functions of ``JOBS`` every ``interval`` seconds,
+each on its own thread so a slow carousel update never holds back the
+email outbox (on SQLite, which takes one writer at a time, they run one
+after the other). The schedule lives in the database (``ScheduledJob``),
+so any number of schedulers can run, one per gunicorn worker or per
+host, and each job still runs on one of them at a time:
+
+- a scheduler takes a job with a single conditional UPDATE that only
+  matches when the job is still due and its lease is free or has lapsed,
+- the lease is renewed while the job runs, so a job may take longer than
+  ``LEASE_SECONDS``, and a scheduler that dies frees its jobs when the
+  lease lapses,
+- the next run is set ``interval`` after the run finished, plus a random
+  ``JITTER`` share of it, so schedulers started together don't keep
+  hitting the database in step.
+
+Run it with ``python manage.py run_scheduler``, or inside the web
+processes with SCHEDULER_AUTOSTART. Intervals are overridden with
+SCHEDULER_INTERVALS (``name=seconds``, 0 disables a job).
+"""
+
+import logging
+import os
+import random
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, connections
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from store.models import ScheduledJob
+
+logger = logging.getLogger(__name__)
+
+# name -> (function, default interval in seconds)
+JOBS = {
+    'update_offers_carousel': ('store.tasks.update_offers_carousel_task', 10 * 60),
+    'update_promotional_banners': ('store.tasks.update_promotional_banners_task', 30 * 60),
+    'update_carousels': ('store.tasks.update_carousels_task', 60 * 60),
+    'cleanup_old_automated_content': ('store.tasks.cleanup_old_automated_content', 24 * 60 * 60),
+    'drain_outbox': ('store.scheduler.drain_outbox', 5),
+    'drain_stripe_events': ('store.scheduler.drain_stripe_events', 2),
+}
+
+# Only has to outlive a scheduler that died: running jobs renew it
+LEASE_SECONDS = 60
+TICK_SECONDS = 1
+JITTER = 0.1
+
+
+def drain_outbox():
+    """Send every due outbox email, batch by batch"""
+    from store import outbox
+
+    sent = failed = 0
+    while True:
+        batch_sent, batch_failed = outbox.drain_outbox()
+        sent += batch_sent
+        failed += batch_failed
+        if batch_sent + batch_failed < outbox.BATCH_SIZE:
+            return {'sent': sent, 'failed': failed}
+
+
+def drain_stripe_events():
+    """Process every due Stripe webhook event, batch by batch"""
+    from store import payments
+
+    processed = failed = 0
+    while True:
+        batch_processed, batch_failed = payments.drain_stripe_events()
+        processed += batch_processed
+        failed += batch_failed
+        if batch_processed + batch_failed < payments.BATCH_SIZE:
+            return {'processed': processed, 'failed': failed}
+
+
+def configured_jobs(names=None):
+    """name -> (function, interval) of the enabled jobs, optionally only ``names``"""
+    intervals = getattr(settings, 'SCHEDULER_INTERVALS', {})
+    jobs = {}
+    for name, (path, interval) in JOBS.items():
+        if names and name not in names:
+            continue
+        interval = intervals.get(name, interval)
+        if interval > 0:
+            jobs[name] = (import_string(path), interval)
+    return jobs
+
+
+def default_owner():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class Scheduler:
+    def __init__(self, jobs=None, owner=None, tick=None, jitter=None):
+        self.jobs = configured_jobs() if jobs is None else jobs
+        self.owner = owner or default_owner()
+        self.tick = tick if tick is not None else getattr(settings, 'SCHEDULER_TICK_SECONDS', TICK_SECONDS)
+        self.jitter = jitter if jitter is not None else getattr(settings, 'SCHEDULER_JITTER', JITTER)
+        self.lease = timedelta(seconds=LEASE_SECONDS)
+        # name -> future of the jobs running here
+        self.running = {}
+        self.renewed_at = None
+        # SQLite locks the whole database for each write: concurrent jobs
+        # would fail with "database is locked"
+        workers = 1 if connection.vendor == 'sqlite' else max(len(self.jobs), 1)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scheduler')
+        self.stopping = threading.Event()
+
+    def register(self):
+        """Create the rows of new jobs, due now"""
+        ScheduledJob.objects.bulk_create(
+            [ScheduledJob(name=name) for name in self.jobs], ignore_conflicts=True
+        )
+
+    def free(self, now):
+        return Q(locked_until__isnull=True) | Q(locked_until__lt=now)
+
+    def run_pending(self, force=False):
+        """
+        Start the due jobs this scheduler gets the lease of and return their
+        names. ``force`` runs them even if they are not due yet.
+        """
+        now = timezone.now()
+        self.reap()
+        self.renew(now)
+
+        claimable = ScheduledJob.objects.filter(self.free(now))
+        if not force:
+            claimable = claimable.filter(next_run_at__lte=now)
+        candidates = claimable.filter(name__in=set(self.jobs) - set(self.running))
+
+        started = []
+        for name in candidates.values_list('name', flat=True):
+            # Only one scheduler's UPDATE can match a free lease, and not
+            # once another one has run the job and moved next_run_at on
+            acquired = claimable.filter(name=name).update(
+                locked_by=self.owner,
+                locked_until=now + self.lease,
+            )
+            if acquired:
+                self.running[name] = self.executor.submit(self.run_job, name)
+                started.append(name)
+        return started
+
+    def run_job(self, name):
+        func, interval = self.jobs[name]
+        status, error = 'ok', None
+        # Not when the lease was taken: on SQLite the job may have queued
+        ScheduledJob.objects.filter(name=name, locked_by=self.owner).update(last_started_at=timezone.now())
+        try:
+            result = func()
+            if isinstance(result, dict) and result.get('success') is False:
+                # The carousel tasks report their errors instead of raising
+                status, error = 'failed', result.get('error') or result.get('message')
+            logger.info(f"Scheduled job {name} done: {result}")
+        except Exception as e:
+            status, error = 'failed', str(e)
+            logger.exception(f"Scheduled job {name} failed")
+        finally:
+            self.release(name, interval, status, error)
+            # Connections are per thread, and pool threads outlive the job
+            connections.close_all()
+        return status
+
+    def release(self, name, interval, status, error):
+        finished = timezone.now()
+        delay = interval * (1 + random.uniform(0, self.jitter))
+        released = ScheduledJob.objects.filter(name=name, locked_by=self.owner).update(
+            locked_by='',
+            locked_until=None,
+            next_run_at=finished + timedelta(seconds=delay),
+            last_finished_at=finished,
+            last_status=status,
+            last_error=error,
+            runs=F('runs') + 1,
+        )
+        if not released:
+            logger.warning(f"Scheduled job {name} lost its lease while running")
+
+    def renew(self, now):
+        """Push back the leases of the jobs running here, a few times per lease"""
+        if not self.running or (self.renewed_at and now - self.renewed_at < self.lease / 3):
+            return
+        ScheduledJob.objects.filter(name__in=list(self.running), locked_by=self.owner).update(
+            locked_until=now + self.lease
+        )
+        self.renewed_at = now
+
+    def reap(self):
+        for name, future in list(self.running.items()):
+            if future.done():
+                del self.running[name]
+
+    def wait(self):
+        """Wait for the jobs running here, renewing their leases meanwhile"""
+        while self.running:
+            wait(list(self.running.values()), timeout=self.lease.total_seconds() / 3)
+            self.reap()
+            self.renew(timezone.now())
+
+    def run_forever(self):
+        self.register()
+        logger.info(f"Scheduler {self.owner} started: {', '.join(self.jobs)}")
+        while not self.stopping.is_set():
+            close_old_connections()
+            try:
+                self.run_pending()
+            except Exception:
+                logger.exception("Scheduler tick failed")
+            self.stopping.wait(self.tick)
+        self.executor.shutdown(wait=True)
+        logger.info(f"Scheduler {self.owner} stopped")
+
+    def stop(self):
+        self.stopping.set()
+
+
+def start_in_background(**kwargs):
+    """Run a scheduler on a daemon thread of this process and return it"""
+    scheduler = Scheduler(**kwargs)
+    thread = threading.Thread(target=scheduler.run_forever, name='scheduler', daemon=True)
+    thread.start()
+    return scheduler
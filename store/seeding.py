@@ -0,0 +1,159 @@
+"""
+Synthetic store data for query plans and benchmarks.
+
+Rows are written with bulk_create in large batches so a few hundred thousand
+order items can be seeded in seconds. Every seeded username, slug and email
+carries the ``SEED_PREFIX`` so the data is easy to recognise (and remove).
+"""
+
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.utils import timezone
+
+from store.models import (
+    Category, Product, Color, Size, Cart, CartOrder, CartOrderItem,
+    Notification, Review
+)
+from userauths.models import User
+from vendor.models import Vendor
+
+SEED_PREFIX = 'seed'
+
+BATCH_SIZE = 2000
+
+PAYMENT_STATUSES = ['paid', 'pending', 'processing', 'cancelled']
+PAYMENT_METHODS = ['stripe', 'whatsapp']
+
+
+def seed_dataset(products=500, orders=5000, items_per_order=3, vendors=10, days=90, seed=42, log=None):
+    """
+    Seed a catalog and an order history.
+
+    Orders are spread uniformly over the last ``days`` days. Returns a dict
+    with the number of rows created per model.
+    """
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+    now = timezone.now()
+    run = f"{SEED_PREFIX}{rng.randrange(10 ** 8):08d}"
+
+    users = User.objects.bulk_create([
+        User(
+            username=f"{run}-user-{i}",
+            email=f"{run}-user-{i}@example.com",
+            full_name=f"Seed User {i}",
+        )
+        for i in range(max(vendors * 5, 50))
+    ], batch_size=BATCH_SIZE)
+    log(f"Created {len(users)} users")
+
+    vendor_rows = Vendor.objects.bulk_create([
+        Vendor(user=users[i], name=f"Seed Vendor {i}", slug=f"{run}-vendor-{i}", active=True)
+        for i in range(vendors)
+    ], batch_size=BATCH_SIZE)
+
+    categories = Category.objects.bulk_create([
+        Category(title=f"Seed Category {i}", slug=f"{run}-category-{i}")
+        for i in range(10)
+    ], batch_size=BATCH_SIZE)
+
+    product_rows = []
+    for i in range(products):
+        price = Decimal(rng.randint(500, 50000)) / 100
+        on_sale = rng.random() < 0.3
+        stock = rng.choice([0, 0, 3, 10, 50, 200])
+        product_rows.append(Product(
+            title=f"Seed Product {i}",
+            slug=f"{run}-product-{i}",
+            vendor=rng.choice(vendor_rows),
+            category=rng.choice(categories),
+            price=price,
+            old_price=(price * Decimal('1.25')).quantize(Decimal('0.01')) if on_sale else Decimal('0.00'),
+            stock_qty=stock,
+            in_stock=stock > 0,
+            status=rng.choice(['published'] * 8 + ['draft', 'disabled']),
+            views=int(rng.paretovariate(1.2) * 10),
+            featured=rng.random() < 0.05,
+        ))
+        # bulk_create skips save()
+        product_rows[-1].discount_percent = product_rows[-1].compute_discount_percent()
+    product_rows = Product.objects.bulk_create(product_rows, batch_size=BATCH_SIZE)
+    log(f"Created {len(product_rows)} products")
+
+    Color.objects.bulk_create([
+        Color(product=product, name=name, color_code='#000000', stock_qty=product.stock_qty // 2,
+              in_stock=product.stock_qty > 1)
+        for product in product_rows for name in ('Preto', 'Verde')
+    ], batch_size=BATCH_SIZE)
+    Size.objects.bulk_create([
+        Size(product=product, name=name, stock_qty=product.stock_qty // 3, in_stock=product.stock_qty > 2)
+        for product in product_rows for name in ('P', 'M', 'G')
+    ], batch_size=BATCH_SIZE)
+
+    created = {'users': len(users), 'vendors': len(vendor_rows), 'products': len(product_rows)}
+    created['orders'] = 0
+    created['order_items'] = 0
+
+    for start in range(0, orders, BATCH_SIZE):
+        order_rows = []
+        placed_at = []
+        for i in range(start, min(start + BATCH_SIZE, orders)):
+            placed_at.append(now - timedelta(seconds=rng.randrange(days * 24 * 3600)))
+            order_rows.append(CartOrder(
+                buyer=rng.choice(users) if rng.random() < 0.7 else None,
+                full_name=f"Seed Buyer {i}",
+                email=f"{run}-buyer-{i}@example.com",
+                payment_status=rng.choice(PAYMENT_STATUSES),
+                payment_method=rng.choice(PAYMENT_METHODS),
+            ))
+        order_rows = CartOrder.objects.bulk_create(order_rows, batch_size=BATCH_SIZE)
+
+        # auto_now_add / auto_now stamp inserts with the current time,
+        # bulk_update writes the spread-out history without touching them
+        for order, placed in zip(order_rows, placed_at):
+            order.date = order.updated_at = placed
+        CartOrder.objects.bulk_update(order_rows, ['date', 'updated_at'], batch_size=BATCH_SIZE)
+
+        item_rows = []
+        for order in order_rows:
+            for product in rng.sample(product_rows, k=min(items_per_order, len(product_rows))):
+                qty = rng.randint(1, 3)
+                item_rows.append(CartOrderItem(
+                    order=order,
+                    product=product,
+                    vendor=product.vendor,
+                    qty=qty,
+                    price=product.price,
+                    sub_total=product.price * qty,
+                    total=product.price * qty,
+                    color='Preto',
+                    size='M',
+                ))
+        CartOrderItem.objects.bulk_create(item_rows, batch_size=BATCH_SIZE)
+
+        created['orders'] += len(order_rows)
+        created['order_items'] += len(item_rows)
+        log(f"Created {created['orders']} orders / {created['order_items']} order items")
+
+    Cart.objects.bulk_create([
+        Cart(cart_id=f"{run}-cart-{i // 3}", product=product_rows[i % len(product_rows)],
+             user=rng.choice(users) if i % 2 else None, qty=1, color=f"c{i}", size='M')
+        for i in range(min(orders, 20000))
+    ], batch_size=BATCH_SIZE)
+
+    Notification.objects.bulk_create([
+        Notification(user=rng.choice(users), seen=rng.random() < 0.9)
+        for _ in range(min(orders, 20000))
+    ], batch_size=BATCH_SIZE)
+
+    Review.objects.bulk_create([
+        Review(product=rng.choice(product_rows), user=rng.choice(users), review='Seed review',
+               rating=rng.randint(1, 5), active=rng.random() < 0.6)
+        for _ in range(min(orders, 20000))
+    ], batch_size=BATCH_SIZE)
+
+    log(f"Seed run {run} complete")
+    created['run'] = run
+    return created
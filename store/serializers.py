@@ -1,4 +1,5 @@
 # from userauths.serializer import ProfileSerializer  # Temporarily commented to avoid circular import
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 from store.models import (
     Cart, Category, Product, Gallery, Specification, Size, Color, 
@@ -6,16 +7,38 @@ from store.models import (
     Notification, Coupon, CarouselImage, OffersCarousel, Banner
 )
 from vendor.models import Vendor
+from store.images import srcset_data
+
+
+class ImageSrcsetField(serializers.ReadOnlyField):
+    """``srcset``-ready variants of an image (store/images.py), None until they exist"""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'image_variants')
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+
+        def url_for(name):
+            url = default_storage.url(name)
+            return request.build_absolute_uri(url) if request is not None else url
+
+        return srcset_data(value, url_for)
 
 class CategorySerializer(serializers.ModelSerializer):
+    image_srcset = ImageSrcsetField()
+
     class Meta:
         model = Category
-        fields = "__all__"
+        exclude = ['image_variants']
 
 class GallerySerializer(serializers.ModelSerializer):
+    image_srcset = ImageSrcsetField()
+
     class Meta:
         model = Gallery
-        fields = "__all__"
+        exclude = ['image_variants']
 
 class SpecificationSerializer(serializers.ModelSerializer):
     class Meta:
@@ -35,10 +58,11 @@ class SizeSerializer(serializers.ModelSerializer):
 
 class ColorSerializer(serializers.ModelSerializer):
     galleries = GallerySerializer(many=True, read_only=True)
+    image_srcset = ImageSrcsetField()
     
     class Meta:
         model = Color
-        fields = ['id', 'name', 'color_code', 'image', 'galleries', 'stock_qty', 'in_stock']
+        fields = ['id', 'name', 'color_code', 'image', 'image_srcset', 'galleries', 'stock_qty', 'in_stock']
         read_only_fields = ['in_stock']
 
     def validate_stock_qty(self, value):
@@ -54,6 +78,7 @@ class ProductSerializer(serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)  # Include category details
     rating_count = serializers.SerializerMethodField()
     product_rating = serializers.SerializerMethodField()
+    image_srcset = ImageSrcsetField()
 
     class Meta:
         model = Product
@@ -61,10 +86,12 @@ class ProductSerializer(serializers.ModelSerializer):
             'id',
             'title',
             'image',
+            'image_srcset',
             'description',
             'category',
             'price',
             'old_price',
+            'discount_percent',
             'shipping_ammount',
             'stock_qty',
             'in_stock',
@@ -84,7 +111,7 @@ class ProductSerializer(serializers.ModelSerializer):
             'slug',
             'date',
         ]
-        read_only_fields = ['in_stock', 'rating']
+        read_only_fields = ['in_stock', 'rating', 'discount_percent']
 
     def get_rating_count(self, obj):
         """Get the count of ratings for this product"""
@@ -224,9 +251,11 @@ class NotificationSerializer(serializers.ModelSerializer):
             self.Meta.depth = 3
 
 class CarouselImageSerializer(serializers.ModelSerializer):
+    image_srcset = ImageSrcsetField()
+
     class Meta:
         model = CarouselImage
-        fields = ['id', 'image', 'caption', 'is_active']
+        fields = ['id', 'image', 'image_srcset', 'caption', 'is_active']
 
 class OffersCarouselSerializer(serializers.ModelSerializer):
     products = ProductSerializer(many=True, read_only=True)
@@ -236,6 +265,8 @@ class OffersCarouselSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'products', 'is_active']
 
 class BannerSerializer(serializers.ModelSerializer):
+    image_srcset = ImageSrcsetField()
+
     class Meta:
         model = Banner
-        fields = ['id', 'title', 'image', 'link', 'is_active', 'date']
\ No newline at end of file
+        fields = ['id', 'title', 'image', 'image_srcset', 'link', 'is_active', 'date']
\ No newline at end of file
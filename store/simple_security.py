@@ -7,8 +7,24 @@ import re
 import logging
 from django.http import HttpResponseForbidden
 
+from store.request_inspection import PatternSet, inspect_values
+
 logger = logging.getLogger(__name__)
 
+# Compiled once at import, matched case-insensitively
+SQL_PATTERNS = PatternSet(sql=[
+    r"(\b(union|select|insert|update|delete|drop|create|alter|exec|execute)\b)",
+    r"(--|#|/\*|\*/)",
+    r"(\bxp_cmdshell\b)",
+])
+
+PATH_PATTERNS = PatternSet(path=[
+    r"\.\./",
+    r"\.\.\\",
+    r"\.\.%2f",
+    r"\.\.%5c",
+])
+
 class SimpleSecurityMiddleware:
     """
     Basic security middleware that doesn't require external packages
@@ -34,33 +50,12 @@ class SimpleSecurityMiddleware:
     def _is_suspicious_request(self, request):
         """Basic suspicious request detection"""
         try:
-            # Check for obvious SQL injection attempts
-            sql_patterns = [
-                r"(\b(union|select|insert|update|delete|drop|create|alter|exec|execute)\b)",
-                r"(--|#|/\*|\*/)",
-                r"(\bxp_cmdshell\b)",
-            ]
+            # Check for obvious SQL injection attempts in GET/POST values
+            if inspect_values(request, SQL_PATTERNS, post=request.method == 'POST'):
+                return True
             
-            # Check GET parameters
-            for key, value in request.GET.items():
-                if self._check_patterns(value, sql_patterns):
-                    return True
-                    
-            # Check POST data
-            if request.method == 'POST':
-                for key, value in request.POST.items():
-                    if self._check_patterns(str(value), sql_patterns):
-                        return True
-                        
             # Check for path traversal
-            path_patterns = [
-                r"\.\./",
-                r"\.\.\\",
-                r"\.\.%2f",
-                r"\.\.%5c",
-            ]
-            
-            if self._check_patterns(request.path, path_patterns):
+            if PATH_PATTERNS.match(request.path):
                 return True
                 
             return False
@@ -69,17 +64,6 @@ class SimpleSecurityMiddleware:
             logger.error(f"Security check error: {e}")
             return False
             
-    def _check_patterns(self, text, patterns):
-        """Check if text matches any suspicious patterns"""
-        if not text:
-            return False
-            
-        text = str(text).lower()
-        for pattern in patterns:
-            if re.search(pattern, text, re.IGNORECASE):
-                return True
-        return False
-        
     def _add_basic_headers(self, response):
         """Add basic security headers"""
         response['X-Content-Type-Options'] = 'nosniff'
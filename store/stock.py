@@ -0,0 +1,147 @@
+"""
+Bulk stock reduction for paid orders.
+
+``reduce_stock_for_orders`` handles any number of orders with a fixed number
+of statements: it reads all their lines at once, sums the decrements per
+product, color and size, checks them against the locked stock rows and then
+applies them with one conditional UPDATE per table. Orders whose lines don't
+fit the remaining stock are reported instead of failing the whole batch.
+"""
+
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, When
+from django.utils import timezone
+
+from store.models import CartOrder, CartOrderItem, Color, Product, Size
+
+logger = logging.getLogger(__name__)
+
+NO_VARIANT = ("", "No Color", "No Size")
+
+
+def _variant_name(value):
+    value = (value or "").strip()
+    return None if value in NO_VARIANT else value
+
+
+def _apply_decrements(model, decrements):
+    """One UPDATE for all rows of ``model``, then fix in_stock for emptied rows"""
+    if not decrements:
+        return
+    model.objects.filter(pk__in=decrements.keys()).update(
+        stock_qty=Case(
+            *[When(pk=pk, then=F('stock_qty') - qty) for pk, qty in decrements.items()],
+            default=F('stock_qty'),
+            output_field=model._meta.get_field('stock_qty'),
+        )
+    )
+    # save() keeps in_stock in sync with stock_qty, update() doesn't
+    model.objects.filter(pk__in=decrements.keys(), stock_qty=0, in_stock=True).update(in_stock=False)
+
+
+def reduce_stock_for_orders(orders):
+    """
+    Reduce product, color and size stock for ``orders`` (CartOrders or pks).
+
+    Orders already stamped with stock_reduced_at are skipped, so the call is
+    idempotent. Returns ``(reduced, failed)``: the oids whose stock was
+    reduced and a dict of oid -> reason for orders left untouched.
+    """
+    order_ids = [getattr(order, 'pk', order) for order in orders]
+    reduced, failed = [], {}
+    if not order_ids:
+        return reduced, failed
+
+    with transaction.atomic():
+        # Lock the orders so concurrent confirmations reduce stock once
+        pending = dict(
+            CartOrder.objects.select_for_update()
+            .filter(pk__in=order_ids, stock_reduced_at__isnull=True)
+            .order_by('date', 'id')
+            .values_list('pk', 'oid')
+        )
+        if not pending:
+            return reduced, failed
+
+        lines = list(
+            CartOrderItem.objects.filter(order_id__in=pending.keys())
+            .values_list('order_id', 'product_id', 'qty', 'color', 'size')
+        )
+        product_ids = {product_id for _, product_id, _, _, _ in lines}
+
+        products, titles = {}, {}
+        for pk, stock, title in (
+            Product.objects.select_for_update().filter(pk__in=product_ids)
+            .values_list('pk', 'stock_qty', 'title')
+        ):
+            products[pk] = stock
+            titles[pk] = title
+
+        # (product_id, name) -> [variant_id, stock]; first match by name like the per-item code
+        variants = {}
+        for model, kind in ((Color, 'color'), (Size, 'size')):
+            rows = (
+                model.objects.select_for_update().filter(product_id__in=product_ids)
+                .order_by('id').values_list('pk', 'product_id', 'name', 'stock_qty')
+            )
+            for pk, product_id, name, stock in rows:
+                variants.setdefault((kind, product_id, name), [pk, stock])
+
+        lines_by_order = defaultdict(list)
+        for order_id, product_id, qty, color, size in lines:
+            lines_by_order[order_id].append((product_id, qty, _variant_name(color), _variant_name(size)))
+
+        product_decrements = defaultdict(int)
+        color_decrements = defaultdict(int)
+        size_decrements = defaultdict(int)
+        accepted = []
+
+        # Oldest orders first get the stock when it runs short
+        for order_id, oid in pending.items():
+            need_products = defaultdict(int)
+            need_variants = defaultdict(int)
+            for product_id, qty, color, size in lines_by_order[order_id]:
+                need_products[product_id] += qty
+                # Variants that don't exist are skipped, as before
+                if color and ('color', product_id, color) in variants:
+                    need_variants[('color', product_id, color)] += qty
+                if size and ('size', product_id, size) in variants:
+                    need_variants[('size', product_id, size)] += qty
+
+            problem = None
+            for product_id, qty in need_products.items():
+                if products.get(product_id, 0) < qty:
+                    problem = f"not enough stock for {titles.get(product_id, product_id)} ({products.get(product_id, 0)} left, {qty} needed)"
+                    break
+            if not problem:
+                for (kind, product_id, name), qty in need_variants.items():
+                    if variants[(kind, product_id, name)][1] < qty:
+                        problem = f"not enough stock for {titles.get(product_id, product_id)} {kind} {name}"
+                        break
+            if problem:
+                failed[oid] = problem
+                continue
+
+            for product_id, qty in need_products.items():
+                products[product_id] -= qty
+                product_decrements[product_id] += qty
+            for key, qty in need_variants.items():
+                variants[key][1] -= qty
+                kind_decrements = color_decrements if key[0] == 'color' else size_decrements
+                kind_decrements[variants[key][0]] += qty
+            accepted.append(order_id)
+            reduced.append(oid)
+
+        _apply_decrements(Product, product_decrements)
+        _apply_decrements(Color, color_decrements)
+        _apply_decrements(Size, size_decrements)
+
+        if accepted:
+            now = timezone.now()
+            CartOrder.objects.filter(pk__in=accepted).update(stock_reduced_at=now, updated_at=now)
+
+    logger.info(f"Stock reduced for {len(reduced)} orders, {len(failed)} failed")
+    return reduced, failed
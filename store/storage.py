@@ -0,0 +1,191 @@
+"""
+Content-addressed media storage.
+
+``ContentAddressedStorage`` keeps every upload under the SHA-256 of its
+bytes, ``blobs/<2 hex>/<sha256>.<ext>``, whatever name or ``upload_to``
+it was saved with:
+
+- the same file uploaded for several products, colors or galleries is
+  stored once and every row points at the same blob,
+- names never collide, so nothing gets a ``_AbC123x`` suffix,
+- a name only ever has one content, so media_serving sends blobs with
+  ``Cache-Control: immutable`` (they match its HASHED_NAME_RE).
+
+Blobs are written to a temporary file and hard-linked into place, so a
+concurrent upload of the same bytes or a crash never leaves a partial
+blob behind. Because blobs are shared, ``delete()`` leaves them alone;
+``manage.py collect_media_blobs`` deletes the ones nothing refers to any
+more (replaced images, old variants and banners) after a grace period.
+Saving bytes that are already stored refreshes the blob's mtime, so a
+blob that is being used again is inside that grace period.
+
+Existing files are moved over with ``manage.py migrate_media_storage``.
+
+``copy_stored_file`` copies between names of any storage without an HTTP
+round trip: blobs are shared as is, other local files are reflinked or
+hard-linked, and remote storages stream through ``open``/``save``.
+"""
+
+import errno
+import hashlib
+import logging
+import os
+import re
+import shutil
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+logger = logging.getLogger(__name__)
+
+BLOB_DIR = 'blobs'
+# ioctl(FICLONE): copy-on-write clone on btrfs, XFS, etc.
+FICLONE = 0x40049409
+BLOB_NAME_RE = re.compile(rf'^{BLOB_DIR}/[0-9a-f]{{2}}/[0-9a-f]{{64}}(\.[a-z0-9]+)?$')
+
+
+def file_digest(content):
+    """SHA-256 hex digest of a file-like object, read in chunks and rewound"""
+    if not hasattr(content, 'chunks'):
+        content = File(content)
+    sha256 = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        sha256.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return sha256.hexdigest()
+
+
+def blob_name(digest, original_name):
+    extension = os.path.splitext(original_name or '')[1].lower()
+    return f"{BLOB_DIR}/{digest[:2]}/{digest}{extension}"
+
+
+def is_blob_name(name):
+    return bool(name and BLOB_NAME_RE.match(name))
+
+
+def stored_digest(storage, name):
+    """SHA-256 of a stored file; free for blobs, whose name is their digest"""
+    if is_blob_name(name):
+        return os.path.splitext(os.path.basename(name))[0]
+    with storage.open(name, 'rb') as f:
+        return file_digest(f)
+
+
+def same_content(storage, name, other_name):
+    if not name or not other_name:
+        return False
+    if name == other_name:
+        return True
+    if is_blob_name(name) and is_blob_name(other_name):
+        return False
+    try:
+        return stored_digest(storage, name) == stored_digest(storage, other_name)
+    except OSError:
+        # A missing file is never the same
+        return False
+
+
+def _clone_file(source_path, target_path):
+    """Reflink, else hard link, else copy; FileExistsError if the target exists"""
+    try:
+        import fcntl
+
+        with open(source_path, 'rb') as source, open(target_path, 'xb') as target:
+            try:
+                fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+                return
+            except OSError:
+                pass
+        os.unlink(target_path)
+    except ImportError:
+        pass
+
+    try:
+        os.link(source_path, target_path)
+    except FileExistsError:
+        raise
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+            raise
+        with open(source_path, 'rb') as source, open(target_path, 'xb') as target:
+            shutil.copyfileobj(source, target)
+
+
+def copy_stored_file(storage, source_name, target_name):
+    """
+    Copy ``source_name`` to ``target_name`` (or the next free name) within
+    ``storage`` and return the stored name.
+    """
+    if isinstance(storage, ContentAddressedStorage) and is_blob_name(source_name):
+        # Blobs are immutable and shared: the copy is the same name
+        return source_name
+
+    try:
+        source_path = storage.path(source_name)
+    except NotImplementedError:
+        source_path = None
+    if source_path is None or isinstance(storage, ContentAddressedStorage):
+        # Remote storage, or a legacy file going into the blob store
+        with storage.open(source_name, 'rb') as f:
+            return storage.save(target_name, f)
+
+    while True:
+        name = storage.get_available_name(target_name)
+        target_path = storage.path(name)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        try:
+            _clone_file(source_path, target_path)
+        except FileExistsError:
+            # Taken between get_available_name() and the clone
+            continue
+        return name
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        name = blob_name(file_digest(content), name)
+        try:
+            # In use again: keep collect_media_blobs off it
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            self._save_blob(name, content)
+        return name
+
+    def _save_blob(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    f.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            try:
+                os.link(temp_path, full_path)
+            except FileExistsError:
+                # Someone stored the same bytes first
+                pass
+        finally:
+            os.unlink(temp_path)
+        return name
+
+    def delete(self, name):
+        if is_blob_name(name):
+            # Other rows may point at the same blob; collect_media_blobs
+            # deletes it once nothing does
+            logger.debug(f"Not deleting shared blob {name}")
+            return
+        super().delete(name)
@@ -1,8 +1,17 @@
-from celery import shared_task
 from django.utils import timezone
 from store.carousel_automation import CarouselAutomation
 import logging
 
+try:
+    from celery import shared_task
+except ImportError:
+    # Celery is optional: without it these are plain functions, run
+    # periodically by store/scheduler.py (python manage.py run_scheduler)
+    def shared_task(func=None, **options):
+        if func is None:
+            return lambda func: func
+        return func
+
 logger = logging.getLogger(__name__)
 
 
@@ -1,3 +1,878 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+import warnings
+from concurrent.futures import Future
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.testing import ApplicationCommunicator
+from django.core import mail
+from django.core.management import call_command
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connection, connections, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.http import HttpResponse
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.text import slugify
+
+from store import outbox, payments
+from store.carousel_automation import CarouselAutomation
+from store.media_serving import CHUNK_SIZE, is_hashed_name, serve_media
+from store.models import (
+    Banner, CartOrder, CartOrderItem, Color, EmailOutbox, Product, ScheduledJob, Size, StripeEvent,
+)
+from store.payments import confirm_order_paid
+from store.rate_limit import LocalCounters, RateLimiter
+from store.scheduler import Scheduler
+from store.request_inspection import OVERSIZED, PatternSet
+from store.stock import reduce_stock_for_orders
+from security.middleware import RateLimitMiddleware
+from userauths.models import User
+from vendor.models import Vendor
+
+# URLconf of MediaServingASGITests: the media view alone, no middleware
+urlpatterns = [
+    path('media/<path:file_path>', serve_media),
+]
+
+
+@override_settings(ROOT_URLCONF='store.tests', MIDDLEWARE=[], MEDIA_SENDFILE_MODE='')
+class MediaServingASGITests(SimpleTestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.content = os.urandom(CHUNK_SIZE * 5 + 123)
+        with open(os.path.join(self.media_root, 'big.bin'), 'wb') as f:
+            f.write(self.content)
+
+    async def get(self, headers=()):
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': '/media/big.bin',
+            'query_string': b'',
+            'headers': [(b'host', b'testserver'), *headers],
+            'server': ('testserver', 80),
+        }
+        communicator = ApplicationCommunicator(ASGIHandler(), scope)
+        await communicator.send_input({'type': 'http.request', 'body': b''})
+        start = await communicator.receive_output(timeout=5)
+        bodies = []
+        while True:
+            message = await communicator.receive_output(timeout=5)
+            bodies.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        await communicator.wait()
+        return start, bodies
+
+    async def test_streams_in_chunks_without_sync_iterator_warning(self):
+        with override_settings(MEDIA_ROOT=self.media_root), warnings.catch_warnings():
+            warnings.filterwarnings('error', message='StreamingHttpResponse must consume synchronous iterators')
+            start, bodies = await self.get()
+
+        self.assertEqual(start['status'], 200)
+        self.assertEqual(b''.join(bodies), self.content)
+        # Sent as it is read, not as one body read into memory first
+        self.assertGreater(len([body for body in bodies if body]), 1)
+        self.assertLessEqual(max(len(body) for body in bodies), CHUNK_SIZE)
+
+    async def test_range(self):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            start, bodies = await self.get([(b'range', b'bytes=100-70000')])
+
+        self.assertEqual(start['status'], 206)
+        self.assertIn((b'Content-Range', f'bytes 100-70000/{len(self.content)}'.encode()), start['headers'])
+        self.assertEqual(b''.join(bodies), self.content[100:70001])
+
+
+
+class HashedNameTests(SimpleTestCase):
+    def test_content_hashed_names(self):
+        digest = hashlib.sha256(b'photo').hexdigest()
+        for name in (
+            f'blobs/{digest[:2]}/{digest}.jpg',
+            f'blobs/{digest[:2]}/{digest}',
+            'css/site.3f9a1c2b7d4e.css',
+            f'products/{digest}.webp',
+            'products/photo-0123456789ab.png',
+        ):
+            with self.subTest(name=name):
+                self.assertTrue(is_hashed_name(name))
+
+    def test_names_that_can_change(self):
+        for name in (
+            'products/IMG_20231015143022.jpg',
+            'products/photo_202310151430.jpg',
+            'products/5551234567890.png',
+            'products/photo.jpg',
+            'products/deadbeef.png',
+            'blobs/ab/not-a-digest.jpg',
+        ):
+            with self.subTest(name=name):
+                self.assertFalse(is_hashed_name(name))
+
+
+def make_vendor(name):
+    user = User.objects.create(email=f'{name}@vendor.test', username=name)
+    return Vendor.objects.create(user=user, name=name)
+
+
+def make_product(vendor, title='Product', stock_qty=10):
+    # Product.save() reads the reviews of the product, which needs a pk
+    product, = Product.objects.bulk_create([Product(
+        title=title, slug=slugify(title), vendor=vendor, stock_qty=stock_qty, in_stock=stock_qty > 0, price=10,
+    )])
+    return product
+
+
+def make_order(buyer_email='buyer@example.com', items=()):
+    """Pending order of ``buyer_email`` with a (product, qty) item each"""
+    buyer = User.objects.create(email=buyer_email, username=buyer_email.split('@')[0])
+    order = CartOrder.objects.create(buyer=buyer, email=buyer_email, total=10)
+    for product, qty in items:
+        CartOrderItem.objects.create(order=order, product=product, vendor=product.vendor, qty=qty, price=10)
+    return order
+
+
+class EmailOutboxTests(TestCase):
+    def setUp(self):
+        self.vendors = [make_vendor('acme'), make_vendor('globex')]
+        self.order = make_order(items=[
+            (make_product(self.vendors[0], 'Anvil'), 1),
+            (make_product(self.vendors[0], 'Rocket'), 2),
+            (make_product(self.vendors[1], 'Widget'), 1),
+        ])
+
+    def test_confirm_queues_emails_and_drain_sends_them(self):
+        self.assertTrue(confirm_order_paid(self.order))
+
+        # Queued, not sent by the confirming request
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(EmailOutbox.objects.filter(status='pending').count(), 3)
+
+        self.assertEqual(outbox.drain_outbox(), (3, 0))
+        recipients = sorted(message.to[0] for message in mail.outbox)
+        self.assertEqual(recipients, ['acme@vendor.test', 'buyer@example.com', 'globex@vendor.test'])
+        subjects = {message.to[0]: message.subject for message in mail.outbox}
+        self.assertEqual(subjects['buyer@example.com'], 'Order Placed Successfully')
+        self.assertEqual(subjects['acme@vendor.test'], 'New Sale!')
+        self.assertEqual(EmailOutbox.objects.filter(status='sent').count(), 3)
+
+        # Nothing left to send
+        self.assertEqual(outbox.drain_outbox(), (0, 0))
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_second_confirmation_queues_nothing(self):
+        confirm_order_paid(self.order)
+        self.assertFalse(confirm_order_paid(self.order))
+        self.assertEqual(outbox.enqueue_order_emails(self.order), 3)
+        self.assertEqual(EmailOutbox.objects.count(), 3)
+
+    def test_emails_roll_back_with_the_payment(self):
+        enqueue = outbox.enqueue_order_emails
+
+        def enqueue_then_fail(order):
+            enqueue(order)
+            raise RuntimeError('database went away')
+
+        with mock.patch('store.payments.enqueue_order_emails', side_effect=enqueue_then_fail):
+            with self.assertRaises(RuntimeError):
+                confirm_order_paid(self.order)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, 'pending')
+        self.assertFalse(EmailOutbox.objects.exists())
+
+    def test_failed_send_backs_off_then_gives_up(self):
+        outbox.enqueue_order_emails(self.order)
+        EmailOutbox.objects.exclude(to_email='buyer@example.com').delete()
+        entry = EmailOutbox.objects.get()
+
+        with mock.patch(
+            'django.core.mail.backends.locmem.EmailBackend.send_messages',
+            side_effect=ConnectionError('mail server down'),
+        ):
+            for attempt in range(1, outbox.MAX_ATTEMPTS + 1):
+                before = timezone.now()
+                self.assertEqual(outbox.drain_outbox(), (0, 1))
+                entry.refresh_from_db()
+                self.assertEqual(entry.attempts, attempt)
+                self.assertEqual(entry.last_error, 'mail server down')
+                if attempt < outbox.MAX_ATTEMPTS:
+                    self.assertEqual(entry.status, 'pending')
+                    backoff = timedelta(seconds=outbox.RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+                    self.assertGreaterEqual(entry.available_at, before + backoff)
+                    # Not due again before the backoff
+                    self.assertEqual(outbox.drain_outbox(), (0, 0))
+                    EmailOutbox.objects.filter(pk=entry.pk).update(available_at=timezone.now())
+
+        self.assertEqual(entry.status, 'failed')
+        # Given up: never sent, never claimed again
+        EmailOutbox.objects.filter(pk=entry.pk).update(available_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(outbox.drain_outbox(), (0, 0))
+        self.assertEqual(mail.outbox, [])
+
+    def test_claimed_rows_go_to_one_drainer(self):
+        outbox.enqueue_order_emails(self.order)
+
+        first = outbox.claim_batch(limit=2)
+        second = outbox.claim_batch()
+        third = outbox.claim_batch()
+
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertEqual(third, [])
+        self.assertFalse({entry.pk for entry in first} & {entry.pk for entry in second})
+        self.assertEqual(EmailOutbox.objects.filter(status='sending').count(), 3)
+
+    def test_rows_of_a_dead_drainer_are_claimed_again(self):
+        outbox.enqueue_order_emails(self.order)
+        claimed = outbox.claim_batch()
+        self.assertEqual(outbox.claim_batch(), [])
+
+        EmailOutbox.objects.update(available_at=timezone.now() - outbox.SENDING_TIMEOUT - timedelta(seconds=1))
+        self.assertEqual(
+            sorted(entry.pk for entry in outbox.claim_batch()),
+            sorted(entry.pk for entry in claimed),
+        )
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'SQLite has no row locks')
+class EmailOutboxConcurrencyTests(TransactionTestCase):
+    def test_drainers_skip_each_others_rows(self):
+        order = make_order(items=[(make_product(make_vendor('acme')), 1)])
+        outbox.enqueue_order_emails(order)
+        locked_id = EmailOutbox.objects.order_by('id').values_list('id', flat=True).first()
+
+        locked, release = threading.Event(), threading.Event()
+
+        def other_drainer():
+            try:
+                with transaction.atomic():
+                    list(EmailOutbox.objects.select_for_update().filter(id=locked_id))
+                    locked.set()
+                    release.wait(5)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=other_drainer)
+        thread.start()
+        try:
+            self.assertTrue(locked.wait(5))
+            claimed = outbox.claim_batch()
+        finally:
+            release.set()
+            thread.join()
+
+        self.assertEqual(len(claimed), 1)
+        self.assertNotEqual(claimed[0].id, locked_id)
+        self.assertEqual(EmailOutbox.objects.get(id=locked_id).status, 'pending')
+
+
+def checkout_event(event_id, event_type, order, session_id='cs_test_1', payment_status='paid'):
+    return {
+        'id': event_id,
+        'type': event_type,
+        'data': {'object': {
+            'id': session_id,
+            'object': 'checkout.session',
+            'payment_status': payment_status,
+            'metadata': {'order_oid': order.oid},
+        }},
+    }
+
+
+class StripeEventTests(TestCase):
+    def setUp(self):
+        self.order = make_order(items=[(make_product(make_vendor('acme')), 1)])
+
+    def open_session(self, session_id='cs_test_1'):
+        CartOrder.objects.filter(pk=self.order.pk).update(
+            stripe_sesion_id=session_id,
+            stripe_session_url=f'https://checkout.stripe.com/c/pay/{session_id}',
+            stripe_session_expires_at=timezone.now() + timedelta(hours=1),
+            stripe_session_hash='hash',
+        )
+
+    def test_duplicate_event_is_stored_once(self):
+        event = checkout_event('evt_1', 'checkout.session.completed', self.order)
+
+        self.assertTrue(payments.record_event(event))
+        self.assertFalse(payments.record_event(event))
+
+        entry = StripeEvent.objects.get()
+        self.assertEqual(entry.session_id, 'cs_test_1')
+        self.assertEqual(payments.drain_stripe_events(), (1, 0))
+        self.assertEqual(payments.drain_stripe_events(), (0, 0))
+
+    def test_completed_confirms_paid_session(self):
+        payments.record_event(checkout_event('evt_1', 'checkout.session.completed', self.order))
+        payments.drain_stripe_events()
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, 'paid')
+        self.assertEqual(StripeEvent.objects.get().status, 'processed')
+
+    def test_completed_without_payment_does_not_confirm(self):
+        payments.record_event(checkout_event(
+            'evt_1', 'checkout.session.completed', self.order, payment_status='unpaid'
+        ))
+        self.assertEqual(payments.drain_stripe_events(), (1, 0))
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, 'pending')
+        self.assertFalse(EmailOutbox.objects.exists())
+
+        # The delayed payment settling confirms it
+        payments.record_event(checkout_event('evt_2', 'checkout.session.async_payment_succeeded', self.order))
+        payments.drain_stripe_events()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, 'paid')
+
+    def test_expired_clears_only_the_matching_session(self):
+        self.open_session('cs_test_2')
+
+        # An older session of the order expiring leaves the open one alone
+        payments.record_event(checkout_event('evt_1', 'checkout.session.expired', self.order, 'cs_test_1'))
+        payments.drain_stripe_events()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.stripe_sesion_id, 'cs_test_2')
+        self.assertIsNotNone(self.order.stripe_session_url)
+
+        payments.record_event(checkout_event('evt_2', 'checkout.session.expired', self.order, 'cs_test_2'))
+        payments.drain_stripe_events()
+        self.order.refresh_from_db()
+        self.assertIsNone(self.order.stripe_sesion_id)
+        self.assertIsNone(self.order.stripe_session_url)
+        self.assertIsNone(self.order.stripe_session_expires_at)
+        self.assertIsNone(self.order.stripe_session_hash)
+
+    def test_failure_backs_off_then_gives_up(self):
+        payments.record_event(checkout_event('evt_1', 'checkout.session.completed', self.order))
+        entry = StripeEvent.objects.get()
+
+        with mock.patch('store.payments.confirm_order_paid', side_effect=RuntimeError('database went away')):
+            for attempt in range(1, payments.MAX_ATTEMPTS + 1):
+                before = timezone.now()
+                self.assertEqual(payments.drain_stripe_events(), (0, 1))
+                entry.refresh_from_db()
+                self.assertEqual(entry.attempts, attempt)
+                self.assertEqual(entry.last_error, 'database went away')
+                if attempt < payments.MAX_ATTEMPTS:
+                    self.assertEqual(entry.status, 'pending')
+                    backoff = timedelta(seconds=payments.RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+                    self.assertGreaterEqual(entry.available_at, before + backoff)
+                    self.assertEqual(payments.drain_stripe_events(), (0, 0))
+                    StripeEvent.objects.filter(pk=entry.pk).update(available_at=timezone.now())
+
+        self.assertEqual(entry.status, 'failed')
+        StripeEvent.objects.filter(pk=entry.pk).update(available_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(payments.drain_stripe_events(), (0, 0))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, 'pending')
+
+    def test_stale_processing_event_is_reclaimed(self):
+        payments.record_event(checkout_event('evt_1', 'checkout.session.completed', self.order))
+        # Claimed by a worker that died
+        StripeEvent.objects.update(status='processing', available_at=timezone.now())
+        self.assertEqual(payments.drain_stripe_events(), (0, 0))
+
+        StripeEvent.objects.update(
+            available_at=timezone.now() - payments.PROCESSING_TIMEOUT - timedelta(seconds=1)
+        )
+        self.assertEqual(payments.drain_stripe_events(), (1, 0))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, 'paid')
+
+    def test_callback_does_not_process_an_event_the_worker_claimed(self):
+        payments.record_event(checkout_event('evt_1', 'checkout.session.completed', self.order))
+        handle_event = payments.handle_event
+        callback_processed = []
+
+        def worker_handle_event(event):
+            # The browser callback arrives while the worker runs the event
+            callback_processed.append(payments.process_session_events('cs_test_1'))
+            handle_event(event)
+
+        with mock.patch('store.payments.handle_event', side_effect=worker_handle_event) as handled:
+            self.assertEqual(payments.drain_stripe_events(), (1, 0))
+
+        self.assertEqual(callback_processed, [0])
+        self.assertEqual(handled.call_count, 1)
+        self.assertEqual(StripeEvent.objects.get().attempts, 1)
+
+    def test_callback_processes_pending_events_once(self):
+        payments.record_event(checkout_event('evt_1', 'checkout.session.completed', self.order))
+
+        self.assertEqual(payments.process_session_events('cs_test_1'), 1)
+        self.assertEqual(payments.process_session_events('cs_test_1'), 0)
+        self.assertEqual(payments.drain_stripe_events(), (0, 0))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, 'paid')
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET='whsec_test')
+class StripeWebhookTests(TestCase):
+    def setUp(self):
+        self.order = make_order()
+        self.url = reverse('store:stripe_webhook')
+
+    def post(self, event, secret='whsec_test'):
+        payload = json.dumps(event)
+        timestamp = int(time.time())
+        signature = hmac.new(secret.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+        return self.client.post(
+            self.url, payload, content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=f't={timestamp},v1={signature}',
+        )
+
+    def test_stores_event_without_processing_it(self):
+        response = self.post(checkout_event('evt_1', 'checkout.session.completed', self.order))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'success': True, 'duplicate': False})
+        entry = StripeEvent.objects.get()
+        self.assertEqual((entry.event_id, entry.status), ('evt_1', 'pending'))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, 'pending')
+
+    def test_redelivery_is_acknowledged_once(self):
+        event = checkout_event('evt_1', 'checkout.session.completed', self.order)
+        self.post(event)
+        response = self.post(event)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'success': True, 'duplicate': True})
+        self.assertEqual(StripeEvent.objects.count(), 1)
+
+    def test_bad_signature_is_rejected(self):
+        response = self.post(checkout_event('evt_1', 'checkout.session.completed', self.order), secret='whsec_other')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+
+class CheckoutSessionTests(TestCase):
+    line_items = [{'price_data': {'currency': 'usd', 'unit_amount': 1000}, 'quantity': 1}]
+
+    def setUp(self):
+        self.order = make_order()
+        self.calls = []
+
+    def create_session(self, idempotency_key, expires_at):
+        self.calls.append((idempotency_key, expires_at))
+        return SimpleNamespace(
+            id=f'cs_test_{len(self.calls)}', url=f'https://checkout.stripe.com/c/pay/{len(self.calls)}',
+            expires_at=expires_at,
+        )
+
+    def test_session_is_reused_for_the_same_line_items(self):
+        first = payments.get_or_create_checkout_session(self.order, self.line_items, self.create_session)
+        order = CartOrder.objects.get(pk=self.order.pk)
+        second = payments.get_or_create_checkout_session(order, self.line_items, self.create_session)
+
+        self.assertEqual(first, ('cs_test_1', 'https://checkout.stripe.com/c/pay/1', True))
+        self.assertEqual(second, ('cs_test_1', 'https://checkout.stripe.com/c/pay/1', False))
+        self.assertEqual(len(self.calls), 1)
+
+    def test_idempotency_key_and_expiry_follow_the_window(self):
+        payments.get_or_create_checkout_session(self.order, self.line_items, self.create_session)
+
+        (key, expires_at), = self.calls
+        line_hash = payments.checkout_line_items_hash(self.line_items, self.order.email)
+        window = int(time.time()) // payments.CHECKOUT_WINDOW_SECONDS
+        self.assertEqual(key, f'{self.order.oid}:{line_hash}:{window}')
+        # Stripe wants 30 minutes to 24 hours
+        self.assertGreater(expires_at - time.time(), payments.CHECKOUT_WINDOW_SECONDS)
+        self.assertLessEqual(expires_at - time.time(), 2 * payments.CHECKOUT_WINDOW_SECONDS)
+
+    def test_session_stored_while_waiting_for_the_lock_is_reused(self):
+        # This request read the order before another one stored its session
+        stale = CartOrder.objects.get(pk=self.order.pk)
+        payments.get_or_create_checkout_session(self.order, self.line_items, self.create_session)
+
+        result = payments.get_or_create_checkout_session(stale, self.line_items, self.create_session)
+
+        self.assertEqual(result, ('cs_test_1', 'https://checkout.stripe.com/c/pay/1', False))
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(stale.stripe_sesion_id, 'cs_test_1')
+
+    def test_other_line_items_get_a_new_session(self):
+        payments.get_or_create_checkout_session(self.order, self.line_items, self.create_session)
+        line_items = [dict(self.line_items[0], quantity=2)]
+
+        result = payments.get_or_create_checkout_session(self.order, line_items, self.create_session)
+
+        self.assertEqual(result[0], 'cs_test_2')
+        self.assertNotEqual(self.calls[0][0], self.calls[1][0])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.stripe_sesion_id, 'cs_test_2')
+
+
+class ReduceStockTests(TestCase):
+    def setUp(self):
+        self.product = make_product(make_vendor('acme'), 'Shirt', stock_qty=10)
+        self.red = Color.objects.create(product=self.product, name='Red', color_code='#f00', stock_qty=4)
+        self.large = Size.objects.create(product=self.product, name='L', stock_qty=5)
+
+    def order(self, *lines, email='buyer@example.com'):
+        """Order with a (qty, color, size) item each"""
+        order = make_order(email)
+        for qty, color, size in lines:
+            CartOrderItem.objects.create(
+                order=order, product=self.product, vendor=self.product.vendor, qty=qty, color=color, size=size
+            )
+        return order
+
+    def stock(self):
+        self.product.refresh_from_db()
+        self.red.refresh_from_db()
+        self.large.refresh_from_db()
+        return self.product.stock_qty, self.red.stock_qty, self.large.stock_qty
+
+    def test_items_of_the_same_variant_are_summed(self):
+        order = self.order((1, 'Red', 'L'), (2, 'Red', 'L'), (3, 'No Color', 'No Size'))
+
+        reduced, failed = reduce_stock_for_orders([order])
+
+        self.assertEqual((reduced, failed), ([order.oid], {}))
+        self.assertEqual(self.stock(), (4, 1, 2))
+        order.refresh_from_db()
+        self.assertIsNotNone(order.stock_reduced_at)
+
+    def test_summed_items_over_the_stock_fail_the_order(self):
+        # Each line fits the 4 red shirts, both together don't
+        order = self.order((3, 'Red', ''), (2, 'Red', ''))
+
+        reduced, failed = reduce_stock_for_orders([order])
+
+        self.assertEqual(reduced, [])
+        self.assertIn('Shirt color Red', failed[order.oid])
+        self.assertEqual(self.stock(), (10, 4, 5))
+        order.refresh_from_db()
+        self.assertIsNone(order.stock_reduced_at)
+
+    def test_stock_never_goes_negative(self):
+        first = self.order((6, '', ''), email='first@example.com')
+        second = self.order((6, '', ''), email='second@example.com')
+
+        reduced, failed = reduce_stock_for_orders([first, second])
+
+        # The oldest order gets the stock
+        self.assertEqual(reduced, [first.oid])
+        self.assertEqual(list(failed), [second.oid])
+        self.assertIn('4 left, 6 needed', failed[second.oid])
+        self.assertEqual(self.stock()[0], 4)
+
+    def test_in_stock_flips_at_zero(self):
+        reduce_stock_for_orders([self.order((4, 'Red', ''))])
+        self.red.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(self.red.stock_qty, 0)
+        self.assertFalse(self.red.in_stock)
+        self.assertTrue(self.product.in_stock)
+
+        reduce_stock_for_orders([self.order((6, '', ''), email='other@example.com')])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_qty, 0)
+        self.assertFalse(self.product.in_stock)
+
+    def test_orders_are_reduced_once(self):
+        order = self.order((2, 'Red', 'L'))
+
+        reduce_stock_for_orders([order])
+        self.assertEqual(reduce_stock_for_orders([order.pk]), ([], {}))
+        self.assertEqual(self.stock(), (8, 2, 3))
+
+    def test_admin_bulk_action_reports_failed_orders(self):
+        admin = User.objects.create_superuser(email='admin@example.com', username='admin', password='pw')
+        self.client.force_login(admin)
+        fits = self.order((4, '', ''), email='fits@example.com')
+        too_big = self.order((20, '', ''), email='too-big@example.com')
+        CartOrder.objects.filter(pk__in=[fits.pk, too_big.pk]).update(payment_method='whatsapp')
+
+        response = self.client.post(
+            reverse('admin:store_cartorder_changelist'),
+            {'action': 'mark_whatsapp_orders_paid', '_selected_action': [fits.pk, too_big.pk]},
+            follow=True,
+        )
+
+        messages = [str(message) for message in response.context['messages']]
+        self.assertIn(f'⚠️ Stock not reduced for order {too_big.oid}: not enough stock for Shirt (6 left, 20 needed)', messages)
+        self.assertIn('✅ 2 WhatsApp orders marked as paid. 📦 Stock reduced for 1 orders.', messages)
+        self.assertEqual(self.stock()[0], 6)
+        self.assertEqual(
+            set(CartOrder.objects.filter(pk__in=[fits.pk, too_big.pk]).values_list('payment_status', flat=True)),
+            {'paid'},
+        )
+
+
+class PatternSetTests(SimpleTestCase):
+    patterns = PatternSet(max_length=100, sql=[r"union\s+select"], xss=[r"<script"])
+
+    def test_reports_the_category(self):
+        self.assertEqual(self.patterns.match("1 UNION SELECT password"), 'sql')
+        self.assertEqual(self.patterns.match("<script>alert(1)</script>"), 'xss')
+        self.assertIsNone(self.patterns.match("a plain comment"))
+
+    def test_over_long_values_are_not_let_through(self):
+        padded = 'a' * 100 + "<script>alert(1)</script>"
+        self.assertEqual(self.patterns.match(padded), OVERSIZED)
+        self.assertEqual(self.patterns.match('a' * 101), OVERSIZED)
+        self.assertIsNone(self.patterns.match('a' * 100))
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class BrokenCache:
+    def add(self, *args, **kwargs):
+        raise ConnectionError('cache down')
+
+    incr = get = add
+
+
+class RateLimiterTests(SimpleTestCase):
+    rules = [('login', r'^/api/v1/login/$', 3, 60), ('api', r'^/api/', 100, 3600)]
+
+    def setUp(self):
+        # Start of a window
+        self.clock = FakeClock(60 * 100_000)
+        self.limiter = RateLimiter(
+            rules=self.rules, exempt=r'^/api/v1/stripe/webhook/',
+            backend=LocMemCache(f'rate-limit-{id(self)}', {}), clock=self.clock,
+        )
+        self.login = self.limiter.rules[0]
+
+    def hits(self, count, ident='1.2.3.4'):
+        return [self.limiter.hit(self.login, ident) for _ in range(count)]
+
+    def test_limit_within_the_window(self):
+        results = self.hits(4)
+
+        self.assertEqual([result.allowed for result in results], [True, True, True, False])
+        self.assertEqual(results[-1].retry_after, 60)
+        # Clients are counted apart
+        self.assertTrue(self.hits(1, ident='5.6.7.8')[0].allowed)
+
+    def test_previous_window_is_weighted_by_its_overlap(self):
+        self.hits(3)
+
+        # A quarter into the next window three quarters of it still count
+        self.clock.now += 75
+        result, = self.hits(1)
+        self.assertFalse(result.allowed)
+        self.assertAlmostEqual(result.count, 3 * 0.75 + 1)
+        self.assertEqual(result.retry_after, 45)
+
+        # Two windows later only the new hits count
+        self.clock.now += 60
+        result, = self.hits(1)
+        self.assertTrue(result.allowed)
+        self.assertAlmostEqual(result.count, 1 * 0.75 + 1)
+
+    def test_rules_and_exempt_paths(self):
+        self.assertEqual(self.limiter.rule_for('/api/v1/login/').name, 'login')
+        self.assertEqual(self.limiter.rule_for('/api/v1/products/').name, 'api')
+        self.assertIsNone(self.limiter.rule_for('/api/v1/stripe/webhook/'))
+        self.assertIsNone(self.limiter.rule_for('/media/products/a.jpg'))
+
+        request = RequestFactory().post('/api/v1/stripe/webhook/')
+        self.assertIsNone(self.limiter.check(request))
+
+    def test_counts_in_process_when_the_cache_fails(self):
+        limiter = RateLimiter(rules=self.rules, exempt='', backend=BrokenCache(), fallback_size=2, clock=self.clock)
+        rule = limiter.rules[0]
+
+        with self.assertLogs('store.rate_limit', 'WARNING'):
+            results = [limiter.hit(rule, '1.2.3.4') for _ in range(4)]
+        self.assertEqual([result.allowed for result in results], [True, True, True, False])
+        self.assertEqual(len(limiter.fallback), 1)
+
+    def test_local_counters_evict_the_least_recently_used(self):
+        clock = FakeClock()
+        counters = LocalCounters(max_entries=2, clock=clock)
+        counters.incr('a', 60)
+        counters.incr('b', 60)
+        counters.incr('a', 60)
+        counters.incr('c', 60)
+
+        self.assertEqual(len(counters), 2)
+        self.assertEqual((counters.get('a'), counters.get('b'), counters.get('c')), (2, 0, 1))
+
+        clock.now += 60
+        self.assertEqual(counters.get('a'), 0)
+        self.assertEqual(counters.incr('a', 60), 1)
+
+
+@override_settings(RATE_LIMIT_RULES=[('login', r'^/api/v1/login/$', 2, 60)], RATE_LIMIT_EXEMPT='')
+class RateLimitMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        self.middleware = RateLimitMiddleware(lambda request: HttpResponse('ok'))
+        self.middleware.rate_limiter.backend = LocMemCache(f'rate-limit-{id(self)}', {})
+
+    def test_429_with_retry_after(self):
+        factory = RequestFactory()
+        responses = [
+            self.middleware(factory.post('/api/v1/login/', REMOTE_ADDR='1.2.3.4'))
+            for _ in range(3)
+        ]
+
+        self.assertEqual([response.status_code for response in responses], [200, 200, 429])
+        retry_after = int(responses[-1]['Retry-After'])
+        self.assertTrue(0 < retry_after <= 60)
+        # Other paths and other clients aren't limited
+        self.assertEqual(self.middleware(factory.get('/api/v1/products/', REMOTE_ADDR='1.2.3.4')).status_code, 200)
+        self.assertEqual(self.middleware(factory.post('/api/v1/login/', REMOTE_ADDR='5.6.7.8')).status_code, 200)
+
+
+class PromotionalBannerTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+        self.product = make_product(make_vendor('acme'), 'Anvil')
+        self.automation = CarouselAutomation()
+        self.enterContext(mock.patch.object(self.automation, 'get_discounted_products', return_value=[self.product]))
+        self.enterContext(mock.patch.object(self.automation, 'get_trending_products', return_value=[]))
+        self.rendered = []
+        self.enterContext(mock.patch.object(self.automation, 'submit_banner', side_effect=self.submit_banner))
+
+    def submit_banner(self, key, texts):
+        self.rendered.append(key)
+        future = Future()
+        future.set_result(b'banner ' + key.encode())
+        return future
+
+    def banner(self):
+        return Banner.objects.get(title='Oferta Especial - Anvil')
+
+    def test_unchanged_banner_keeps_its_image(self):
+        self.assertTrue(self.automation.update_promotional_banners())
+        self.assertEqual(len(self.rendered), 1)
+        self.assertEqual(self.banner().render_key, self.rendered[0])
+
+        self.automation.update_promotional_banners()
+        self.assertEqual(len(self.rendered), 1)
+
+    def test_existing_banner_is_rendered_again_when_the_offer_changes(self):
+        self.automation.update_promotional_banners()
+
+        Product.objects.filter(pk=self.product.pk).update(price=5, old_price=10)
+        self.product.refresh_from_db()
+        self.automation.update_promotional_banners()
+
+        self.assertEqual(len(self.rendered), 2)
+        self.assertNotEqual(self.rendered[0], self.rendered[1])
+        self.assertEqual(self.banner().render_key, self.rendered[1])
+
+    def test_force_renders_unchanged_banners(self):
+        self.automation.update_promotional_banners()
+        self.automation.update_promotional_banners(force=True)
+
+        self.assertEqual(self.rendered, [self.rendered[0]] * 2)
+
+
+class SchedulerTests(TransactionTestCase):
+    """Jobs run on the schedulers' threads, which only see committed rows"""
+
+    def setUp(self):
+        self.calls = []
+        self.release_job = threading.Event()
+
+    def job(self):
+        self.calls.append(threading.current_thread().name)
+        self.assertTrue(self.release_job.wait(5))
+        return {'success': True}
+
+    def scheduler(self, owner, interval=60, jitter=0):
+        scheduler = Scheduler(jobs={'job': (self.job, interval)}, owner=owner, jitter=jitter)
+        self.addCleanup(scheduler.executor.shutdown)
+        scheduler.register()
+        return scheduler
+
+    def test_job_runs_on_one_scheduler(self):
+        first, second = self.scheduler('first'), self.scheduler('second')
+
+        self.assertEqual(first.run_pending(), ['job'])
+        # Leased by the first one while it runs
+        self.assertEqual(second.run_pending(), [])
+        self.assertEqual(second.run_pending(force=True), [])
+        self.assertEqual(ScheduledJob.objects.get().locked_by, 'first')
+
+        self.release_job.set()
+        first.wait()
+        # Done, and not due again before its interval
+        self.assertEqual(second.run_pending(), [])
+
+        job = ScheduledJob.objects.get()
+        self.assertEqual((job.runs, job.last_status, job.locked_by, job.locked_until), (1, 'ok', '', None))
+        self.assertEqual(len(self.calls), 1)
+
+    def test_lapsed_lease_is_taken_over(self):
+        self.release_job.set()
+        dead, alive = self.scheduler('dead'), self.scheduler('alive')
+        now = timezone.now()
+        ScheduledJob.objects.update(locked_by='dead', locked_until=now + timedelta(seconds=30))
+        self.assertEqual(alive.run_pending(), [])
+
+        ScheduledJob.objects.update(locked_until=now - timedelta(seconds=1))
+        self.assertEqual(alive.run_pending(), ['job'])
+        alive.wait()
+        self.assertEqual(ScheduledJob.objects.get().runs, 1)
+
+        # The scheduler that lost the lease can't release the job any more
+        next_run_at = ScheduledJob.objects.get().next_run_at
+        with self.assertLogs('store.scheduler', 'WARNING'):
+            dead.release('job', 60, 'ok', None)
+        job = ScheduledJob.objects.get()
+        self.assertEqual((job.runs, job.next_run_at), (1, next_run_at))
+
+    def test_next_run_is_interval_plus_jitter_after_the_run(self):
+        self.release_job.set()
+        scheduler = self.scheduler('only', interval=100, jitter=0.2)
+
+        with mock.patch('store.scheduler.random.uniform', return_value=0.2) as uniform:
+            scheduler.run_pending()
+            scheduler.wait()
+
+        uniform.assert_called_once_with(0, 0.2)
+        job = ScheduledJob.objects.get()
+        self.assertEqual(job.next_run_at - job.last_finished_at, timedelta(seconds=120))
+        self.assertLessEqual(job.last_started_at, job.last_finished_at)
+
+    @override_settings(SCHEDULER_INTERVALS={})
+    def test_run_scheduler_once(self):
+        out = io.StringIO()
+        call_command('run_scheduler', '--job', 'drain_outbox', '--once', '--now', stdout=out)
+        self.assertIn('drain_outbox: ok', out.getvalue())
+        self.assertIn('Ran 1 jobs', out.getvalue())
+
+        # Without --now only due jobs run
+        out = io.StringIO()
+        call_command('run_scheduler', '--job', 'drain_outbox', '--once', stdout=out)
+        self.assertIn('Ran 0 jobs', out.getvalue())
+
+        job = ScheduledJob.objects.get(name='drain_outbox')
+        self.assertEqual((job.runs, job.last_status, job.locked_by), (1, 'ok', ''))
@@ -12,6 +12,7 @@ urlpatterns = [
     path('admin/dashboard-stats/', views.dashboard_stats, name='dashboard_stats'),
     path('admin/performance-metrics/', views.performance_metrics, name='performance_metrics'),
     path('whatsapp-checkout/', views.whatsapp_checkout, name='whatsapp_checkout'),
+    path('stripe/webhook/', views.stripe_webhook, name='stripe_webhook'),
     path('admin/', include('store.admin_urls')),  # Include admin URLs for sales analytics
     path('test-media/', views.test_media, name='test_media'),  # Test media serving
     path('media/<path:file_path>', views.serve_media_file, name='serve_media_file'),  # Custom media serving
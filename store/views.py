@@ -1,16 +1,18 @@
 from django.shortcuts import render, redirect
 from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
 from django.db import transaction
 from decimal import Decimal
+import logging
 import stripe
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
+from store.payment_gateway import configure_stripe
+
+# API key, pooled HTTP client, timeouts, retries and circuit breaker
+configure_stripe()
 
 # Admin imports
 from django.contrib.admin.views.decorators import staff_member_required
-from django.http import JsonResponse, FileResponse, Http404, HttpResponse
+from django.http import JsonResponse, Http404, HttpResponse
 from django.db.models import Count, Sum, Avg
 from django.utils import timezone
 from datetime import datetime, timedelta
@@ -21,6 +23,11 @@ from store.models import (
     Coupon, Product, Tax, Category, Review, Cart, Size, Color, 
     CartOrder, CartOrderItem, Notification, OffersCarousel, Banner, CarouselImage
 )
+from store.media_serving import serve_media
+from store.payments import (
+    confirm_order_paid, get_or_create_checkout_session,
+    process_session_events, record_event
+)
 
 # Serializers
 from store.serializers import (
@@ -34,15 +41,8 @@ from store.serializers import (
 from rest_framework.response import Response
 from rest_framework import generics, status
 from rest_framework.permissions import AllowAny
-from rest_framework.decorators import api_view
-
-def send_notification(user=None, vendor=None, order=None, order_item=None):
-    Notification.objects.create(
-        user=user,
-        vendor=vendor,
-        order=order,
-        order_item=order_item,
-    )
+
+logger = logging.getLogger(__name__)
 
 class CategoryListAPIView(generics.ListAPIView):
     queryset = Category.objects.all()
@@ -53,12 +53,24 @@ class ProductListAPIView(generics.ListAPIView):
     serializer_class = ProductSerializer
     permission_classes = [AllowAny]
     
+    # ?ordering=<key> or -<key>; only orderings backed by an index
+    ORDERINGS = {
+        'discount': 'discount_percent',
+    }
+
     def get_queryset(self):
         # Only return published products that are in stock
-        return Product.objects.filter(
+        queryset = Product.objects.filter(
             status='published',
             in_stock=True
         ).select_related('category', 'vendor').prefetch_related('colors', 'sizes')
+
+        ordering = self.request.query_params.get('ordering', '')
+        field = self.ORDERINGS.get(ordering.lstrip('-'))
+        if field:
+            prefix = '-' if ordering.startswith('-') else ''
+            queryset = queryset.order_by(f'{prefix}{field}', f'{prefix}id')
+        return queryset
     
 class ProductDetailAPIView(generics.RetrieveAPIView):
     queryset = Product.objects.all()
@@ -820,22 +832,15 @@ class StripeCheckoutView(generics.CreateAPIView):
         order_oid = self.kwargs['order_oid']
         
         try:
-            # Debug: Print Stripe configuration status
-            print(f"DEBUG: Stripe Secret Key exists: {bool(settings.STRIPE_SECRET_KEY)}")
-            print(f"DEBUG: Stripe Secret Key length: {len(settings.STRIPE_SECRET_KEY) if settings.STRIPE_SECRET_KEY else 0}")
-            
             # Check if Stripe is configured
             if not settings.STRIPE_SECRET_KEY:
                 return Response(
                     {"error": "Stripe is not configured. Please set STRIPE_SECRET_KEY."},
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
                 )
-            
-            # Debug: Print order lookup info
-            print(f"DEBUG: Looking for order with OID: {order_oid}")
-            
+
             order = CartOrder.objects.select_related('buyer').get(oid=order_oid)
-            print(f"DEBUG: Order found - ID: {order.id}, Status: {order.payment_status}")
+            logger.debug(f"Checkout for order {order.oid} ({order.payment_status})")
             
             # Early return if already paid
             if order.payment_status == 'paid':
@@ -845,9 +850,7 @@ class StripeCheckoutView(generics.CreateAPIView):
                 )
 
             # Get order items and validate
-            print(f"DEBUG: Getting order items for order {order.id}")
             order_items = order.orderitem.all()
-            print(f"DEBUG: Found {order_items.count()} order items")
             
             if not order_items.exists():
                 return Response(
@@ -856,10 +859,6 @@ class StripeCheckoutView(generics.CreateAPIView):
                 )
             
             # Validate required order fields
-            print(f"DEBUG: Order phone: '{order.phone}'")
-            print(f"DEBUG: Order email: '{order.email}'")
-            print(f"DEBUG: Order full_name: '{order.full_name}'")
-            
             if not order.phone or order.phone.strip() == '':
                 return Response(
                     {"error": "Phone number is required for checkout"},
@@ -873,11 +872,8 @@ class StripeCheckoutView(generics.CreateAPIView):
                 )
 
             # Create line items from order items
-            print(f"DEBUG: Creating line items from {order_items.count()} order items")
             line_items = []
             for item in order_items:
-                print(f"DEBUG: Processing order item {item.id} - Product: {item.product.title if item.product else 'None'}, Price: {item.price}, Qty: {item.qty}")
-                
                 if not item.product:
                     return Response(
                         {"error": f"Order item {item.id} has no associated product"},
@@ -894,8 +890,6 @@ class StripeCheckoutView(generics.CreateAPIView):
                     },
                     'quantity': item.qty,
                 })
-            
-            print(f"DEBUG: Created {len(line_items)} line items")
 
             # Validate line items
             if not line_items:
@@ -904,13 +898,8 @@ class StripeCheckoutView(generics.CreateAPIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            print(f"DEBUG: About to create Stripe checkout session")
-            print(f"DEBUG: Line items: {line_items}")
-            print(f"DEBUG: Customer email: {order.email}")
-            print(f"DEBUG: Success URL: {settings.FRONTEND_URL}/payment-success/{order.oid}/")
-            
-            try:
-                checkout_session = stripe.checkout.Session.create(
+            def create_session(idempotency_key, expires_at):
+                return stripe.checkout.Session.create(
                     customer_email=order.email,
                     payment_method_types=['card'],
                     line_items=line_items,
@@ -924,28 +913,20 @@ class StripeCheckoutView(generics.CreateAPIView):
                         'order_oid': order.oid,
                         'buyer_id': str(order.buyer.id) if order.buyer else ''
                     },
-                    expires_at=int((timezone.now() + timezone.timedelta(hours=1)).timestamp())
+                    expires_at=expires_at,
+                    idempotency_key=idempotency_key,
                 )
-                print(f"DEBUG: Stripe checkout session created successfully: {checkout_session.id}")
-            except stripe.error.StripeError as stripe_error:
-                print(f"DEBUG: Stripe API error: {stripe_error}")
-                print(f"DEBUG: Stripe error type: {type(stripe_error)}")
-                raise stripe_error
-            except Exception as other_error:
-                print(f"DEBUG: Other error during Stripe session creation: {other_error}")
-                print(f"DEBUG: Error type: {type(other_error)}")
-                print(f"DEBUG: Error traceback:")
-                import traceback
-                traceback.print_exc()
-                raise other_error
-
-            # Update order with session info
-            order.stripe_sesion_id = checkout_session.id  # Note: field name has typo in model
-            order.save(update_fields=['stripe_sesion_id'])
+
+            # Reuses the order's open session for the same line items; the
+            # session info is saved on the order (note: field name has typo in model)
+            session_id, session_url, created = get_or_create_checkout_session(
+                order, line_items, create_session
+            )
+            logger.debug(f"Checkout session {session_id} {'created' if created else 'reused'}")
 
             return Response({
-                'url': checkout_session.url,
-                'session_id': checkout_session.id
+                'url': session_url,
+                'session_id': session_id
             })
 
         except CartOrder.DoesNotExist:
@@ -969,7 +950,12 @@ class StripeCheckoutView(generics.CreateAPIView):
 
 class PaymentSuccessView(generics.CreateAPIView):
     """
-    Handles payment verification and post-payment processing
+    Reports the payment result to the browser after the Stripe redirect.
+
+    Payments are confirmed by the Stripe webhook, so this only reads local
+    state: events of the session that are still queued are applied right
+    away, and no Stripe API call is made unless STRIPE_VERIFY_ON_CALLBACK
+    is enabled (for deployments without a configured webhook).
     """
     serializer_class = CartOrderSerializer
     permission_classes = [AllowAny]
@@ -987,29 +973,24 @@ class PaymentSuccessView(generics.CreateAPIView):
             )
 
         try:
-            # Fetch order with related data in single query
-            order = CartOrder.objects.select_related('buyer').prefetch_related(
-                'orderitem', 'orderitem__vendor', 'orderitem__product'
-            ).get(oid=order_oid)
+            order = CartOrder.objects.select_related('buyer').get(oid=order_oid)
 
-            # Retrieve Stripe session
-            session = stripe.checkout.Session.retrieve(session_id)
+            if order.payment_status != "paid":
+                # The webhook may have arrived before the worker processed it
+                if process_session_events(session_id):
+                    order.refresh_from_db()
 
-            # Validate session matches order
-            if session.metadata.get('order_oid') != order_oid:
-                return Response(
-                    {"message": "Session does not match order"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+            if order.payment_status == "paid":
+                return Response({"message": "Payment successful"})
 
-            # Handle payment status
-            if session.payment_status == "paid":
-                return self._handle_successful_payment(order, session)
-            else:
-                return Response(
-                    {"message": f"Payment status: {session.payment_status}"},
-                    status=status.HTTP_402_PAYMENT_REQUIRED
-                )
+            if settings.STRIPE_VERIFY_ON_CALLBACK:
+                return self._verify_with_stripe(order, session_id)
+
+            # Not confirmed yet, the frontend polls again
+            return Response(
+                {"message": "Payment processing"},
+                status=status.HTTP_202_ACCEPTED
+            )
 
         except CartOrder.DoesNotExist:
             return Response(
@@ -1027,70 +1008,25 @@ class PaymentSuccessView(generics.CreateAPIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-    def _handle_successful_payment(self, order, session):
-        """Handle all post-payment success logic"""
-        if order.payment_status != "paid":
-            # Update order status
-            order.payment_status = "paid"
-            # Note: paid_at field doesn't exist in model, using date field instead
-            order.save()
-
-            # Process notifications
-            self._process_notifications(order)
+    def _verify_with_stripe(self, order, session_id):
+        """Fallback for deployments without webhooks: ask Stripe directly"""
+        session = stripe.checkout.Session.retrieve(session_id)
 
-            return Response({"message": "Payment successful"})
-        
-        return Response({"message": "Order already paid"})
-
-    def _process_notifications(self, order):
-        """Send all post-payment notifications"""
-        if order.buyer:
-            # Buyer notification
-            send_notification(user=order.buyer, order=order)
-            self._send_email(
-                user=order.buyer,
-                order=order,
-                subject="Order Placed Successfully",
-                templates=(
-                    "email/customer_order_confirmation.txt",
-                    "email/customer_order_confirmation.html"
-                )
+        # Validate session matches order
+        if session.metadata.get('order_oid') != order.oid:
+            return Response(
+                {"message": "Session does not match order"},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Vendor notifications
-        for item in order.orderitem.all():
-            if item.vendor:
-                send_notification(vendor=item.vendor, order=order, order_item=item)
-                self._send_email(
-                    user=item.vendor.user,
-                    order=order,
-                    order_item=item,
-                    subject="New Sale!",
-                    templates=(
-                        "email/vendor_sale.txt",
-                        "email/vendor_sale.html"
-                    )
-                )
+        if session.payment_status == "paid":
+            confirm_order_paid(order)
+            return Response({"message": "Payment successful"})
 
-    def _send_email(self, user, order, order_item=None, subject="", templates=()):
-        """Helper method to send templated emails"""
-        context = {
-            'order': order,
-            'order_item': order_item,
-            'user': user
-        }
-        
-        text_body = render_to_string(templates[0], context)
-        html_body = render_to_string(templates[1], context)
-
-        msg = EmailMultiAlternatives(
-            subject=subject,
-            from_email=settings.FROM_EMAIL,
-            to=[user.email],
-            body=text_body
+        return Response(
+            {"message": f"Payment status: {session.payment_status}"},
+            status=status.HTTP_402_PAYMENT_REQUIRED
         )
-        msg.attach_alternative(html_body, "text/html")
-        msg.send()
 
 class ReviewListAPIView(generics.ListAPIView):
     serializer_class = ReviewSerializer
@@ -1179,9 +1115,10 @@ from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 import json
-from django.db.models import Count, Sum, Avg
+from django.db.models import Count, Sum, Avg, Q
 from datetime import datetime, timedelta
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 @method_decorator(staff_member_required, name='dispatch')
 class LiveOrdersFeedView(generics.ListAPIView):
@@ -1216,9 +1153,62 @@ class LiveOrdersFeedView(generics.ListAPIView):
         
         return Response(context)
 
+LIVE_FEED_LIMIT = 50
+
+LIVE_FEED_STATUS_COLORS = {
+    'pending': '#ffc107',
+    'confirmed': '#17a2b8',
+    'paid': '#28a745',
+    'cancelled': '#dc3545',
+    'expired': '#6c757d'
+}
+
+
+def parse_feed_cursor(value):
+    """
+    Parse a live feed cursor of the form ``<iso timestamp>`` or
+    ``<iso timestamp>,<order id>``. Returns ``(timestamp, id)`` or None.
+    """
+    if not value:
+        return None
+
+    # A literal '+' in the UTC offset arrives as a space when not URL-encoded
+    value = value.strip().replace(' ', '+')
+    timestamp, _, order_id = value.partition(',')
+
+    since = parse_datetime(timestamp)
+    if since is None:
+        return None
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+
+    try:
+        since_id = int(order_id) if order_id else 0
+    except ValueError:
+        return None
+
+    return since, since_id
+
+
+def make_feed_cursor(order):
+    """Cursor pointing just past ``order`` in (updated_at, id) order"""
+    return f"{order.updated_at.isoformat()},{order.id}"
+
+
 @staff_member_required
-def live_orders_feed(request):
-    """Simple view for live orders feed - returns JSON for AJAX updates"""
+async def live_orders_feed(request):
+    """
+    Simple view for live orders feed - returns JSON for AJAX updates
+
+    Without ``since`` the most recent orders of the period are returned.
+    With ``since`` (the ``cursor`` of a previous response) only orders created
+    or changed after that point are returned, oldest change first, so a poll
+    that finds nothing new sends no rows. Every poll also counts the orders
+    of the period for the counters; a poll without ``since`` reads the
+    cursor with one more query.
+
+    Async so polling dashboards don't hold a worker thread under ASGI.
+    """
     try:
         # Get time period filter
         time_period = request.GET.get('time_period', 'day')
@@ -1231,12 +1221,43 @@ def live_orders_feed(request):
             cutoff_time = now - timedelta(days=30)
         else:  # default to day
             cutoff_time = now - timedelta(hours=24)
-        
+
+        since_param = request.GET.get('since')
+        cursor = parse_feed_cursor(since_param)
+        if since_param and cursor is None:
+            return JsonResponse({
+                'success': False,
+                'error': 'Invalid since cursor'
+            }, status=400)
+
+        window = CartOrder.objects.filter(date__gte=cutoff_time)
+        feed_fields = (
+            'id', 'oid', 'full_name', 'total', 'payment_status', 'order_status',
+            'payment_method', 'date', 'updated_at'
+        )
+
         # Get recent orders with error handling
         try:
-            recent_orders = CartOrder.objects.filter(
-                date__gte=cutoff_time
-            ).order_by('-date')[:50]
+            if not cursor:
+                # Read before the list: a change committed in between is then
+                # both listed and after the cursor (sent again, never lost)
+                newest = await window.only('id', 'updated_at').order_by('-updated_at', '-id').afirst()
+            if cursor:
+                since, since_id = cursor
+                recent_orders = [order async for order in window.filter(
+                    Q(updated_at__gt=since) | Q(updated_at=since, id__gt=since_id)
+                ).only(*feed_fields).order_by('updated_at', 'id')[:LIVE_FEED_LIMIT]]
+            else:
+                recent_orders = [
+                    order async for order in window.only(*feed_fields).order_by('-date')[:LIVE_FEED_LIMIT]
+                ]
+
+            counters = await window.aaggregate(
+                total_orders=Count('id'),
+                whatsapp_orders=Count('id', filter=Q(payment_method='whatsapp')),
+                pending_orders=Count('id', filter=Q(payment_status='pending')),
+                paid_orders=Count('id', filter=Q(payment_status='paid')),
+            )
         except Exception as db_error:
             return JsonResponse({
                 'success': False,
@@ -1263,26 +1284,31 @@ def live_orders_feed(request):
                     'order_status': order_status,
                     'payment_method': payment_method,
                     'date': date_str,
+                    'updated_at': order.updated_at.isoformat(),
                     'is_whatsapp': payment_method == 'whatsapp',
-                    'status_color': {
-                        'pending': '#ffc107',
-                        'confirmed': '#17a2b8', 
-                        'paid': '#28a745',
-                        'cancelled': '#dc3545',
-                        'expired': '#6c757d'
-                    }.get(payment_status, '#6c757d')
+                    'status_color': LIVE_FEED_STATUS_COLORS.get(payment_status, '#6c757d')
                 })
             except Exception as order_error:
                 # Log the problematic order but continue with others
                 print(f"Error processing order {order.id}: {str(order_error)}")
                 continue
+
+        # Next cursor: the newest change we have handed out
+        if cursor:
+            next_cursor = make_feed_cursor(recent_orders[-1]) if recent_orders else since_param
+        else:
+            next_cursor = make_feed_cursor(newest) if newest else f"{now.isoformat()},0"
         
         context = {
             'success': True,
             'orders': orders_data,
-            'total_orders': len(orders_data),
-            'whatsapp_orders': len([o for o in orders_data if o.get('is_whatsapp', False)]),
-            'last_updated': timezone.now().isoformat(),
+            'total_orders': counters['total_orders'],
+            'whatsapp_orders': counters['whatsapp_orders'],
+            'pending_orders': counters['pending_orders'],
+            'paid_orders': counters['paid_orders'],
+            'cursor': next_cursor,
+            'has_more': bool(cursor) and len(recent_orders) == LIVE_FEED_LIMIT,
+            'last_updated': now.isoformat(),
         }
         
         return JsonResponse(context)
@@ -1800,41 +1826,52 @@ def whatsapp_checkout(request):
             'error': str(e)
         }, status=500)
 
+@csrf_exempt
+@require_http_methods(['POST'])
+def stripe_webhook(request):
+    """
+    Stripe webhook endpoint. Verifies the signature and stores the event for
+    the worker (process_stripe_events); redelivered events are acknowledged
+    without being stored twice.
+    """
+    payload = request.body
+    sig_header = request.META.get('HTTP_STRIPE_SIGNATURE', '')
+
+    try:
+        stripe.Webhook.construct_event(payload, sig_header, settings.STRIPE_WEBHOOK_SECRET)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid payload'}, status=400)
+    except stripe.error.SignatureVerificationError:
+        return JsonResponse({'success': False, 'error': 'Invalid signature'}, status=400)
+
+    # Store the plain JSON body rather than the StripeObject
+    event = json.loads(payload)
+    created = record_event(event)
+
+    return JsonResponse({'success': True, 'duplicate': not created})
+
 from django.views.decorators.http import require_http_methods
-import os
 
-@require_http_methods(['GET', 'OPTIONS'])
+@require_http_methods(['GET', 'HEAD', 'OPTIONS'])
 def serve_media_file(request, file_path):
-    """Simple media file serving view with CORS support"""
+    """
+    Media file serving view with CORS support.
+
+    Conditional and Range requests, cache headers and the optional
+    X-Accel-Redirect / X-Sendfile offload are handled by store.media_serving.
+    """
     # Handle OPTIONS request for CORS preflight
     if request.method == 'OPTIONS':
         response = HttpResponse()
-        response["Access-Control-Allow-Origin"] = "*"
-        response["Access-Control-Allow-Methods"] = "GET, OPTIONS"
-        response["Access-Control-Allow-Headers"] = "Content-Type"
-        return response
+    else:
+        response = serve_media(request, file_path)
     
-    try:
-        media_root = settings.MEDIA_ROOT
-        full_path = os.path.join(media_root, file_path)
-        
-        if os.path.exists(full_path) and os.path.isfile(full_path):
-            response = FileResponse(open(full_path, 'rb'))
-            
-            # Add CORS headers to allow cross-origin requests
-            response["Access-Control-Allow-Origin"] = "*"
-            response["Access-Control-Allow-Methods"] = "GET, OPTIONS"
-            response["Access-Control-Allow-Headers"] = "Content-Type"
-            
-            # Set proper content type for images
-            if file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')):
-                response["Content-Type"] = "image/" + file_path.split('.')[-1].lower()
-            
-            return response
-        else:
-            raise Http404(f"File not found: {file_path}")
-    except Exception as e:
-        raise Http404(f"Error serving file: {str(e)}")
+    # Add CORS headers to allow cross-origin requests
+    response["Access-Control-Allow-Origin"] = "*"
+    response["Access-Control-Allow-Methods"] = "GET, HEAD, OPTIONS"
+    response["Access-Control-Allow-Headers"] = "Content-Type, Range, If-None-Match, If-Modified-Since"
+    response["Access-Control-Expose-Headers"] = "Content-Range, Content-Length, ETag, Accept-Ranges"
+    return response
 
 def test_media(request):
     """Test view to debug media file serving"""
@@ -1854,7 +1891,7 @@ def test_media(request):
     return HttpResponse("Test view working")
 
 # Simple health check that doesn't depend on external packages
-def simple_health_check(request):
+async def simple_health_check(request):
     """
     Simple health check endpoint for Railway monitoring
     Returns 200 OK if the application is running
@@ -1867,13 +1904,13 @@ def simple_health_check(request):
         status=200
     )
 
-@api_view(['GET'])
-def health_check(request):
+@require_http_methods(['GET'])
+async def health_check(request):
     """
     Health check endpoint for Railway monitoring
     Returns 200 OK if the application is running
     """
-    return Response(
+    return JsonResponse(
         {
             'status': 'healthy',
             'message': 'SuperParaguai E-commerce API is running',